@@ -1,4 +1,7 @@
 import os
+import json
+import atexit
+import tempfile
 from flask import Flask, send_from_directory, render_template
 
 
@@ -8,10 +11,191 @@ def create_app(config=None):
 
     # simple config defaults
     app.config.setdefault("TOPICS_DIR", None)
+    # file backend: optional sidecar file persisting the topics index, and how
+    # often (seconds) files are re-stat'ed to notice in-place edits
+    app.config.setdefault("TOPICS_INDEX_PATH", os.environ.get("TOPICS_INDEX_PATH"))
+    app.config.setdefault("TOPICS_RESCAN_INTERVAL", 30)
+    # file backend: on-disk n-gram search index (keep it outside TOPICS_DIR)
+    app.config.setdefault("TOPICS_SEARCH_INDEX", os.environ.get("TOPICS_SEARCH_INDEX"))
     # prefer an explicit TOPICS_DB env var, otherwise default to data/data.db
     app.config.setdefault("TOPICS_DB", os.environ.get("TOPICS_DB", "data/data.db"))
+    # sqlite connection pool for the topics DB
+    app.config.setdefault(
+        "TOPICS_DB_POOL_SIZE", int(os.environ.get("TOPICS_DB_POOL_SIZE", 8))
+    )
+    app.config.setdefault(
+        "TOPICS_DB_POOL_TIMEOUT", float(os.environ.get("TOPICS_DB_POOL_TIMEOUT", 10))
+    )
+    # extra/overriding pragmas, e.g. {"synchronous": "FULL", "mmap_size": 0}
+    app.config.setdefault("TOPICS_DB_PRAGMAS", {})
+    # omikuji draws: "random" (independent) or "deck" (no repeats per session/room)
+    app.config.setdefault(
+        "OMIKUJI_DRAW_MODE", os.environ.get("OMIKUJI_DRAW_MODE", "random")
+    )
+    # upper bound on concurrently tracked decks (least recently used are dropped)
+    app.config.setdefault("OMIKUJI_MAX_DECKS", 10_000)
+    # SQLite file for state shared by the worker processes (omikuji decks,
+    # rate limit buckets); "" keeps it per process
+    app.config.setdefault("STATE_DB", os.environ.get("STATE_DB", "data/state.db"))
+    # pre-drawn results (with rendered HTML) kept ready for /omikuji/draw;
+    # refilled in the background, 0 disables
+    app.config.setdefault(
+        "OMIKUJI_POOL_SIZE", int(os.environ.get("OMIKUJI_POOL_SIZE", 256))
+    )
+    # size limit of the rendered topic HTML cache
+    app.config.setdefault(
+        "RENDER_CACHE_MAX_BYTES",
+        int(os.environ.get("RENDER_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    )
+    # rows per transaction when refreshing stale stored HTML in the background
+    app.config.setdefault("RERENDER_BATCH_SIZE", 500)
+    # page size of GET /topics?cursor=&limit= (default and upper bound)
+    app.config.setdefault("TOPICS_PAGE_SIZE", 50)
+    app.config.setdefault("TOPICS_PAGE_SIZE_MAX", 200)
+    # Cache-Control sent with ETag/Last-Modified validated pages; pages embed
+    # the logged-in user, so they are private and revalidated by default
+    app.config.setdefault("CACHE_CONTROL_TOPIC", "private, no-cache")
+    app.config.setdefault("CACHE_CONTROL_LIST", "private, no-cache")
+    app.config.setdefault("CACHE_CONTROL_OMIKUJI", "private, no-cache")
+    # apply schema_sqlite.sql once at startup
+    app.config.setdefault("TOPICS_ENSURE_SCHEMA", True)
     # user DB and password manager for auth
     app.config.setdefault("USERS_DB", os.environ.get("USERS_DB", "data/users.db"))
+    # cached user records (per process); other processes' changes show up
+    # after at most USER_CACHE_TTL seconds
+    app.config.setdefault(
+        "USER_CACHE_SIZE", int(os.environ.get("USER_CACHE_SIZE", 1024))
+    )
+    app.config.setdefault("USER_CACHE_TTL", float(os.environ.get("USER_CACHE_TTL", 30)))
+    # scheme and cost of new password hashes ("pbkdf2_sha256" or "scrypt");
+    # older hashes are upgraded at login. tools/calibrate_password_hash.py
+    # suggests values for this host
+    app.config.setdefault(
+        "PASSWORD_HASH_SCHEME", os.environ.get("PASSWORD_HASH_SCHEME", "pbkdf2_sha256")
+    )
+    app.config.setdefault(
+        "PASSWORD_PBKDF2_ITERATIONS",
+        int(os.environ.get("PASSWORD_PBKDF2_ITERATIONS", 200_000)),
+    )
+    app.config.setdefault(
+        "PASSWORD_SCRYPT_N", int(os.environ.get("PASSWORD_SCRYPT_N", 2**14))
+    )
+    # concurrent password hashes per process, and how many more may queue
+    # before logins are refused with 503
+    app.config.setdefault(
+        "PASSWORD_HASH_WORKERS", int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+    )
+    app.config.setdefault(
+        "PASSWORD_HASH_MAX_PENDING",
+        int(os.environ.get("PASSWORD_HASH_MAX_PENDING", 32)),
+    )
+    # per-client token buckets ("METHOD blueprint.endpoint" -> "N/period"),
+    # applied per IP and per logged-in user; {} disables rate limiting
+    app.config.setdefault(
+        "RATE_LIMITS",
+        json.loads(os.environ["RATE_LIMITS"])
+        if os.environ.get("RATE_LIMITS")
+        else {
+            "POST auth.login": "10/minute",
+            "POST auth.register": "5/minute",
+            "POST topics.preview_topic": "30/minute",
+            "GET topics.search_topics": "60/minute",
+        },
+    )
+    app.config.setdefault(
+        "RATE_LIMIT_MAX_KEYS", int(os.environ.get("RATE_LIMIT_MAX_KEYS", 10_000))
+    )
+    # CPU-heavy routes may only run ADMISSION_MAX_HEAVY at a time (more get
+    # 503) so they cannot starve cheap pages; ADMISSION_MAX_IN_FLIGHT (0: off)
+    # caps all concurrent requests of a process
+    app.config.setdefault(
+        "ADMISSION_HEAVY_ROUTES",
+        [
+            "POST auth.login",
+            "POST auth.register",
+            "POST topics.preview_topic",
+            "GET topics.search_topics",
+            "POST topics.create_topics_bulk",
+        ],
+    )
+    app.config.setdefault(
+        "ADMISSION_MAX_HEAVY", int(os.environ.get("ADMISSION_MAX_HEAVY", 4))
+    )
+    app.config.setdefault(
+        "ADMISSION_MAX_IN_FLIGHT", int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", 0))
+    )
+    # worker processes serving this app (app.serve sets it): the admission
+    # caps above are split between them
+    app.config.setdefault("WEB_WORKERS", 1)
+    # largest Markdown body accepted by POST /topics/preview (bytes)
+    app.config.setdefault(
+        "PREVIEW_MAX_BYTES", int(os.environ.get("PREVIEW_MAX_BYTES", 64 * 1024))
+    )
+    # output of tools/build_assets.py (hashed, precompressed static files);
+    # without a build, templates link the plain /static/ files
+    app.config.setdefault(
+        "ASSETS_DIR",
+        os.environ.get("ASSETS_DIR", os.path.join(app.root_path, "static", "dist")),
+    )
+    # on-the-fly gzip/brotli compression of HTML/JSON/text responses
+    app.config.setdefault(
+        "COMPRESSION_ENABLED", os.environ.get("COMPRESSION_ENABLED", "1") != "0"
+    )
+    app.config.setdefault(
+        "COMPRESSION_MIN_SIZE", int(os.environ.get("COMPRESSION_MIN_SIZE", 500))
+    )
+    # zlib level 1-9 and brotli quality 0-11: CPU per response vs. bytes saved
+    app.config.setdefault(
+        "COMPRESSION_LEVEL", int(os.environ.get("COMPRESSION_LEVEL", 6))
+    )
+    app.config.setdefault(
+        "COMPRESSION_BROTLI_QUALITY",
+        int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 4)),
+    )
+    # None: the defaults in utils/compression.py
+    app.config.setdefault("COMPRESSION_MIMETYPES", None)
+    # if set, /metrics requires "Authorization: Bearer <token>"
+    app.config.setdefault("METRICS_TOKEN", os.environ.get("METRICS_TOKEN"))
+    # latency histograms and stats on GET /metrics (Prometheus text format);
+    # they reveal routes, latencies and pool sizes, so the endpoint is only
+    # on by default when it is protected by METRICS_TOKEN
+    app.config.setdefault(
+        "METRICS_ENABLED",
+        os.environ.get(
+            "METRICS_ENABLED", "1" if app.config.get("METRICS_TOKEN") else "0"
+        )
+        != "0",
+    )
+    # shared by the worker processes of one server (app.serve sets one up);
+    # unset: this process only
+    app.config.setdefault("METRICS_DIR", os.environ.get("METRICS_DIR"))
+    # request profiling (both 0: off). A PROFILE_SAMPLE_RATE fraction of
+    # requests runs under cProfile; requests slower than PROFILE_SLOW_MS are
+    # kept as stack samples taken every PROFILE_INTERVAL_MS
+    app.config.setdefault(
+        "PROFILE_SAMPLE_RATE", float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+    )
+    app.config.setdefault(
+        "PROFILE_SLOW_MS", float(os.environ.get("PROFILE_SLOW_MS", 0))
+    )
+    app.config.setdefault(
+        "PROFILE_INTERVAL_MS", float(os.environ.get("PROFILE_INTERVAL_MS", 5))
+    )
+    # endpoints to profile, e.g. "topics.get_topic,auth.login" (empty: all)
+    app.config.setdefault(
+        "PROFILE_ENDPOINTS",
+        [e for e in os.environ.get("PROFILE_ENDPOINTS", "").split(",") if e.strip()],
+    )
+    # profiles are kept here; the oldest beyond PROFILE_MAX_FILES are removed
+    app.config.setdefault(
+        "PROFILE_DIR",
+        os.environ.get(
+            "PROFILE_DIR", os.path.join(tempfile.gettempdir(), "omikuji-profiles")
+        ),
+    )
+    app.config.setdefault(
+        "PROFILE_MAX_FILES", int(os.environ.get("PROFILE_MAX_FILES", 200))
+    )
     app.config.setdefault("SECRET_KEY", "dev")
     # ensure the Flask app.secret_key attribute is set (prefer env var)
     app.secret_key = os.environ.get("SECRET_KEY", app.config.get("SECRET_KEY"))
@@ -20,11 +204,128 @@ def create_app(config=None):
     from .utils.password_manager import PasswordManager
     from .repositories.user_repo_sqlite import SQLiteUserRepository
 
-    app.pwm = PasswordManager()
+    app.pwm = PasswordManager(
+        iterations=app.config["PASSWORD_PBKDF2_ITERATIONS"],
+        scheme=app.config["PASSWORD_HASH_SCHEME"],
+        scrypt_n=app.config["PASSWORD_SCRYPT_N"],
+        max_workers=app.config["PASSWORD_HASH_WORKERS"],
+        max_pending=app.config["PASSWORD_HASH_MAX_PENDING"],
+    )
     app.user_repo = SQLiteUserRepository(
-        db_path=app.config.get("USERS_DB"), password_manager=app.pwm
+        db_path=app.config.get("USERS_DB"),
+        password_manager=app.pwm,
+        cache_size=app.config["USER_CACHE_SIZE"],
+        cache_ttl=app.config["USER_CACHE_TTL"],
+    )
+    atexit.register(app.user_repo.close)
+
+    # long-lived connections for the topics DB, shared by all requests
+    app.topics_pool = None
+    if app.config.get("TOPICS_DB"):
+        from .repositories.sqlite_pool import SQLiteConnectionPool
+
+        db_dir = os.path.dirname(app.config["TOPICS_DB"])
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        app.topics_pool = SQLiteConnectionPool(
+            app.config["TOPICS_DB"],
+            max_size=app.config.get("TOPICS_DB_POOL_SIZE"),
+            timeout=app.config.get("TOPICS_DB_POOL_TIMEOUT"),
+            pragmas=app.config.get("TOPICS_DB_PRAGMAS"),
+        )
+        # close pooled connections cleanly on interpreter shutdown
+        atexit.register(app.topics_pool.close)
+
+    # small connection pool for STATE_DB
+    app.state_pool = None
+    if app.config.get("STATE_DB"):
+        from .repositories.sqlite_pool import SQLiteConnectionPool
+
+        state_dir = os.path.dirname(app.config["STATE_DB"])
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        app.state_pool = SQLiteConnectionPool(app.config["STATE_DB"], max_size=4)
+        atexit.register(app.state_pool.close)
+
+    # topic repository, omikuji service and renderer are built once per app
+    from .services.registry import ServiceRegistry
+
+    app.services = ServiceRegistry(
+        app.config, pool=app.topics_pool, state_pool=app.state_pool
+    ).build()
+    app.logger.info(
+        "services built in %.1fms (%s)",
+        app.services.build_time_total * 1000,
+        ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in app.services.build_times.items()),
     )
 
+    # fingerprinted static assets and the `asset_url()` template helper
+    from .utils.assets import AssetManifest
+
+    AssetManifest(app.config["ASSETS_DIR"]).init_app(app)
+
+    # part of every ETag so a deploy with changed templates (or rebuilt
+    # assets, whose URLs pages embed) invalidates pages
+    if "ETAG_SALT" not in app.config:
+        from .utils.http_cache import tree_fingerprint
+
+        app.config["ETAG_SALT"] = (
+            tree_fingerprint(os.path.join(app.root_path, app.template_folder))
+            + app.assets.fingerprint
+        )
+
+    # request/query/render/hash timings; hooked in before admission control
+    # so rejected requests are timed as well
+    app.metrics = None
+    if app.config.get("METRICS_ENABLED"):
+        _init_metrics(app)
+
+    # rate limits and concurrency caps, checked before every request
+    from .services.admission import AdmissionControl
+
+    AdmissionControl(
+        app.config.get("RATE_LIMITS"),
+        heavy=app.config.get("ADMISSION_HEAVY_ROUTES", ()),
+        max_heavy=app.config.get("ADMISSION_MAX_HEAVY", 0),
+        max_in_flight=app.config.get("ADMISSION_MAX_IN_FLIGHT", 0),
+        max_keys=app.config.get("RATE_LIMIT_MAX_KEYS", 10_000),
+        state_pool=app.state_pool,
+        workers=app.config.get("WEB_WORKERS", 1),
+    ).init_app(app)
+    if app.metrics is not None:
+        app.metrics.add_collector("admission", app.admission.stats)
+
+    # opt-in request profiling; registers no hooks while disabled
+    from .utils.profiling import RequestProfiler
+
+    RequestProfiler(
+        app.config["PROFILE_DIR"],
+        sample_rate=app.config["PROFILE_SAMPLE_RATE"],
+        slow_ms=app.config["PROFILE_SLOW_MS"],
+        interval_ms=app.config["PROFILE_INTERVAL_MS"],
+        endpoints=app.config["PROFILE_ENDPOINTS"],
+        max_files=app.config["PROFILE_MAX_FILES"],
+    ).init_app(app)
+    if app.metrics is not None and app.profiler.enabled:
+        app.metrics.add_collector("profiler", app.profiler.stats)
+
+    # compress responses as they leave the app (precompressed assets and
+    # gzip exports already carry a Content-Encoding and pass through)
+    app.compression = None
+    if app.config.get("COMPRESSION_ENABLED"):
+        from .utils.compression import DEFAULT_MIMETYPES, CompressionMiddleware
+
+        app.compression = CompressionMiddleware(
+            app.wsgi_app,
+            min_size=app.config["COMPRESSION_MIN_SIZE"],
+            mimetypes=app.config.get("COMPRESSION_MIMETYPES") or DEFAULT_MIMETYPES,
+            level=app.config["COMPRESSION_LEVEL"],
+            brotli_quality=app.config["COMPRESSION_BROTLI_QUALITY"],
+        )
+        app.wsgi_app = app.compression
+        if app.metrics is not None:
+            app.metrics.add_collector("compression", app.compression.stats)
+
     # register blueprints lazily to avoid import cycles
     from .controllers.topics import bp as topics_bp
 
@@ -55,3 +356,64 @@ def create_app(config=None):
         return render_template("403.html"), 403
 
     return app
+
+
+# repository methods timed into repository_call_duration_seconds; for the
+# SQLite backends this is the time spent in queries
+_TOPIC_REPO_METHODS = (
+    "get_topic",
+    "list_topics",
+    "create_topic",
+    "create_topics_bulk",
+    "delete_topic",
+    "random_topic_id",
+    "list_topic_ids",
+    "revision",
+    "last_changed",
+    "search",
+    "rerender_stale",
+)
+_USER_REPO_METHODS = {
+    "_load_user": "get_user",
+    "create_user": "create_user",
+    "change_password": "change_password",
+    "set_roles": "set_roles",
+    "delete_user": "delete_user",
+}
+
+
+def _init_metrics(app):
+    from .utils.metrics import Metrics
+
+    metrics = Metrics(directory=app.config.get("METRICS_DIR") or None)
+    metrics.init_app(app, token=app.config.get("METRICS_TOKEN"))
+    services = app.services
+    repo_hist = metrics.histogram(
+        "repository_call_duration_seconds", "Topic/user repository call latency"
+    )
+    backend = "sqlite" if app.config.get("TOPICS_DB") else "file"
+    metrics.instrument(
+        services.topic_repo,
+        repo_hist,
+        _TOPIC_REPO_METHODS,
+        repo="topics",
+        backend=backend,
+    )
+    metrics.instrument(
+        app.user_repo, repo_hist, _USER_REPO_METHODS, repo="users", backend="sqlite"
+    )
+    metrics.instrument(
+        services.renderer,
+        metrics.histogram("markdown_render_duration_seconds", "Markdown render time"),
+        ["render"],
+    )
+    # includes waiting for a hashing thread
+    metrics.instrument(
+        app.pwm,
+        metrics.histogram("password_hash_duration_seconds", "Password hashing time"),
+        {"_pbkdf2": "pbkdf2_sha256", "_scrypt": "scrypt"},
+        label="scheme",
+    )
+    # pools, caches (hit rates), decks and the draw pool of this process
+    metrics.add_collector("", services.stats)
+    metrics.add_collector("users", app.user_repo.stats)
@@ -1,6 +1,7 @@
 from flask import (
     Blueprint,
     current_app,
+    jsonify,
     render_template,
     request,
     redirect,
@@ -8,12 +9,24 @@ from flask import (
     session,
     flash,
     abort,
+    send_from_directory,
 )
 from functools import wraps
 
+from ..utils.password_manager import HashingBusy
+from ..utils.profiling import parse_name
+
 bp = Blueprint("auth", __name__)
 
 
+def _busy(template):
+    # password hashing queue is full: ask the client to retry shortly
+    body = render_template(
+        template, error="混雑しています。しばらくしてから再度お試しください"
+    )
+    return body, 503, {"Retry-After": "1"}
+
+
 @bp.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "GET":
@@ -28,7 +41,11 @@ def login():
         )
 
     repo = current_app.user_repo
-    if repo.verify_user(username, password):
+    try:
+        verified = repo.verify_user(username, password)
+    except HashingBusy:
+        return _busy("login.html")
+    if verified:
         session["username"] = username
         # store roles in session for quick access
         user = repo.get_user(username)
@@ -60,6 +77,8 @@ def register():
     repo = current_app.user_repo
     try:
         repo.create_user(username, password)
+    except HashingBusy:
+        return _busy("register.html")
     except Exception as e:
         return render_template("register.html", error=f"登録に失敗しました: {e}")
 
@@ -99,6 +118,52 @@ def admin():
     return render_template("admin.html")
 
 
+@bp.route("/admin/stats")
+@require_roles(["admin"])
+def admin_stats():
+    # cache/pool counters (hit rates etc.) of this worker process
+    stats = current_app.services.stats()
+    if hasattr(current_app.user_repo, "stats"):
+        stats["users"] = current_app.user_repo.stats()
+    stats["admission"] = current_app.admission.stats()
+    if current_app.compression is not None:
+        stats["compression"] = current_app.compression.stats()
+    if current_app.profiler.enabled:
+        stats["profiler"] = current_app.profiler.stats()
+    return jsonify(stats)
+
+
+@bp.route("/admin/profiles")
+@require_roles(["admin"])
+def admin_profiles():
+    # recent request profiles of all workers, newest first (?endpoint= filters)
+    profiler = current_app.profiler
+    limit = request.args.get("limit", default=100, type=int)
+    profiles = profiler.list_profiles(request.args.get("endpoint") or None)
+    return jsonify(
+        {
+            "enabled": profiler.enabled,
+            "stats": profiler.stats(),
+            "profiles": [
+                dict(p, url=url_for("auth.admin_profile", name=p["name"]))
+                for p in profiles[: max(0, limit)]
+            ],
+        }
+    )
+
+
+@bp.route("/admin/profiles/<name>")
+@require_roles(["admin"])
+def admin_profile(name):
+    # download one profile (.pstats for pstats/snakeviz, .collapsed for
+    # flamegraph.pl/speedscope)
+    if parse_name(name) is None:
+        abort(404)
+    return send_from_directory(
+        current_app.profiler.directory, name, as_attachment=True
+    )
+
+
 # --- 追加: ログイン済みチェック用デコレータ ---
 def require_login(f):
     @wraps(f)
@@ -1,5 +1,11 @@
+import json
+import secrets
+
+from datetime import datetime, timezone
+
 from flask import (
     Blueprint,
+    Response,
     current_app,
     request,
     jsonify,
@@ -8,11 +14,10 @@ from flask import (
     session,
 )
 
-from ..repositories.topic_repo_sqlite import SQLiteTopicRepository
-from ..repositories.topic_repo_file import FileTopicRepository
-from ..repositories.topic_repo import TopicRepoError
-from ..services.omikuji import OmikujiService
-from ..utils.markdown import MarkdownRenderer
+from ..repositories.topic_repo import TopicRepoError, encode_cursor
+from ..utils.render_cache import content_version
+from ..utils.http_cache import conditional_response, make_etag, parse_timestamp
+from ..utils.export import export_bound, export_topics
 
 # 認可デコレータをインポート
 from .auth import require_roles, require_login
@@ -21,12 +26,49 @@ bp = Blueprint("topics", __name__)
 
 
 def _repo():
-    # Prefer a configured SQLite DB if provided; fall back to filesystem repo.
-    db_path = current_app.config.get("TOPICS_DB")
-    if db_path:
-        return SQLiteTopicRepository(db_path=db_path)
-    topics_dir = current_app.config.get("TOPICS_DIR")
-    return FileTopicRepository(topics_dir)
+    # app-scoped repository built once in create_app (see ServiceRegistry)
+    return current_app.services.topic_repo
+
+
+def _omikuji():
+    return current_app.services.omikuji
+
+
+def _renderer():
+    return current_app.services.renderer
+
+
+def _render_topic(t):
+    """Return the rendered HTML of topic `t` (see ServiceRegistry.render_topic)."""
+    return current_app.services.render_topic(t)
+
+
+def _deck_key():
+    """Return the deck to draw from for this request, or None for plain draws.
+
+    `?mode=deck` (or OMIKUJI_DRAW_MODE="deck") draws without repeats; the deck
+    is shared by everyone passing the same `?room=`, otherwise it is kept per
+    browser session.
+    """
+    mode = request.args.get("mode") or current_app.config.get("OMIKUJI_DRAW_MODE")
+    if mode != "deck":
+        return None
+    room = request.args.get("room", "").strip()
+    if room:
+        return "room:" + room[:64]
+    if "deck" not in session:
+        session["deck"] = secrets.token_urlsafe(8)
+    return "session:" + session["deck"]
+
+
+def _page_etag(*parts):
+    """ETag of a page: template set + the viewer (pages embed user and roles)."""
+    return make_etag(
+        current_app.config.get("ETAG_SALT"),
+        session.get("username"),
+        ",".join(sorted(session.get("roles") or [])),
+        *parts,
+    )
 
 
 @bp.route("/")
@@ -37,33 +79,124 @@ def index():
 @bp.route("/omikuji")
 @require_roles(["admin"])
 def omikuji():
-    service = OmikujiService(_repo())
-    tid = service.pick_random_topic()
     # If client prefers HTML, render the omikuji page which will call this endpoint to get the result
     if request.accept_mimetypes.accept_html:
-        return render_template("omikuji.html")
+        return conditional_response(
+            lambda: render_template("omikuji.html"),
+            _page_etag("omikuji"),
+            cache_control=current_app.config.get("CACHE_CONTROL_OMIKUJI"),
+        )
 
+    tid = _omikuji().pick_random_topic(deck=_deck_key())
     if not tid:
         return jsonify({"error": "no topics"}), 404
-    return jsonify({"id": tid})
+    resp = jsonify({"id": tid})
+    # every draw is different
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+@bp.route("/omikuji/draw")
+@require_roles(["admin"])
+def omikuji_draw():
+    """Draw a topic and return it ready to show: {id, title, html, url}.
+
+    One round trip for the omikuji page: the sanitized HTML comes from the
+    stored copy (or the render cache), so the page needs neither a second
+    request nor a navigation to /topics/<id>. Plain draws are usually served
+    from the pre-drawn pool (OMIKUJI_POOL_SIZE).
+    """
+    item = _omikuji().draw_prepared(deck=_deck_key())
+    if item is None:
+        return jsonify({"error": "no topics"}), 404
+    resp = jsonify(dict(item, url=f"/topics/{item['id']}"))
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+def _page_limit():
+    default = current_app.config.get("TOPICS_PAGE_SIZE", 50)
+    try:
+        limit = int(request.args.get("limit", default))
+    except ValueError:
+        limit = default
+    return max(1, min(limit, current_app.config.get("TOPICS_PAGE_SIZE_MAX", 200)))
 
 
 @bp.route("/topics", methods=["GET"])
 def list_topics():
+    cache_control = current_app.config.get("CACHE_CONTROL_LIST")
+    # Serve HTML page when browser requests HTML; the page loads the list lazily
+    if request.accept_mimetypes.accept_html:
+        # is_admin フラグをテンプレートに渡す
+        is_admin = "admin" in (session.get("roles") or [])
+        return conditional_response(
+            lambda: render_template("list.html", is_admin=is_admin),
+            _page_etag("list"),
+            cache_control=cache_control,
+        )
     try:
-        topics = _repo().list_topics()
-        # Serve HTML page when browser requests HTML; otherwise return JSON list
-        if request.accept_mimetypes.accept_html:
-            # is_admin フラグをテンプレートに渡す
-            is_admin = "admin" in (session.get("roles") or [])
-            return render_template("list.html", is_admin=is_admin)
-        try:
-            topics = _repo().list_topics()
-            return jsonify(topics)
-        except Exception:
-            return jsonify({"error": "failed to list topics"}), 500
+        repo = _repo()
+        # the repository-wide change counter versions every page of the list
+        etag = make_etag(repo.revision(), request.query_string)
+        last_modified = parse_timestamp(repo.last_changed())
+        return conditional_response(
+            _list_topics_json, etag, last_modified, cache_control
+        )
     except TopicRepoError as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": str(e)}), 400
+
+
+def _list_topics_json():
+    if "cursor" not in request.args and "limit" not in request.args:
+        # legacy: full list as a JSON array
+        return jsonify(_repo().list_topics())
+    # keyset pagination: {"items": [...], "next_cursor": "..." | null}
+    limit = _page_limit()
+    items = _repo().list_topics(
+        limit=limit + 1, cursor=request.args.get("cursor") or None
+    )
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+    return jsonify({"items": items, "next_cursor": next_cursor})
+
+
+@bp.route("/topics/search", methods=["GET"])
+def search_topics():
+    """Full-text search: {"items": [{id, title, snippet, score}], "next_cursor"}.
+
+    `q` holds whitespace separated terms that must all match (`term*` for a
+    prefix); `cursor` is the `next_cursor` of the previous page.
+    """
+    q = request.args.get("q", "").strip()
+    if not q:
+        return jsonify({"error": "q is required"}), 400
+    cursor = request.args.get("cursor") or "0"
+    if not cursor.isdigit():
+        return jsonify({"error": "invalid cursor"}), 400
+    offset = int(cursor)
+    limit = _page_limit()
+    repo = _repo()
+
+    def build():
+        items = repo.search(q, limit=limit + 1, offset=offset)
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = str(offset + limit)
+        return jsonify({"items": items, "next_cursor": next_cursor})
+
+    # results only change when topics do
+    etag = make_etag(repo.revision(), "search", request.query_string)
+    return conditional_response(
+        build,
+        etag,
+        parse_timestamp(repo.last_changed()),
+        current_app.config.get("CACHE_CONTROL_LIST"),
+    )
 
 
 @bp.route("/topics/<id>", methods=["GET"])
@@ -72,12 +205,31 @@ def get_topic(id):
         t = _repo().get_topic(id)
     except TopicRepoError:
         abort(404)
-    renderer = MarkdownRenderer()
-    content = renderer.render(t.get("body", ""))
-    # render a template showing the title and rendered content
-    is_admin = "admin" in (session.get("roles") or [])
-    return render_template(
-        "topic.html", title=t.get("title"), content=content, id=id, is_admin=is_admin
+    if not t:
+        abort(404)
+    # row version: content hash + renderer; 304 skips rendering entirely
+    etag = _page_etag(
+        "topic",
+        id,
+        content_version(t.get("title", "") + "\n" + t.get("body", "")),
+        _renderer().version,
+    )
+    last_modified = parse_timestamp(t.get("updated_at") or t.get("created_at"))
+
+    def build():
+        content = _render_topic(t)
+        # render a template showing the title and rendered content
+        is_admin = "admin" in (session.get("roles") or [])
+        return render_template(
+            "topic.html",
+            title=t.get("title"),
+            content=content,
+            id=id,
+            is_admin=is_admin,
+        )
+
+    return conditional_response(
+        build, etag, last_modified, current_app.config.get("CACHE_CONTROL_TOPIC")
     )
 
 
@@ -89,17 +241,90 @@ def create_topic():
     body = data.get("body")
     try:
         new_id = _repo().create_topic(title, body)
+        _omikuji().topic_created(new_id)
         return jsonify({"id": new_id}), 201
     except TopicRepoError as e:
         return jsonify({"error": str(e)}), 400
 
 
+def _bulk_items():
+    """Parse a bulk request body: a JSON array, or NDJSON (one object per line)."""
+    if request.mimetype == "application/json":
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            raise ValueError("expected a JSON array of topics")
+    else:
+        items = []
+        for n, line in enumerate(request.stream, 1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                raise ValueError(f"line {n}: invalid JSON")
+    for n, t in enumerate(items):
+        if not isinstance(t, dict) or not t.get("title") or not t.get("body"):
+            raise ValueError(f"topic {n}: title and body are required")
+    return items
+
+
+@bp.route("/topics/bulk", methods=["POST"])
+@require_roles(["admin"])
+def create_topics_bulk():
+    """Create many topics at once (admin): {"created": n, "ids": [...]}.
+
+    Send a JSON array, or NDJSON with Content-Type application/x-ndjson.
+    Every item is validated before anything is written.
+    """
+    try:
+        items = _bulk_items()
+        ids = _repo().create_topics_bulk(items)
+    except (ValueError, TopicRepoError) as e:
+        return jsonify({"error": str(e)}), 400
+    _omikuji().topics_created(ids)
+    return jsonify({"created": len(ids), "ids": ids}), 201
+
+
+@bp.route("/topics/export", methods=["GET"])
+@require_roles(["admin"])
+def export_topics_ndjson():
+    """Stream topics created in [since, until) as NDJSON (admin).
+
+    `?gzip=1` sends a .ndjson.gz file instead. `until` defaults to now and is
+    echoed in X-Export-Until: pass it as the next run's `since` for
+    incremental backups.
+    """
+    try:
+        since = export_bound(request.args.get("since"))
+        until = export_bound(request.args.get("until")) or datetime.now(
+            timezone.utc
+        ).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return jsonify({"error": "since/until must be ISO 8601 dates"}), 400
+    gz = request.args.get("gzip") in ("1", "true")
+    filename = "topics.ndjson.gz" if gz else "topics.ndjson"
+    # the generator outlives the request context: bind the repository now
+    resp = Response(
+        export_topics(_repo(), since=since, until=until, gzip=gz),
+        mimetype="application/gzip" if gz else "application/x-ndjson",
+    )
+    resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    resp.headers["X-Export-Until"] = until
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
 @bp.route("/topics/preview", methods=["POST"])
 def preview_topic():
+    # unauthenticated and CPU-heavy: refuse oversized input before parsing
+    max_bytes = current_app.config.get("PREVIEW_MAX_BYTES")
+    if max_bytes and (request.content_length or 0) > max_bytes:
+        return jsonify({"error": "body too large"}), 413
     data = request.get_json() if request.is_json else request.form
     body = data.get("body", "")
-    renderer = MarkdownRenderer()
-    content = renderer.render(body)
+    if max_bytes and len(body.encode("utf-8")) > max_bytes:
+        return jsonify({"error": "body too large"}), 413
+    content = _renderer().render(body)
     # Return HTML fragment
     return content
 
@@ -116,6 +341,8 @@ def post_page():
 def delete_topic(id):
     try:
         _repo().delete_topic(id)
+        _omikuji().topic_deleted(id)
+        current_app.services.render_cache.invalidate(id)
         return ("", 204)
     except TopicRepoError:
         abort(404)
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from .sqlite_pool import SQLiteConnectionPool
+
+# a deck cursor as stored: (seed, base, end, pos)
+DeckState = Tuple[int, int, int, int]
+
+
+class SQLiteDeckStore:
+    """Omikuji deck cursors kept in SQLite, shared by every worker process.
+
+    A deck is a small cursor (see `TopicDeck`), so each draw reads and
+    rewrites one row inside a `BEGIN IMMEDIATE` transaction: two processes
+    drawing from the same deck are serialized and never get the same card.
+    At most `max_decks` decks are kept; the least recently used are dropped
+    when new ones are created.
+    """
+
+    def __init__(self, pool: SQLiteConnectionPool, max_decks: int = 10_000):
+        self.pool = pool
+        self.max_decks = max(1, int(max_decks))
+        self._ensure_table()
+
+    @contextmanager
+    def _conn(self) -> Iterator[sqlite3.Connection]:
+        with self.pool.connection() as conn:
+            yield conn
+
+    def _ensure_table(self) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS omikuji_decks (
+                  key TEXT PRIMARY KEY,
+                  seed INTEGER NOT NULL,
+                  base INTEGER NOT NULL,
+                  end_pos INTEGER NOT NULL,
+                  pos INTEGER NOT NULL,
+                  used_at REAL NOT NULL
+                );
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS omikuji_decks_used_at"
+                " ON omikuji_decks (used_at)"
+            )
+            conn.commit()
+
+    def update(
+        self, key: str, step: Callable[[Optional[DeckState]], Tuple[DeckState, Any]]
+    ) -> Any:
+        """Advance deck `key` atomically and return `step`'s result.
+
+        `step` gets the stored cursor (None for a new deck) and returns the
+        new cursor and a result. It runs inside the write transaction, so it
+        must be quick and must not touch this database itself.
+        """
+        with self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT seed, base, end_pos, pos FROM omikuji_decks WHERE key = ?",
+                (key,),
+            ).fetchone()
+            state, result = step(tuple(row) if row is not None else None)
+            conn.execute(
+                "INSERT INTO omikuji_decks (key, seed, base, end_pos, pos, used_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET seed = excluded.seed,"
+                " base = excluded.base, end_pos = excluded.end_pos,"
+                " pos = excluded.pos, used_at = excluded.used_at",
+                (key, *state, time.time()),
+            )
+            if row is None:
+                # a new deck: drop the least recently used beyond the cap
+                conn.execute(
+                    "DELETE FROM omikuji_decks WHERE used_at < ("
+                    " SELECT used_at FROM omikuji_decks ORDER BY used_at DESC"
+                    " LIMIT 1 OFFSET ?)",
+                    (self.max_decks - 1,),
+                )
+            conn.commit()
+        return result
+
+    def count(self) -> int:
+        with self._conn() as conn:
+            return conn.execute("SELECT count(*) FROM omikuji_decks").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"decks": self.count(), "max_decks": self.max_decks, "shared": True}
+
+
+__all__ = ["SQLiteDeckStore", "DeckState"]
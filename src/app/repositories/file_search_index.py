@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import sqlite3
+import unicodedata
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from .sqlite_pool import SQLiteConnectionPool
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+  doc INTEGER PRIMARY KEY,
+  id TEXT NOT NULL UNIQUE,
+  mtime_ns INTEGER NOT NULL,
+  size INTEGER NOT NULL,
+  -- the doc's grams, so removal needs no second index on postings
+  grams TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+  gram TEXT NOT NULL,
+  doc INTEGER NOT NULL,
+  PRIMARY KEY (gram, doc)
+) WITHOUT ROWID;
+"""
+
+_SEP = "\x00"
+
+# query terms whose document frequency is looked up, and how many of the
+# rarest ones are used to select candidates
+_COUNTED_GRAMS = 16
+_USED_GRAMS = 6
+# document frequencies are counted up to this; beyond it terms count as
+# equally common (keeps the lookup cheap for very frequent grams)
+_DF_CAP = 10_000
+
+
+def normalize(text: str) -> str:
+    """Case- and width-fold text the same way for documents and queries."""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def _terms(text: str) -> Iterator[Tuple[str, str]]:
+    # yields (char, bigram ending at char); whitespace runs count as one " "
+    prev = ""
+    for ch in text:
+        if ch.isspace():
+            if prev == " ":
+                continue
+            ch = " "
+        yield ch, (prev + ch if prev else "")
+        prev = ch
+
+
+def grams(text: str) -> Set[str]:
+    """Index terms of normalized `text`: every character and character bigram.
+
+    Character n-grams need no word segmentation, so Japanese text without
+    spaces is searchable. Whitespace runs are folded into a single space,
+    which only appears inside bigrams.
+    """
+    out: Set[str] = set()
+    for ch, bigram in _terms(text):
+        if ch != " ":
+            out.add(ch)
+        if bigram:
+            out.add(bigram)
+    return out
+
+
+def query_grams(q: str, max_grams: int = 6) -> List[str]:
+    """Terms a document must contain to possibly match normalized query `q`.
+
+    Prefers bigrams; a few spread over the query are enough because every
+    candidate is verified against the real text afterwards.
+    """
+    bigrams: List[str] = []
+    chars: List[str] = []
+    for ch, bigram in _terms(q.strip()):
+        if ch != " " and ch not in chars:
+            chars.append(ch)
+        if bigram and bigram not in bigrams:
+            bigrams.append(bigram)
+    terms = bigrams or chars
+    if len(terms) > max_grams:
+        step = (len(terms) - 1) / (max_grams - 1)
+        terms = [terms[round(i * step)] for i in range(max_grams)]
+    return terms
+
+
+class FileSearchIndex:
+    """On-disk inverted index (character n-grams) for FileTopicRepository.
+
+    Stored in a standalone SQLite file; keep it outside the topics directory
+    so index writes do not look like topic changes.
+    """
+
+    def __init__(self, path: str, pool_size: int = 4):
+        self.path = path
+        self.pool = SQLiteConnectionPool(path, max_size=pool_size)
+        with self.pool.connection() as conn:
+            conn.executescript(_SCHEMA)
+            conn.commit()
+
+    def _remove(self, conn: sqlite3.Connection, tid: str) -> None:
+        row = conn.execute(
+            "SELECT doc, grams FROM docs WHERE id = ?", (tid,)
+        ).fetchone()
+        if row is None:
+            return
+        doc = row["doc"]
+        conn.executemany(
+            "DELETE FROM postings WHERE gram = ? AND doc = ?",
+            ((g, doc) for g in row["grams"].split(_SEP) if g),
+        )
+        conn.execute("DELETE FROM docs WHERE doc = ?", (doc,))
+
+    def _add(
+        self, conn: sqlite3.Connection, tid: str, text: str, mtime_ns: int, size: int
+    ) -> None:
+        self._remove(conn, tid)
+        terms = grams(normalize(text))
+        cur = conn.execute(
+            "INSERT INTO docs (id, mtime_ns, size, grams) VALUES (?, ?, ?, ?)",
+            (tid, mtime_ns, size, _SEP.join(terms)),
+        )
+        doc = cur.lastrowid
+        conn.executemany(
+            "INSERT OR IGNORE INTO postings (gram, doc) VALUES (?, ?)",
+            ((g, doc) for g in terms),
+        )
+
+    def add(self, tid: str, text: str, mtime_ns: int = 0, size: int = 0) -> None:
+        """Index (or re-index) one topic."""
+        with self.pool.connection() as conn:
+            self._add(conn, tid, text, mtime_ns, size)
+            conn.commit()
+
+    def remove(self, tid: str) -> None:
+        with self.pool.connection() as conn:
+            self._remove(conn, tid)
+            conn.commit()
+
+    def sync(
+        self,
+        current: Dict[str, Tuple[int, int]],
+        read_text: Callable[[str], Optional[str]],
+        batch_size: int = 500,
+    ) -> Tuple[int, int]:
+        """Bring the index in line with `current` (id -> (mtime_ns, size)).
+
+        Only topics that are new or whose mtime/size changed are read and
+        re-indexed; topics no longer present are dropped. Returns
+        (indexed, removed).
+        """
+        with self.pool.connection() as conn:
+            known = {
+                row["id"]: (row["mtime_ns"], row["size"])
+                for row in conn.execute("SELECT id, mtime_ns, size FROM docs")
+            }
+        stale = [tid for tid in known if tid not in current]
+        # index in id order so doc order (the result order) follows ids
+        todo = sorted(
+            tid for tid, sig in current.items() if known.get(tid) != tuple(sig)
+        )
+        indexed = 0
+        with self.pool.connection() as conn:
+            for tid in stale:
+                self._remove(conn, tid)
+            conn.commit()
+            for n, tid in enumerate(todo, 1):
+                text = read_text(tid)
+                if text is None:
+                    continue
+                mtime_ns, size = current[tid]
+                self._add(conn, tid, text, mtime_ns, size)
+                indexed += 1
+                if n % batch_size == 0:
+                    conn.commit()
+            conn.commit()
+        return indexed, len(stale)
+
+    def clear(self) -> None:
+        with self.pool.connection() as conn:
+            conn.execute("DELETE FROM postings")
+            conn.execute("DELETE FROM docs")
+            conn.commit()
+
+    def candidates(self, q: str, chunk: int = 64) -> Iterator[str]:
+        """Yield ids of topics that may contain normalized `q`, oldest first.
+
+        Walks the postings of the rarest term in doc order and probes the
+        other terms (rarer first) by primary key, so results stream and a
+        caller that only needs `limit` matches stops early.
+        """
+        terms = query_grams(q, max_grams=_COUNTED_GRAMS)
+        if not terms:
+            return
+        with self.pool.connection() as conn:
+            df = {t: self._doc_freq(conn, t) for t in terms}
+        if not all(df.values()):
+            return  # some term occurs nowhere: nothing can match
+        terms = sorted(terms, key=df.__getitem__)[:_USED_GRAMS]
+        probes = "".join(
+            " AND EXISTS (SELECT 1 FROM postings o WHERE o.gram = ? AND o.doc = p.doc)"
+            for _ in terms[1:]
+        )
+        sql = (
+            "SELECT d.id FROM postings p JOIN docs d ON d.doc = p.doc"
+            f" WHERE p.gram = ?{probes} ORDER BY p.doc"
+        )
+        with self.pool.connection() as conn:
+            cur = conn.execute(sql, terms)
+            while True:
+                rows = cur.fetchmany(chunk)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row["id"]
+
+    @staticmethod
+    def _doc_freq(conn: sqlite3.Connection, gram: str) -> int:
+        # bounded range scan of the (gram, doc) primary key
+        return conn.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM postings WHERE gram = ? LIMIT ?)",
+            (gram, _DF_CAP),
+        ).fetchone()[0]
+
+    def count(self) -> int:
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+__all__ = ["FileSearchIndex", "normalize", "grams", "query_grams"]
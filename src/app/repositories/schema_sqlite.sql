@@ -9,23 +9,61 @@ CREATE TABLE IF NOT EXISTS topics (
   title TEXT NOT NULL,
   body TEXT NOT NULL,
   created_at DATETIME NOT NULL DEFAULT (datetime('now')),
-  updated_at DATETIME
+  updated_at DATETIME,
+  -- sanitized HTML rendered at write time and the MarkdownRenderer version
+  -- that produced it (older databases get these columns from ensure_schema)
+  body_html TEXT,
+  render_version TEXT
 );
 
--- FTS5 virtual table for full-text search (optional)
-CREATE VIRTUAL TABLE IF NOT EXISTS topics_fts USING fts5(title, body, content='topics', content_rowid='id');
+-- keyset pagination of the topic list on (created_at, id)
+CREATE INDEX IF NOT EXISTS topics_created_at_id ON topics (created_at, id);
+
+-- FTS5 virtual table for full-text search. The trigram tokenizer indexes
+-- every 3-character substring, so Japanese text (no spaces between words) is
+-- searchable; ensure_schema rebuilds indexes created with another tokenizer.
+CREATE VIRTUAL TABLE IF NOT EXISTS topics_fts USING fts5(title, body, content='topics', content_rowid='id', tokenize='trigram');
 
--- Triggers to keep FTS index in sync
+-- Triggers to keep FTS index in sync. topics_fts is an external-content
+-- table, so removals use the 'delete' command with the old values (a plain
+-- DELETE would read the already-changed row from topics).
 CREATE TRIGGER IF NOT EXISTS topics_ai AFTER INSERT ON topics BEGIN
   INSERT INTO topics_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
 END;
 
-CREATE TRIGGER IF NOT EXISTS topics_ad AFTER DELETE ON topics BEGIN
-  DELETE FROM topics_fts WHERE rowid = old.id;
+DROP TRIGGER IF EXISTS topics_ad;
+CREATE TRIGGER topics_ad AFTER DELETE ON topics BEGIN
+  INSERT INTO topics_fts(topics_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+END;
+
+-- only title/body changes touch the index (re-rendering body_html does not)
+DROP TRIGGER IF EXISTS topics_au;
+CREATE TRIGGER topics_au AFTER UPDATE OF title, body ON topics BEGIN
+  INSERT INTO topics_fts(topics_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+  INSERT INTO topics_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+END;
+
+-- Change counter bumped on inserts, deletes and title/body edits; cheap to poll for
+-- invalidating in-memory indexes and caches
+CREATE TABLE IF NOT EXISTS topics_revision (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  revision INTEGER NOT NULL DEFAULT 0,
+  changed_at DATETIME
+);
+
+INSERT OR IGNORE INTO topics_revision (id, revision, changed_at) VALUES (1, 0, datetime('now'));
+
+CREATE TRIGGER IF NOT EXISTS topics_rev_ai AFTER INSERT ON topics BEGIN
+  UPDATE topics_revision SET revision = revision + 1, changed_at = datetime('now') WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS topics_rev_ad AFTER DELETE ON topics BEGIN
+  UPDATE topics_revision SET revision = revision + 1, changed_at = datetime('now') WHERE id = 1;
 END;
 
-CREATE TRIGGER IF NOT EXISTS topics_au AFTER UPDATE ON topics BEGIN
-  UPDATE topics_fts SET title = new.title, body = new.body WHERE rowid = new.id;
+DROP TRIGGER IF EXISTS topics_rev_au;
+CREATE TRIGGER topics_rev_au AFTER UPDATE OF title, body ON topics BEGIN
+  UPDATE topics_revision SET revision = revision + 1, changed_at = datetime('now') WHERE id = 1;
 END;
 
 -- Users table for authentication
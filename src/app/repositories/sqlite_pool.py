@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Any
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+DEFAULT_PRAGMAS: Dict[str, Any] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    # negative value = size in KiB
+    "cache_size": -16000,
+    "mmap_size": 64 * 1024 * 1024,
+    "busy_timeout": 5000,
+}
+
+
+class SQLiteConnectionPool:
+    """Thread-safe pool of long-lived SQLite connections.
+
+    Connections are opened lazily up to `max_size`, have their pragmas applied
+    once when created and are then reused. Callers borrow a connection with
+    `connection()` which returns it to the pool afterwards (rolling back any
+    transaction left open).
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_size: int = 8,
+        timeout: float = 10.0,
+        pragmas: Optional[Dict[str, Any]] = None,
+    ):
+        self.db_path = db_path
+        self.max_size = max(1, int(max_size))
+        self.timeout = float(timeout)
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._closed = False
+        self._pid = os.getpid()
+        # metrics
+        self._borrowed = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+        self._timeouts = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            if value is None:
+                continue
+            conn.execute(f"PRAGMA {name}={value};")
+        return conn
+
+    def _check_pid(self) -> None:
+        # connections must not be shared across fork(); start over in the child
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._idle = queue.LifoQueue()
+                    self._size = 0
+                    self._pid = os.getpid()
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("connection pool is closed")
+        self._check_pid()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._size < self.max_size:
+                self._size += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                raise
+        # pool exhausted: wait for a connection to be released
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeout(f"no sqlite connection available within {self.timeout}s")
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._waits += 1
+            self._wait_time += waited
+            self._max_wait = max(self._max_wait, waited)
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+        if self._closed or self._pid != os.getpid():
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire()
+        with self._lock:
+            self._borrowed += 1
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def drain(self) -> None:
+        """Close idle connections; new ones are opened on demand."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._size -= 1
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def close(self) -> None:
+        """Shut the pool down. Connections still borrowed are closed on release."""
+        self._closed = True
+        self.drain()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self._size,
+                "max_size": self.max_size,
+                "idle": self._idle.qsize(),
+                "in_use": self._size - self._idle.qsize(),
+                "borrowed": self._borrowed,
+                "waits": self._waits,
+                "wait_time_total": self._wait_time,
+                "wait_time_max": self._max_wait,
+                "timeouts": self._timeouts,
+            }
+
+
+__all__ = ["SQLiteConnectionPool", "PoolTimeout", "DEFAULT_PRAGMAS"]
@@ -1,14 +1,86 @@
 from __future__ import annotations
 
+import base64
+import html
+import json
 from abc import ABC, abstractmethod
 
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Iterable, Iterator, Optional, Any, Tuple
 
 
 class TopicRepoError(Exception):
     pass
 
 
+def encode_cursor(created_at: Any, id: Any) -> str:
+    """Encode a keyset position `(created_at, id)` as an opaque URL-safe token."""
+    raw = json.dumps([str(created_at), id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, Any]:
+    """Inverse of `encode_cursor`; raises TopicRepoError on malformed input."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return str(created_at), id
+    except Exception:
+        raise TopicRepoError("invalid cursor")
+
+
+# markers around matched text in raw snippets; replaced by <mark> after escaping
+MARK_START = "\x02"
+MARK_END = "\x03"
+
+
+def snippet_html(raw: str) -> str:
+    """Escape a raw snippet and turn MARK_START/MARK_END into <mark> tags."""
+    return (
+        html.escape(raw or "")
+        .replace(MARK_START, "<mark>")
+        .replace(MARK_END, "</mark>")
+    )
+
+
+def make_snippet(text: str, terms: List[str], width: int = 64) -> str:
+    """Build an HTML snippet of `text` around the first of `terms` it contains.
+
+    Matching is case-insensitive; every occurrence of a term inside the
+    excerpt is highlighted. Used where the backend cannot produce snippets.
+    """
+    text = " ".join((text or "").split())
+    lower = text.lower()
+    needles = [t.lower() for t in terms if t]
+    hits = [i for i in (lower.find(n) for n in needles) if i >= 0]
+    start = max(0, min(hits) - width // 4) if hits else 0
+    end = min(len(text), start + width)
+    marks = []
+    for n in needles:
+        i = lower.find(n, start)
+        while 0 <= i and i + len(n) <= end:
+            marks.append((i, i + len(n)))
+            i = lower.find(n, i + len(n))
+    out = []
+    pos = start
+    for a, b in sorted(marks):
+        if a < pos:
+            continue  # overlaps an earlier mark
+        out += [text[pos:a], MARK_START, text[a:b], MARK_END]
+        pos = b
+    out.append(text[pos:end])
+    raw = "".join(out)
+    if start > 0:
+        raw = "…" + raw
+    if end < len(text):
+        raw += "…"
+    return snippet_html(raw)
+
+
+def search_terms(query: str) -> List[str]:
+    """Split a search query into terms (whitespace separated, quotes removed)."""
+    return [t for t in (query or "").replace('"', " ").split() if t.strip("*")]
+
+
 class TopicRepository(ABC):
     """Abstract interface for topic storage backends.
 
@@ -17,8 +89,27 @@ class TopicRepository(ABC):
     """
 
     @abstractmethod
-    def list_topics(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
-        pass
+    def list_topics(
+        self, limit: Optional[int] = None, cursor: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Return topics newest first, ordered by `(created_at, id)` descending.
+
+        `cursor` (from `encode_cursor` of the last item of the previous page)
+        returns only the topics after that position (keyset pagination).
+        """
+
+    @abstractmethod
+    def iter_topics(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        chunk_size: int = 500,
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield full topics (with `body`) oldest first, `chunk_size` at a time.
+
+        Only topics with `since <= created_at < until` are returned (either
+        bound may be None). Memory use does not grow with the corpus.
+        """
 
     @abstractmethod
     def get_topic(self, id: str) -> Dict[str, Any]:
@@ -28,6 +119,14 @@ class TopicRepository(ABC):
     def create_topic(self, title: str, body: str) -> Any:
         pass
 
+    def create_topics_bulk(self, topics: Iterable[Dict[str, Any]]) -> List[Any]:
+        """Create many topics (dicts with `title` and `body`); returns their ids.
+
+        Backends override this when they can do better than one
+        `create_topic` call per topic.
+        """
+        return [self.create_topic(t.get("title"), t.get("body")) for t in topics]
+
     @abstractmethod
     def delete_topic(self, id: str) -> bool:
         pass
@@ -37,8 +136,51 @@ class TopicRepository(ABC):
         pass
 
     @abstractmethod
-    def search(self, query: str, limit: int = 50) -> List[Dict[str, Any]]:
-        pass
+    def list_topic_ids(self) -> List[Any]:
+        """Return the ids of all topics (no titles or bodies)."""
+
+    @abstractmethod
+    def revision(self) -> int:
+        """Return a token that changes whenever topics are created or deleted.
+
+        Must be cheap (O(1)); callers poll it to invalidate in-memory indexes.
+        """
+
+    def revision_step(
+        self, created: int = 0, deleted: int = 0, bulk: bool = False
+    ) -> Optional[int]:
+        """How far this repository's own creates/deletes advance `revision()`.
+
+        None when `revision()` is not a plain change counter; callers that
+        track the revision then reload instead of adopting the new one.
+        """
+        return None
+
+    @abstractmethod
+    def last_changed(self) -> Optional[Any]:
+        """Return when topics last changed (UTC timestamp), or None if unknown."""
+
+    @abstractmethod
+    def search(
+        self, query: str, limit: int = 50, offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Return topics matching every term of `query`, best matches first.
+
+        Items carry `id`, `title` and an HTML `snippet` with the matches
+        wrapped in <mark>. A term ending in `*` is a prefix query; `offset`
+        skips that many results (for paging).
+        """
 
 
-__all__ = ["TopicRepository", "FileTopicRepository", "TopicRepoError"]
+__all__ = [
+    "TopicRepository",
+    "FileTopicRepository",
+    "TopicRepoError",
+    "encode_cursor",
+    "decode_cursor",
+    "MARK_START",
+    "MARK_END",
+    "snippet_html",
+    "make_snippet",
+    "search_terms",
+]
@@ -1,43 +1,410 @@
+import bisect
+import json
+import logging
 import os
+import random
 import re
 import tempfile
+import threading
+import time
+import zlib
 from pathlib import Path
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 
-from .topic_repo import TopicRepository, TopicRepoError
+from .topic_repo import (
+    TopicRepository,
+    TopicRepoError,
+    decode_cursor,
+    make_snippet,
+    search_terms,
+)
+from .file_search_index import FileSearchIndex, normalize
+
+log = logging.getLogger(__name__)
+
+# ids start with the UTC creation time, e.g. 20260109_153124_sample
+_TS_RE = re.compile(r"^(\d{4})(\d{2})(\d{2})_(\d{2})(\d{2})(\d{2})")
+
+_INDEX_FORMAT = 1
+
+# "-2", "-3", ... suffixes tried when a topic file name is taken
+_MAX_NAME_ATTEMPTS = 1000
+
+# index entry: (file name, title, mtime_ns, size, created_at)
+_Entry = Tuple[str, str, int, int, str]
+
+
+def _entry_sig(tid: str, entry: _Entry) -> int:
+    # crc32 rather than hash(): the same files must give the same revision
+    # in every worker process
+    return zlib.crc32(f"{tid}\0{entry[2]}\0{entry[3]}".encode("utf-8"))
 
 
 class FileTopicRepository(TopicRepository):
     """Filesystem-backed topic repository (original implementation).
 
     Kept for backwards compatibility and as a concrete TopicRepository.
+
+    Keeps an in-memory index of id -> (file name, title, mtime, size,
+    created_at). Requests only compare the directory mtime; rescans run on a
+    background thread when it changed (files created, renamed or deleted)
+    and every `rescan_interval` seconds (to notice in-place edits). A rescan
+    stats every file but only re-reads the ones whose mtime or size changed,
+    and never holds the index lock while doing so. With `index_path` the index is
+    persisted to that sidecar file so startup on a large directory does not
+    have to open every topic.
+
+    With `search_index_path`, `search()` is answered from an on-disk n-gram
+    inverted index (`FileSearchIndex`) kept in sync on create/delete and on
+    rescans, instead of reading every file per query.
     """
 
-    def __init__(self, topics_dir: Optional[str] = None):
+    def __init__(
+        self,
+        topics_dir: Optional[str] = None,
+        index_path: Optional[str] = None,
+        rescan_interval: float = 30.0,
+        search_index_path: Optional[str] = None,
+    ):
         if topics_dir:
             self.topics_dir = Path(topics_dir)
         else:
             # default to project-root/topics
             self.topics_dir = Path(__file__).resolve().parents[3] / "topics"
         self.topics_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = Path(index_path) if index_path else None
+        # the sweep runs on its own thread; never let it spin
+        self.rescan_interval = max(0.1, float(rescan_interval))
+        self._lock = threading.RLock()
+        self._entries: Dict[str, _Entry] = {}
+        # (created_at, id) of every topic, ascending
+        self._order: List[Tuple[str, str]] = []
+        # XOR of _entry_sig() over all entries: changes whenever a topic file
+        # is added, removed or edited in place (see revision())
+        self._fingerprint = 0
+        self._dir_mtime: Optional[int] = None
+        self._scanned_at = 0.0
+        # bumped by our own creates/deletes (see _rescan)
+        self._generation = 0
+        self._wake = threading.Event()
+        self._rescanner_pid: Optional[int] = None
+        self._closed = False
+        self._dirty = False
+        self._saved_at = 0.0
+        self._load_index()
+        self.search_index = (
+            FileSearchIndex(search_index_path) if search_index_path else None
+        )
+        # set when the search index may lag behind the topic index
+        self._search_stale = True
 
     def _safe_id(self, filename: str) -> str:
         return Path(filename).stem
 
-    def list_topics(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
-        out = []
-        files = sorted(self.topics_dir.glob("*.md"))
-        if limit:
-            files = files[:limit]
-        for p in files:
+    def _created_at(self, p: Path, mtime: Optional[float] = None) -> str:
+        # same "YYYY-MM-DD HH:MM:SS" format as the SQLite backend
+        m = _TS_RE.match(p.stem)
+        if m:
+            return "{}-{}-{} {}:{}:{}".format(*m.groups())
+        if mtime is None:
+            try:
+                mtime = p.stat().st_mtime
+            except OSError:
+                mtime = 0
+        return datetime.utcfromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
+
+    # --- index -------------------------------------------------------------
+
+    def _dir_stat(self) -> Optional[int]:
+        try:
+            return os.stat(self.topics_dir).st_mtime_ns
+        except OSError:
+            return None
+
+    def _refresh(self) -> None:
+        """Bring the index up to date with the directory if it changed.
+
+        Only the first scan (nothing loaded yet) runs here. Otherwise this
+        is a single stat of the directory: on a change the rescan thread is
+        woken, and the periodic sweep for in-place edits runs there too, so
+        requests never wait for a stat of every file.
+        """
+        if self._dir_mtime is None and not self._entries:
+            with self._lock:
+                if self._dir_mtime is None and not self._entries:
+                    mtime = self._dir_stat()
+                    self._apply_scan(*self._scan())
+                    self._dir_mtime = mtime
+            self._maybe_save()
+        self._ensure_rescanner()
+        if self._dir_stat() != self._dir_mtime:
+            self._wake.set()
+
+    def _ensure_rescanner(self) -> None:
+        # threads do not survive fork(): start one per process on first use
+        if self._rescanner_pid == os.getpid() or self._closed:
+            return
+        with self._lock:
+            if self._rescanner_pid == os.getpid():
+                return
+            self._rescanner_pid = os.getpid()
+            self._wake = threading.Event()
+            threading.Thread(
+                target=self._rescan_loop, name="topics-rescan", daemon=True
+            ).start()
+
+    def _rescan_loop(self) -> None:
+        while not self._closed:
+            # woken by _refresh (directory changed), or the periodic sweep
+            # for in-place edits, which leave the directory mtime alone
+            self._wake.wait(self.rescan_interval)
+            self._wake.clear()
+            if self._closed:
+                return
             try:
-                with p.open("r", encoding="utf-8") as f:
-                    first = f.readline().strip()
+                self._rescan()
+                if self._search_stale:
+                    self.sync_search_index()
+                self._maybe_save()
             except Exception:
-                first = ""
-            out.append({"id": self._safe_id(p.name), "title": first})
-        return out
+                log.exception("rescan of %s failed", self.topics_dir)
+
+    def _rescan(self) -> None:
+        """Stat every file and re-read the changed ones, without the lock.
+
+        The result is swapped in under the lock; if one of our own writes
+        landed meanwhile, the scan is repeated so it cannot undo that write.
+        """
+        for _ in range(3):
+            mtime = self._dir_stat()
+            generation = self._generation
+            entries, changed = self._scan()
+            with self._lock:
+                if generation != self._generation:
+                    continue
+                self._apply_scan(entries, changed)
+                self._dir_mtime = mtime
+                return
+
+    def _scan(self) -> Tuple[Dict[str, _Entry], bool]:
+        current = self._entries
+        entries: Dict[str, _Entry] = {}
+        changed = False
+        with os.scandir(self.topics_dir) as it:
+            for de in it:
+                if not de.name.endswith(".md"):
+                    continue
+                try:
+                    st = de.stat()
+                except OSError:
+                    continue
+                tid = self._safe_id(de.name)
+                old = current.get(tid)
+                if (
+                    old is not None
+                    and old[2] == st.st_mtime_ns
+                    and old[3] == st.st_size
+                ):
+                    entries[tid] = old
+                    continue
+                try:
+                    entries[tid] = self._make_entry(Path(de.path), st)
+                except OSError:
+                    continue  # deleted meanwhile
+                changed = True
+        return entries, changed or len(entries) != len(current)
+
+    def _apply_scan(self, entries: Dict[str, _Entry], changed: bool) -> None:
+        if changed:
+            self._set_entries(entries)
+            self._dirty = True
+            self._search_stale = True
+        self._scanned_at = time.monotonic()
+
+    def _set_entries(self, entries: Dict[str, _Entry]) -> None:
+        self._entries = entries
+        self._order = sorted((e[4], tid) for tid, e in entries.items())
+        fp = 0
+        for tid, e in entries.items():
+            fp ^= _entry_sig(tid, e)
+        self._fingerprint = fp
+
+    def _make_entry(self, p: Path, st: Optional[os.stat_result] = None) -> _Entry:
+        if st is None:
+            st = p.stat()
+        return (
+            p.name,
+            self._read_title(p),
+            st.st_mtime_ns,
+            st.st_size,
+            self._created_at(p, st.st_mtime),
+        )
+
+    def _index_add(self, tid: str, entry: _Entry) -> None:
+        with self._lock:
+            old = self._entries.get(tid)
+            if old is not None:
+                self._order.remove((old[4], tid))
+                self._fingerprint ^= _entry_sig(tid, old)
+            self._entries[tid] = entry
+            self._fingerprint ^= _entry_sig(tid, entry)
+            bisect.insort(self._order, (entry[4], tid))
+            self._dirty = True
+            self._note_own_write()
+
+    def _index_remove(self, tid: str) -> None:
+        with self._lock:
+            old = self._entries.pop(tid, None)
+            if old is not None:
+                self._fingerprint ^= _entry_sig(tid, old)
+                i = bisect.bisect_left(self._order, (old[4], tid))
+                if i < len(self._order) and self._order[i] == (old[4], tid):
+                    del self._order[i]
+                self._dirty = True
+            self._note_own_write()
+
+    def _note_own_write(self) -> None:
+        self._generation += 1
+        # our own create/delete changed the directory mtime; adopt it instead
+        # of rescanning (a concurrent outside change is caught by the next
+        # periodic rescan)
+        if self._dir_mtime is not None:
+            self._dir_mtime = self._dir_stat()
+
+    def _load_index(self) -> None:
+        if self.index_path is None or not self.index_path.exists():
+            return
+        try:
+            with self.index_path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") != _INDEX_FORMAT:
+                return
+            entries = {tid: tuple(e) for tid, e in data["entries"].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            return  # unreadable sidecar: fall back to a full scan
+        self._set_entries(entries)
+        if data.get("dir_mtime_ns") == self._dir_stat():
+            # directory unchanged since the index was saved: trust it and
+            # leave the stat sweep to the next periodic rescan
+            self._dir_mtime = data["dir_mtime_ns"]
+            self._scanned_at = time.monotonic()
+
+    def save_index(self) -> None:
+        """Write the index to `index_path` (atomically) if it changed."""
+        if self.index_path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {
+                "format": _INDEX_FORMAT,
+                "dir_mtime_ns": self._dir_mtime,
+                "entries": self._entries,
+            }
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=".topics_index_", suffix=".tmp", dir=str(self.index_path.parent)
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, str(self.index_path))
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _maybe_save(self, min_interval: float = 5.0) -> None:
+        if (
+            self.index_path is not None
+            and self._dirty
+            and time.monotonic() - self._saved_at >= min_interval
+        ):
+            self.save_index()
+
+    def sync_search_index(self) -> Tuple[int, int]:
+        """Re-index topics added or changed since the search index was updated."""
+        if self.search_index is None:
+            return 0, 0
+        with self._lock:
+            self._search_stale = False
+            current = {tid: (e[2], e[3]) for tid, e in self._entries.items()}
+        return self.search_index.sync(current, self._read_text)
+
+    def _read_text(self, tid: str) -> Optional[str]:
+        entry = self._entries.get(tid)
+        if entry is None:
+            return None
+        try:
+            with (self.topics_dir / entry[0]).open("r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+        self.save_index()
+        if self.search_index is not None:
+            self.search_index.close()
+
+    # --- TopicRepository -----------------------------------------------------
+
+    def _read_title(self, p: Path) -> str:
+        try:
+            with p.open("r", encoding="utf-8") as f:
+                return f.readline().strip()
+        except Exception:
+            return ""
+
+    def list_topics(
+        self, limit: Optional[int] = None, cursor: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        self._refresh()
+        with self._lock:
+            order = self._order
+            end = len(order)
+            if cursor:
+                created_at, last_id = decode_cursor(cursor)
+                end = bisect.bisect_left(order, (created_at, str(last_id)))
+            start = max(0, end - limit) if limit else 0
+            page = order[start:end]
+            entries = self._entries
+            return [
+                {"id": tid, "title": entries[tid][1], "created_at": created_at}
+                for created_at, tid in reversed(page)
+            ]
+
+    def iter_topics(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        chunk_size: int = 500,
+    ) -> Iterator[Dict[str, Any]]:
+        self._refresh()
+        pos = (since or "", "")
+        while True:
+            with self._lock:
+                order = self._order
+                start = bisect.bisect_right(order, pos)
+                chunk = order[start : start + chunk_size]
+            for created_at, tid in chunk:
+                if until and created_at >= until:
+                    return
+                try:
+                    t = self.get_topic(tid)
+                except TopicRepoError:
+                    continue  # deleted meanwhile
+                t["created_at"] = created_at
+                yield t
+            if len(chunk) < chunk_size:
+                return
+            pos = chunk[-1]
 
     def get_topic(self, id: str) -> Dict[str, Any]:
         if not re.match(r"^[A-Za-z0-9_\-]+$", id):
@@ -60,10 +427,8 @@ class FileTopicRepository(TopicRepository):
             or "topic"
         )
         ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        filename = f"{ts}_{slug}.md"
-        dest = self.topics_dir / filename
 
-        tmp = None
+        tmp = dest = tid = None
         try:
             fd, tmp_path = tempfile.mkstemp(
                 prefix="topic_", suffix=".tmp", dir=str(self.topics_dir)
@@ -72,56 +437,161 @@ class FileTopicRepository(TopicRepository):
             with os.fdopen(fd, "w", encoding="utf-8") as f:
                 f.write(title.strip() + "\n")
                 f.write(body.strip() + "\n")
-            # atomic replace
-            os.replace(str(tmp), str(dest))
-            return self._safe_id(dest.name)
+            # non-ASCII titles all slug to "topic": several creates in the
+            # same second would share a name, so publish under a free one
+            dest = self._link_unique(tmp, f"{ts}_{slug}")
+            tmp.unlink()
+            tmp = None
+            tid = self._safe_id(dest.name)
+            entry = self._make_entry(dest)
+            self._index_add(tid, entry)
+            if self.search_index is not None:
+                self.search_index.add(
+                    tid,
+                    title.strip() + "\n" + body.strip() + "\n",
+                    entry[2],
+                    entry[3],
+                )
+            return tid
         except Exception as e:
-            if tmp and tmp.exists():
-                try:
-                    tmp.unlink()
-                except Exception:
-                    pass
+            if tid is not None:
+                # no phantom id: the file goes, so must every index entry
+                self._index_remove(tid)
+                if self.search_index is not None:
+                    try:
+                        self.search_index.remove(tid)
+                    except Exception:
+                        pass
+            for leftover in (tmp, dest):
+                if leftover and leftover.exists():
+                    try:
+                        leftover.unlink()
+                    except Exception:
+                        pass
             raise TopicRepoError(str(e))
 
+    def _link_unique(self, src: Path, stem: str) -> Path:
+        # os.link fails if the name exists, so the complete file appears
+        # under a name nobody else has (never an empty or partial one);
+        # "<stem>-2.md", "<stem>-3.md", ... are tried on collisions
+        for n in range(1, _MAX_NAME_ATTEMPTS + 1):
+            dest = self.topics_dir / (f"{stem}-{n}.md" if n > 1 else f"{stem}.md")
+            try:
+                os.link(str(src), str(dest))
+            except FileExistsError:
+                continue
+            return dest
+        raise TopicRepoError("could not find a free file name")
+
     def delete_topic(self, id: str) -> bool:
         path = self._path_for_id(id)
         if not path.exists():
             raise TopicRepoError("not found")
         try:
             path.unlink()
-            return True
         except Exception as e:
             raise TopicRepoError(str(e))
+        self._index_remove(id)
+        if self.search_index is not None:
+            self.search_index.remove(id)
+        return True
 
     def _path_for_id(self, id: str) -> Path:
-        # find matching file by stem
-        for p in self.topics_dir.glob("*.md"):
-            if p.stem == id:
-                return p
+        self._refresh()
+        entry = self._entries.get(id)
+        if entry is not None:
+            return self.topics_dir / entry[0]
         return self.topics_dir / (id + ".md")
 
     def random_topic_id(self) -> Optional[str]:
-        files = list(self.topics_dir.glob("*.md"))
-        if not files:
+        self._refresh()
+        with self._lock:
+            if not self._order:
+                return None
+            return random.choice(self._order)[1]
+
+    def list_topic_ids(self) -> List[str]:
+        self._refresh()
+        with self._lock:
+            return list(self._entries)
+
+    def revision(self) -> int:
+        # the directory mtime misses in-place edits of a topic file; the
+        # index fingerprint covers every file's mtime and size (edits are
+        # noticed on the next periodic rescan, like everywhere else)
+        self._refresh()
+        with self._lock:
+            return (len(self._entries) << 32) | self._fingerprint
+
+    def last_changed(self) -> Optional[datetime]:
+        try:
+            return datetime.fromtimestamp(
+                os.stat(self.topics_dir).st_mtime, tz=timezone.utc
+            )
+        except OSError:
             return None
-        import random
 
-        p = random.choice(files)
-        return self._safe_id(p.name)
+    def search(
+        self, query: str, limit: int = 50, offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        self._refresh()
+        # substring matching, so a `*` prefix marker changes nothing
+        terms = [normalize(t.rstrip("*")) for t in search_terms(query)]
+        if not terms:
+            return []
+        if self.search_index is None:
+            return self._scan_search(terms, limit, offset)
+        if self._search_stale:
+            self.sync_search_index()
+        out = []
+        # candidates share the longest term's n-grams; confirm against the text
+        for tid in self.search_index.candidates(max(terms, key=len)):
+            text = self._read_text(tid)
+            if text is None or not self._matches(text, terms):
+                continue
+            if offset:
+                offset -= 1
+                continue
+            out.append(self._search_hit(tid, text, terms))
+            if len(out) >= limit:
+                break
+        return out
+
+    @staticmethod
+    def _matches(text: str, terms: List[str]) -> bool:
+        folded = normalize(text)
+        return all(t in folded for t in terms)
 
-    def search(self, query: str, limit: int = 50) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _search_hit(tid: str, text: str, terms: List[str]) -> Dict[str, Any]:
+        title, _, body = text.partition("\n")
+        return {
+            "id": tid,
+            "title": title.strip(),
+            "snippet": make_snippet(body, terms),
+            "score": None,
+        }
+
+    def _scan_search(
+        self, terms: List[str], limit: int, offset: int
+    ) -> List[Dict[str, Any]]:
         out = []
-        q = query.lower()
-        for p in sorted(self.topics_dir.glob("*.md")):
-            with p.open("r", encoding="utf-8") as f:
-                lines = f.read()
-            if q in lines.lower():
-                out.append(
-                    {
-                        "id": self._safe_id(p.name),
-                        "title": lines.splitlines()[0] if lines else "",
-                    }
-                )
+        with self._lock:
+            names = sorted(e[0] for e in self._entries.values())
+        for name in names:
+            p = self.topics_dir / name
+            try:
+                f = p.open("r", encoding="utf-8")
+            except OSError:
+                continue
+            with f:
+                text = f.read()
+            if not self._matches(text, terms):
+                continue
+            if offset:
+                offset -= 1
+                continue
+            out.append(self._search_hit(self._safe_id(p.name), text, terms))
             if len(out) >= limit:
                 break
         return out
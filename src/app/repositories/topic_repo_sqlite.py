@@ -1,11 +1,23 @@
+import math
 import os
 import re
 import sqlite3
 import time
 import unicodedata
-from typing import Optional, List, Dict, Any
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any, Iterable, Iterator
 
-from .topic_repo import TopicRepository, TopicRepoError
+from .topic_repo import (
+    TopicRepository,
+    TopicRepoError,
+    decode_cursor,
+    make_snippet,
+    search_terms,
+    snippet_html,
+    MARK_START,
+    MARK_END,
+)
+from .sqlite_pool import SQLiteConnectionPool
 
 
 def _slugify(text: str) -> str:
@@ -22,19 +34,75 @@ def _slugify(text: str) -> str:
     return text.strip("-")
 
 
+# columns added after the first release; ensure_schema adds them to old DBs
+_MIGRATED_COLUMNS = {
+    "body_html": "TEXT",
+    "render_version": "TEXT",
+}
+
+
+# the trigram tokenizer needs SQLite 3.34+; older builds keep the default one
+_HAS_TRIGRAM = sqlite3.sqlite_version_info >= (3, 34, 0)
+
+# trigram queries need at least 3 characters per term
+_MIN_FTS_TERM = 3
+
+# attempts at inserting a topic before giving up on slug conflicts
+_CREATE_RETRIES = 5
+
+# per-row triggers replaced by one set-based statement during bulk inserts
+_BULK_TRIGGERS = ("topics_ai", "topics_rev_ai")
+
+# topics per transaction in create_topics_bulk (one revision bump each)
+_BULK_BATCH_SIZE = 10_000
+
+# title matches weigh more than body matches in bm25()
+_BM25_WEIGHTS = (10.0, 1.0)
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return "%" + escaped + "%"
+
+
+def _fts_term(term: str) -> str:
+    # quote every term so FTS5 syntax characters in user input are literal
+    prefix = term.endswith("*")
+    phrase = '"' + term.rstrip("*").replace('"', '""') + '"'
+    return phrase + "*" if prefix else phrase
+
+
 class SQLiteTopicRepository(TopicRepository):
-    """SQLite-backed implementation of `TopicRepository`."""
+    """SQLite-backed implementation of `TopicRepository`.
 
-    def __init__(self, db_path: Optional[str] = None):
-        self.db_path = db_path or os.environ.get("TOPICS_DB", "data/data.db")
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+    When constructed with a `renderer` (a `MarkdownRenderer`), topics are
+    rendered at write time and the sanitized HTML is stored in `body_html`
+    together with the renderer version that produced it.
+    """
 
-    def _get_conn(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES)
-        conn.row_factory = sqlite3.Row
-        # enable WAL for concurrency
-        conn.execute("PRAGMA journal_mode=WAL;")
-        return conn
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        pool: Optional[SQLiteConnectionPool] = None,
+        renderer: Optional[Any] = None,
+    ):
+        if pool is not None:
+            self.db_path = pool.db_path
+        else:
+            self.db_path = db_path or os.environ.get("TOPICS_DB", "data/data.db")
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        # connections are long-lived and shared through the pool; pragmas
+        # (WAL, synchronous, ...) are applied once per connection
+        self.pool = pool or SQLiteConnectionPool(self.db_path)
+        self.renderer = renderer
+
+    @contextmanager
+    def _conn(self) -> Iterator[sqlite3.Connection]:
+        with self.pool.connection() as conn:
+            yield conn
+
+    def close(self) -> None:
+        self.pool.close()
 
     def ensure_schema(self) -> None:
         schema_path = os.path.join(os.path.dirname(__file__), "schema_sqlite.sql")
@@ -42,57 +110,132 @@ class SQLiteTopicRepository(TopicRepository):
             raise FileNotFoundError(f"schema file not found: {schema_path}")
         with open(schema_path, "r", encoding="utf-8") as f:
             schema_sql = f.read()
-        conn = self._get_conn()
-        try:
+        if not _HAS_TRIGRAM:
+            schema_sql = schema_sql.replace(", tokenize='trigram'", "")
+        with self._conn() as conn:
+            # add new columns first so the schema's triggers can refer to them
+            self._migrate_columns(conn)
+            rebuild = self._migrate_fts(conn)
             conn.executescript(schema_sql)
+            if rebuild:
+                conn.execute("INSERT INTO topics_fts(topics_fts) VALUES ('rebuild')")
             conn.commit()
-        finally:
-            conn.close()
 
-    def list_topics(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
-        q = "SELECT id, slug, title, created_at FROM topics ORDER BY created_at DESC"
+    def _migrate_columns(self, conn: sqlite3.Connection) -> None:
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(topics)")}
+        if not existing:
+            return  # fresh database: created by the schema script
+        for name, decl in _MIGRATED_COLUMNS.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE topics ADD COLUMN {name} {decl}")
+        conn.commit()
+
+    def _migrate_fts(self, conn: sqlite3.Connection) -> bool:
+        """Drop a full-text index built with another tokenizer.
+
+        Returns True if the schema script must be followed by a rebuild.
+        Indexes from older releases were also kept in sync by triggers that
+        do not work for external-content tables, so they are rebuilt anyway.
+        """
+        row = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'topics_fts'"
+        ).fetchone()
+        if row is None or not _HAS_TRIGRAM or "trigram" in (row[0] or "").lower():
+            return False
+        conn.execute("DROP TABLE topics_fts")
+        conn.commit()
+        return True
+
+    def rebuild_search_index(self) -> int:
+        """Rebuild `topics_fts` from the topics table and merge its segments.
+
+        Returns the number of indexed topics.
+        """
+        with self._conn() as conn:
+            conn.execute("INSERT INTO topics_fts(topics_fts) VALUES ('rebuild')")
+            conn.execute("INSERT INTO topics_fts(topics_fts) VALUES ('optimize')")
+            conn.commit()
+            return conn.execute("SELECT COUNT(*) FROM topics").fetchone()[0]
+
+    def list_topics(
+        self, limit: Optional[int] = None, cursor: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        q = "SELECT id, slug, title, created_at FROM topics"
+        params: list = []
+        if cursor:
+            created_at, last_id = decode_cursor(cursor)
+            try:
+                last_id = int(last_id)
+            except (TypeError, ValueError):
+                raise TopicRepoError("invalid cursor")
+            # row-value comparison lets SQLite seek topics_created_at_id
+            q += " WHERE (created_at, id) < (?, ?)"
+            params += [created_at, last_id]
+        q += " ORDER BY created_at DESC, id DESC"
         if limit:
-            q += f" LIMIT {int(limit)}"
-        conn = self._get_conn()
-        try:
-            cur = conn.execute(q)
+            q += " LIMIT ?"
+            params.append(int(limit))
+        with self._conn() as conn:
+            cur = conn.execute(q, params)
             return [dict(row) for row in cur.fetchall()]
-        finally:
-            conn.close()
+
+    def iter_topics(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        chunk_size: int = 500,
+    ) -> Iterator[Dict[str, Any]]:
+        # keyset chunks on topics_created_at_id: no connection or read
+        # snapshot is held while the consumer (e.g. a slow client) works
+        q = "SELECT id, slug, title, body, created_at, updated_at FROM topics WHERE (created_at, id) > (?, ?)"
+        params: list = [since or "", 0]
+        if until:
+            q += " AND created_at < ?"
+            params.append(until)
+        q += " ORDER BY created_at, id LIMIT ?"
+        params.append(chunk_size)
+        while True:
+            with self._conn() as conn:
+                rows = conn.execute(q, params).fetchall()
+            for row in rows:
+                yield dict(row)
+            if len(rows) < chunk_size:
+                return
+            params[0], params[1] = rows[-1]["created_at"], rows[-1]["id"]
 
     def get_topic(self, topic_id: int) -> Optional[Dict[str, Any]]:
-        conn = self._get_conn()
-        try:
+        with self._conn() as conn:
             cur = conn.execute(
-                "SELECT id, slug, title, body, created_at, updated_at FROM topics WHERE id = ?",
+                "SELECT id, slug, title, body, created_at, updated_at, body_html, render_version FROM topics WHERE id = ?",
                 (topic_id,),
             )
             row = cur.fetchone()
             return dict(row) if row else None
-        finally:
-            conn.close()
-
-    def _unique_slug(self, base: str) -> str:
-        slug = base or str(int(time.time()))
-        if not slug:
-            slug = str(int(time.time()))
-        conn = self._get_conn()
-        try:
-            cur = conn.execute("SELECT 1 FROM topics WHERE slug = ? LIMIT 1", (slug,))
-            if not cur.fetchone():
-                return slug
-            # append numeric suffix until unique
-            i = 1
-            while True:
-                candidate = f"{slug}-{i}"
-                cur = conn.execute(
-                    "SELECT 1 FROM topics WHERE slug = ? LIMIT 1", (candidate,)
-                )
-                if not cur.fetchone():
-                    return candidate
-                i += 1
-        finally:
-            conn.close()
+
+    def _slug_state(self, conn: sqlite3.Connection, base: str):
+        """Return (is `base` taken, highest numeric `base-N` suffix or 0).
+
+        One query: both lookups are range scans of the slug UNIQUE index
+        (`base-` .. `base.` covers every `base-...` slug, since '.' follows
+        '-').
+        """
+        n = len(base) + 2  # first character of the suffix
+        row = conn.execute(
+            "SELECT EXISTS (SELECT 1 FROM topics WHERE slug = ?),"
+            " (SELECT MAX(CAST(substr(slug, ?) AS INTEGER)) FROM topics"
+            "  WHERE slug > ? AND slug < ?"
+            "  AND substr(slug, ?) <> '' AND substr(slug, ?) NOT GLOB '*[^0-9]*')",
+            (base, n, base + "-", base + ".", n, n),
+        ).fetchone()
+        return bool(row[0]), row[1] or 0
+
+    def _unique_slug(self, conn: sqlite3.Connection, base: str) -> str:
+        """Return `base`, or `base-N` with N one past the highest suffix in use.
+
+        Run it inside the inserting transaction.
+        """
+        taken, suffix = self._slug_state(conn, base)
+        return f"{base}-{suffix + 1}" if taken else base
 
     def create_topic(
         self,
@@ -105,78 +248,323 @@ class SQLiteTopicRepository(TopicRepository):
         base = _slugify(slug or title)
         if not base:
             base = str(int(time.time()))
-        slug_final = self._unique_slug(base)
-        conn = self._get_conn()
-        try:
-            cur = conn.execute(
-                "INSERT INTO topics (slug, title, body) VALUES (?, ?, ?)",
-                (slug_final, title, body),
-            )
-            conn.commit()
-            return cur.lastrowid
-        finally:
-            conn.close()
+        body_html, render_version = self._render(body)
+        with self._conn() as conn:
+            for attempt in range(_CREATE_RETRIES):
+                # take the write lock up front so the slug we pick is still
+                # free when we insert it
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    slug_final = self._unique_slug(conn, base)
+                    cur = conn.execute(
+                        "INSERT INTO topics (slug, title, body, body_html, render_version) VALUES (?, ?, ?, ?, ?)",
+                        (slug_final, title, body, body_html, render_version),
+                    )
+                    conn.commit()
+                    return cur.lastrowid
+                except sqlite3.IntegrityError as e:
+                    conn.rollback()
+                    # slug taken by a writer that bypassed the lock: pick
+                    # again; any other constraint fails the same way each time
+                    if "topics.slug" not in str(e):
+                        raise
+                except BaseException:
+                    conn.rollback()
+                    raise
+        raise TopicRepoError(f"could not allocate a unique slug for {base!r}")
+
+    def create_topics_bulk(
+        self,
+        topics: Iterable[Dict[str, Any]],
+        batch_size: int = _BULK_BATCH_SIZE,
+        render: bool = True,
+    ) -> List[int]:
+        """Insert many topics in large transactions; returns the new ids in order.
+
+        Each item needs `title` and `body` and may carry `slug` and
+        `created_at` ("YYYY-MM-DD HH:MM:SS", UTC). Every `batch_size` topics
+        are inserted with one `executemany` in one IMMEDIATE transaction,
+        during which the per-row FTS and revision triggers are replaced by a
+        single FTS insert and a single revision bump. A batch is atomic;
+        batches committed before an error stay. With `render=False` no HTML
+        is stored (see `rerender_stale` / tools/backfill_topic_html.py).
+        """
+        ids: List[int] = []
+        batch: List[Dict[str, Any]] = []
+        for topic in topics:
+            batch.append(topic)
+            if len(batch) >= batch_size:
+                ids += self._insert_batch(batch, render)
+                batch = []
+        if batch:
+            ids += self._insert_batch(batch, render)
+        return ids
+
+    def _insert_batch(self, batch: List[Dict[str, Any]], render: bool) -> List[int]:
+        items = []
+        for n, t in enumerate(batch):
+            title, body = t.get("title"), t.get("body")
+            if not title or not body:
+                raise ValueError(f"topic {n}: title and body are required")
+            base = _slugify(t.get("slug") or title) or str(int(time.time()))
+            html, version = self._render(body) if render else (None, None)
+            items.append((base, title, body, html, version, t.get("created_at")))
+        with self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                triggers = conn.execute(
+                    "SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"
+                    f" AND name IN ({', '.join('?' for _ in _BULK_TRIGGERS)})",
+                    _BULK_TRIGGERS,
+                ).fetchall()
+                for row in triggers:
+                    conn.execute(f"DROP TRIGGER {row['name']}")
+                last_id = conn.execute(
+                    "SELECT COALESCE(MAX(id), 0) FROM topics"
+                ).fetchone()[0]
+                used: set = set()
+                next_suffix: Dict[str, int] = {}
+                rows = []
+                for base, title, body, html, version, created_at in items:
+                    slug = self._bulk_slug(conn, base, used, next_suffix)
+                    rows.append((slug, title, body, html, version, created_at))
+                conn.executemany(
+                    "INSERT INTO topics (slug, title, body, body_html, render_version, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, COALESCE(?, datetime('now')))",
+                    rows,
+                )
+                # AUTOINCREMENT: everything above the old maximum is this batch
+                names = {row["name"] for row in triggers}
+                if "topics_ai" in names:
+                    conn.execute(
+                        "INSERT INTO topics_fts(rowid, title, body)"
+                        " SELECT id, title, body FROM topics WHERE id > ?",
+                        (last_id,),
+                    )
+                if "topics_rev_ai" in names:
+                    conn.execute(
+                        "UPDATE topics_revision SET revision = revision + 1,"
+                        " changed_at = datetime('now') WHERE id = 1"
+                    )
+                for row in triggers:
+                    conn.execute(row["sql"])
+                ids = [
+                    r[0]
+                    for r in conn.execute(
+                        "SELECT id FROM topics WHERE id > ? ORDER BY id", (last_id,)
+                    )
+                ]
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        return ids
+
+    def _bulk_slug(
+        self,
+        conn: sqlite3.Connection,
+        base: str,
+        used: set,
+        next_suffix: Dict[str, int],
+    ) -> str:
+        # like _unique_slug, but also avoids slugs handed out earlier in the
+        # same batch (not inserted yet, so invisible to the query); the DB is
+        # asked once per distinct base
+        if base not in next_suffix:
+            taken, suffix = self._slug_state(conn, base)
+            next_suffix[base] = suffix + 1
+            if not taken and base not in used:
+                used.add(base)
+                return base
+        while True:
+            slug = f"{base}-{next_suffix[base]}"
+            next_suffix[base] += 1
+            if slug not in used:
+                used.add(slug)
+                return slug
+
+    def _render(self, body: str):
+        if self.renderer is None:
+            return None, None
+        return self.renderer.render(body), self.renderer.version
+
+    def rerender_stale(
+        self,
+        batch_size: int = 500,
+        force: bool = False,
+        max_batches: Optional[int] = None,
+    ) -> int:
+        """Re-render `body_html` for rows rendered by another renderer version.
+
+        Works through the table in id order, `batch_size` rows per transaction,
+        so writers are never blocked for long. With `force` every row is
+        re-rendered. Returns the number of rows updated.
+        """
+        if self.renderer is None:
+            raise TopicRepoError("no renderer configured")
+        version = self.renderer.version
+        last_id = 0
+        updated = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            with self._conn() as conn:
+                if force:
+                    rows = conn.execute(
+                        "SELECT id, body FROM topics WHERE id > ? ORDER BY id LIMIT ?",
+                        (last_id, batch_size),
+                    ).fetchall()
+                else:
+                    rows = conn.execute(
+                        "SELECT id, body FROM topics WHERE id > ? AND render_version IS NOT ? ORDER BY id LIMIT ?",
+                        (last_id, version, batch_size),
+                    ).fetchall()
+                if not rows:
+                    break
+                # render outside the write transaction
+                params = [
+                    (self.renderer.render(row["body"]), version, row["id"])
+                    for row in rows
+                ]
+                conn.executemany(
+                    "UPDATE topics SET body_html = ?, render_version = ? WHERE id = ?",
+                    params,
+                )
+                conn.commit()
+            updated += len(rows)
+            last_id = rows[-1]["id"]
+            batches += 1
+        return updated
 
     def delete_topic(self, id):
         return self.hard_delete(id)
 
     def soft_delete(self, topic_id: int) -> bool:
-        conn = self._get_conn()
-        try:
-            conn.execute(
-                "",
-                (topic_id,),
-            )
-            conn.commit()
-        except Exception:
-            return False
-        finally:
-            conn.close()
+        with self._conn() as conn:
+            try:
+                conn.execute(
+                    "",
+                    (topic_id,),
+                )
+                conn.commit()
+            except Exception:
+                return False
         return True
 
     def hard_delete(self, topic_id: int) -> bool:
-        conn = self._get_conn()
-        try:
-            conn.execute(
-                "DELETE FROM topics WHERE id = ?",
-                (topic_id,),
-            )
-            conn.commit()
-        except Exception:
-            return False
-        finally:
-            conn.close()
+        with self._conn() as conn:
+            try:
+                conn.execute(
+                    "DELETE FROM topics WHERE id = ?",
+                    (topic_id,),
+                )
+                conn.commit()
+            except Exception:
+                return False
         return True
 
     def random_topic_id(self) -> Optional[int]:
-        conn = self._get_conn()
-        try:
+        with self._conn() as conn:
             cur = conn.execute("SELECT id FROM topics ORDER BY RANDOM() LIMIT 1")
             row = cur.fetchone()
             return int(row["id"]) if row else None
-        finally:
-            conn.close()
 
-    def search(self, query: str, limit: int = 50) -> List[Dict[str, Any]]:
-        conn = self._get_conn()
-        try:
-            # prefer FTS if available
+    def list_topic_ids(self) -> List[int]:
+        with self._conn() as conn:
+            return [row[0] for row in conn.execute("SELECT id FROM topics")]
+
+    def revision(self) -> int:
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT revision FROM topics_revision WHERE id = 1"
+            ).fetchone()
+            return int(row[0]) if row else 0
+
+    def revision_step(
+        self, created: int = 0, deleted: int = 0, bulk: bool = False
+    ) -> Optional[int]:
+        # triggers bump once per row; bulk inserts once per batch
+        if bulk:
+            return math.ceil(created / _BULK_BATCH_SIZE) + deleted
+        return created + deleted
+
+    def last_changed(self) -> Optional[str]:
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT changed_at FROM topics_revision WHERE id = 1"
+            ).fetchone()
+            return row[0] if row else None
+
+    def search(
+        self, query: str, limit: int = 50, offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        terms = search_terms(query)
+        if not terms:
+            return []
+        # trigram FTS handles terms of 3+ characters; shorter ones (common in
+        # Japanese, e.g. 2-kanji words) are checked with LIKE on the matches
+        long_terms = [t for t in terms if len(t.rstrip("*")) >= _MIN_FTS_TERM]
+        short_terms = [t.rstrip("*") for t in terms if t not in long_terms]
+        if not long_terms:
+            return self._like_search(short_terms, limit, offset)
+        like_sql = "".join(
+            " AND (t.title LIKE ? ESCAPE '\\' OR t.body LIKE ? ESCAPE '\\')"
+            for _ in short_terms
+        )
+        sql = (
+            "SELECT t.id, t.title,"
+            " snippet(topics_fts, -1, ?, ?, '…', 24) AS snippet,"
+            " bm25(topics_fts, ?, ?) AS score"
+            " FROM topics_fts JOIN topics t ON t.id = topics_fts.rowid"
+            f" WHERE topics_fts MATCH ?{like_sql}"
+            " ORDER BY score, t.id LIMIT ? OFFSET ?"
+        )
+        params: list = [MARK_START, MARK_END, *_BM25_WEIGHTS]
+        params.append(" ".join(_fts_term(t) for t in long_terms))
+        for t in short_terms:
+            params += [_like_pattern(t)] * 2
+        params += [limit, offset]
+        with self._conn() as conn:
             try:
-                cur = conn.execute(
-                    "SELECT topics.id, topics.title FROM topics JOIN topics_fts ON topics_fts.rowid = topics.id WHERE topics_fts MATCH ? LIMIT ?",
-                    (query, limit),
-                )
-                return [dict(r) for r in cur.fetchall()]
+                rows = conn.execute(sql, params).fetchall()
             except sqlite3.OperationalError:
-                # fallback to LIKE search
-                q = "%" + query.replace("%", "\%") + "%"
-                cur = conn.execute(
-                    "SELECT id, title FROM topics WHERE (title LIKE ? OR body LIKE ?) LIMIT ?",
-                    (q, q, limit),
-                )
-                return [dict(r) for r in cur.fetchall()]
-        finally:
-            conn.close()
+                # no usable FTS index (e.g. SQLite built without FTS5)
+                return self._like_search([t.rstrip("*") for t in terms], limit, offset)
+        return [
+            {
+                "id": row["id"],
+                "title": row["title"],
+                "snippet": snippet_html(row["snippet"]),
+                # bm25() is lower-is-better; expose higher-is-better
+                "score": -row["score"],
+            }
+            for row in rows
+        ]
+
+    def _like_search(
+        self, terms: List[str], limit: int, offset: int
+    ) -> List[Dict[str, Any]]:
+        # full scan, newest first; only used for short or unindexable queries
+        where = " AND ".join(
+            "(title LIKE ? ESCAPE '\\' OR body LIKE ? ESCAPE '\\')" for _ in terms
+        )
+        params: list = []
+        for t in terms:
+            params += [_like_pattern(t)] * 2
+        with self._conn() as conn:
+            rows = conn.execute(
+                f"SELECT id, title, body FROM topics WHERE {where}"
+                " ORDER BY id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return [
+            {
+                "id": row["id"],
+                "title": row["title"],
+                "snippet": make_snippet(row["body"], terms),
+                "score": None,
+            }
+            for row in rows
+        ]
 
 
 # Backwards-compatible exports: many modules import TopicRepository from this module.
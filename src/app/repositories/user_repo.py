@@ -33,6 +33,10 @@ class UserRepository(ABC):
     ) -> bool:
         """Change a user's password. Return True on success."""
 
+    @abstractmethod
+    def set_roles(self, username: str, roles: list) -> bool:
+        """Replace a user's roles. Return True if the user exists."""
+
     @abstractmethod
     def delete_user(self, username: str) -> bool:
         """Delete a user. Return True if a row was deleted."""
@@ -1,60 +1,79 @@
 from __future__ import annotations
 
+import logging
 import sqlite3
-from typing import Optional, Dict
+from contextlib import contextmanager
+from typing import Iterator, Optional, Dict, Any
 from datetime import datetime
 
-from app.utils.password_manager import PasswordManager
+from app.utils.password_manager import HashingBusy, PasswordManager
+from app.utils.ttl_cache import TTLCache
 from app.repositories.user_repo import UserRepository
+from app.repositories.sqlite_pool import SQLiteConnectionPool
+
+log = logging.getLogger(__name__)
 
 
 class SQLiteUserRepository(UserRepository):
     """SQLite-backed implementation of `UserRepository`.
 
     Uses the `users` table and `PasswordManager` for hashing and verification.
+    Connections come from a long-lived pool, and user records (with parsed
+    roles) are kept in a TTL/LRU cache keyed by username for role lookups.
+    Changes made through this repository invalidate the cache at once;
+    changes made by other processes show up after at most `cache_ttl`
+    seconds. Password checks always read the database, so a changed
+    password or a deleted account takes effect in every worker at once.
     """
 
-    def __init__(self, db_path: str, password_manager: PasswordManager):
+    def __init__(
+        self,
+        db_path: str,
+        password_manager: PasswordManager,
+        pool: Optional[SQLiteConnectionPool] = None,
+        cache_size: int = 1024,
+        cache_ttl: float = 30.0,
+    ):
         self.db_path = db_path
         self.pwm = password_manager
+        self.pool = pool or SQLiteConnectionPool(db_path, max_size=4)
+        self.cache = TTLCache(max_entries=cache_size, ttl=cache_ttl)
         self._ensure_table()
 
-    def _get_conn(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+    @contextmanager
+    def _conn(self) -> Iterator[sqlite3.Connection]:
+        with self.pool.connection() as conn:
+            yield conn
+
+    def close(self) -> None:
+        self.pool.close()
 
     def _ensure_table(self) -> None:
-        conn = self._get_conn()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              username TEXT NOT NULL UNIQUE,
-              password_hash TEXT NOT NULL,
-              salt TEXT NOT NULL,
-              created_at DATETIME NOT NULL DEFAULT (datetime('now')),
-              updated_at DATETIME,
-              roles TEXT NOT NULL DEFAULT ''
-            );
-            """
-        )
-        conn.commit()
-        conn.close()
+        with self._conn() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS users (
+                  id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  username TEXT NOT NULL UNIQUE,
+                  password_hash TEXT NOT NULL,
+                  salt TEXT NOT NULL,
+                  created_at DATETIME NOT NULL DEFAULT (datetime('now')),
+                  updated_at DATETIME,
+                  roles TEXT NOT NULL DEFAULT ''
+                );
+                """
+            )
+            conn.commit()
 
     def create_user(
         self, username: str, password: str, roles: list | None = None
     ) -> int:
         """Create a new user. Returns the inserted user id."""
-        salt = self.pwm.generate_salt()
-        password_hash = self.pwm.hash_password(password, salt)
-        conn = self._get_conn()
-        cur = conn.cursor()
-        try:
-            roles = roles or ["user"]
-            roles_str = ",".join(roles)
-            cur.execute(
+        salt, password_hash = self.pwm.new_hash(password)
+        roles = roles or ["user"]
+        roles_str = ",".join(roles)
+        with self._conn() as conn:
+            cur = conn.execute(
                 "INSERT INTO users (username, password_hash, salt, created_at, roles) VALUES (?, ?, ?, ?, ?)",
                 (
                     username,
@@ -66,16 +85,28 @@ class SQLiteUserRepository(UserRepository):
             )
             conn.commit()
             user_id = cur.lastrowid
-        finally:
-            conn.close()
+        self.cache.invalidate(username)
         return user_id
 
     def get_user(self, username: str) -> Optional[Dict]:
-        conn = self._get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM users WHERE username = ?", (username,))
-        row = cur.fetchone()
-        conn.close()
+        found, user = self.cache.lookup(username)
+        if not found:
+            user = self._load_user(username)
+            if user is None:
+                # not cached: a user registered through another worker must
+                # be able to log in here right away
+                return None
+            self.cache.put(username, user)
+        # callers may modify the record; keep the cached one intact
+        d = dict(user)
+        d["roles"] = list(user["roles"])
+        return d
+
+    def _load_user(self, username: str) -> Optional[Dict[str, Any]]:
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT * FROM users WHERE username = ?", (username,)
+            ).fetchone()
         if not row:
             return None
         d = dict(row)
@@ -85,15 +116,39 @@ class SQLiteUserRepository(UserRepository):
         return d
 
     def verify_user(self, username: str, password: str) -> bool:
-        user = self.get_user(username)
+        # uncached: the cache of this worker may still hold a hash changed or
+        # a user deleted through another one (PBKDF2 dominates the cost anyway)
+        user = self._load_user(username)
         if not user:
             return False
-        return self.pwm.verify_password(password, user["salt"], user["password_hash"])
+        if not self.pwm.verify_password(password, user["salt"], user["password_hash"]):
+            return False
+        if self.pwm.needs_rehash(user["password_hash"]):
+            # the plain password is only known now: upgrade legacy hashes and
+            # hashes made with an older scheme/cost
+            try:
+                self._rehash(username, password, user["password_hash"])
+            except HashingBusy:
+                # the password was right; a full hashing queue must not turn
+                # the login into a 503. The upgrade happens on a later login
+                log.info("password rehash for %r skipped: hashing busy", username)
+        return True
+
+    def _rehash(self, username: str, password: str, old_hash: str) -> None:
+        new_salt, new_hash = self.pwm.new_hash(password)
+        with self._conn() as conn:
+            # only if the hash is unchanged (no concurrent password change)
+            conn.execute(
+                "UPDATE users SET salt = ?, password_hash = ? WHERE username = ? AND password_hash = ?",
+                (new_salt, new_hash, username, old_hash),
+            )
+            conn.commit()
+        self.cache.invalidate(username)
 
     def change_password(
         self, username: str, old_password: str, new_password: str
     ) -> bool:
-        user = self.get_user(username)
+        user = self._load_user(username)  # uncached, see verify_user
         if not user:
             return False
         try:
@@ -102,24 +157,36 @@ class SQLiteUserRepository(UserRepository):
             )
         except ValueError:
             return False
-        conn = self._get_conn()
-        cur = conn.cursor()
-        cur.execute(
-            "UPDATE users SET salt = ?, password_hash = ? WHERE username = ?",
-            (new_salt, new_hash, username),
-        )
-        conn.commit()
-        conn.close()
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE users SET salt = ?, password_hash = ?, updated_at = ? WHERE username = ?",
+                (new_salt, new_hash, datetime.utcnow().isoformat(), username),
+            )
+            conn.commit()
+        self.cache.invalidate(username)
         return True
 
+    def set_roles(self, username: str, roles: list) -> bool:
+        with self._conn() as conn:
+            cur = conn.execute(
+                "UPDATE users SET roles = ?, updated_at = ? WHERE username = ?",
+                (",".join(roles), datetime.utcnow().isoformat(), username),
+            )
+            conn.commit()
+            changed = cur.rowcount
+        self.cache.invalidate(username)
+        return bool(changed)
+
     def delete_user(self, username: str) -> bool:
-        conn = self._get_conn()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM users WHERE username = ?", (username,))
-        changed = cur.rowcount
-        conn.commit()
-        conn.close()
+        with self._conn() as conn:
+            cur = conn.execute("DELETE FROM users WHERE username = ?", (username,))
+            conn.commit()
+            changed = cur.rowcount
+        self.cache.invalidate(username)
         return bool(changed)
 
+    def stats(self) -> Dict[str, Any]:
+        return {"cache": self.cache.stats(), "pool": self.pool.stats()}
+
 
 __all__ = ["SQLiteUserRepository"]
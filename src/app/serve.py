@@ -0,0 +1,123 @@
+"""
+Production entry point: serve `create_app` with gunicorn.
+
+The app is built once in the master process (imports, schema setup, the
+topic index) and then forked into `WEB_WORKERS` processes with
+`WEB_THREADS` threads each. Workers are replaced after about
+`WEB_MAX_REQUESTS` requests (plus random jitter, so they do not all
+restart together). `kill -HUP <master pid>` replaces all workers
+gracefully; since the app is preloaded, code changes need a full restart.
+
+Omikuji decks are shared by the workers through STATE_DB with the SQLite
+topic backend; with the file backend they are per process, so deck mode
+needs WEB_WORKERS=1 there. Rate limit buckets are shared through STATE_DB
+as well (without it each worker gets 1/WEB_WORKERS of every rate), and the
+ADMISSION_MAX_* caps are split between the workers.
+
+Usage:
+  PYTHONPATH=src python -m app.serve
+
+Environment: PORT (8000), WEB_WORKERS (2 * CPUs + 1), WEB_THREADS (4),
+WEB_MAX_REQUESTS (2000), WEB_MAX_REQUESTS_JITTER (200), WEB_TIMEOUT (30),
+WEB_GRACEFUL_TIMEOUT (30), WEB_KEEPALIVE (5), METRICS_DIR (a fresh temp
+directory; workers share their metrics through it), plus the app settings
+read by `create_app`.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import tempfile
+from typing import Any, Dict
+
+from gunicorn.app.base import BaseApplication
+
+from . import create_app
+from .main import _get_default_topics_dir
+from .utils.metrics import clear_directory
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def options_from_env() -> Dict[str, Any]:
+    """gunicorn settings for this app, overridable through the environment."""
+    threads = _env_int("WEB_THREADS", 4)
+    return {
+        "bind": f"0.0.0.0:{_env_int('PORT', 8000)}",
+        "workers": _env_int("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1),
+        "threads": threads,
+        "worker_class": "gthread" if threads > 1 else "sync",
+        # build the app once before forking
+        "preload_app": True,
+        # recycle workers to bound slow memory growth
+        "max_requests": _env_int("WEB_MAX_REQUESTS", 2000),
+        "max_requests_jitter": _env_int("WEB_MAX_REQUESTS_JITTER", 200),
+        "timeout": _env_int("WEB_TIMEOUT", 30),
+        "graceful_timeout": _env_int("WEB_GRACEFUL_TIMEOUT", 30),
+        "keepalive": _env_int("WEB_KEEPALIVE", 5),
+        "accesslog": os.environ.get("WEB_ACCESS_LOG", "-"),
+        "pre_fork": _pre_fork,
+        "child_exit": _child_exit,
+    }
+
+
+def _pools(app):
+    # every SQLite connection pool the app holds
+    pools = [app.topics_pool, app.state_pool, getattr(app.user_repo, "pool", None)]
+    search_index = getattr(app.services.topic_repo, "search_index", None)
+    pools.append(getattr(search_index, "pool", None))
+    return [p for p in pools if p is not None]
+
+
+def _pre_fork(server, worker) -> None:
+    # SQLite connections must not cross fork(): close the master's idle
+    # ones so workers open their own on first use
+    for pool in _pools(server.app.application):
+        pool.drain()
+
+
+def _child_exit(server, worker) -> None:
+    # keep the request counts of recycled workers in /metrics
+    metrics = server.app.application.metrics
+    if metrics is not None:
+        metrics.process_exited(worker.pid)
+
+
+class OmikujiServer(BaseApplication):
+    def __init__(self, application, options: Dict[str, Any]):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def run() -> None:
+    topics_dir = os.environ.get("TOPICS_DIR", _get_default_topics_dir())
+    metrics_dir = os.environ.get("METRICS_DIR")
+    if metrics_dir:
+        # numbers of a previous run
+        clear_directory(metrics_dir)
+    else:
+        metrics_dir = tempfile.mkdtemp(prefix="omikuji-metrics-")
+    options = options_from_env()
+    app = create_app(
+        {
+            "TOPICS_DIR": topics_dir,
+            "METRICS_DIR": metrics_dir,
+            "WEB_WORKERS": options["workers"],
+        }
+    )
+    OmikujiServer(app, options).run()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from flask import Flask, g, jsonify, make_response, request, session
+
+from ..utils.rate_limit import (
+    ConcurrencyLimiter,
+    RateLimiter,
+    SQLiteRateLimiter,
+    parse_rate,
+)
+
+
+def _parse_rule(rule: str) -> Tuple[Optional[str], str]:
+    # "POST auth.login" -> ("POST", "auth.login"); "auth.login" -> any method
+    method, _, endpoint = rule.strip().rpartition(" ")
+    return (method.strip().upper() or None), endpoint
+
+
+class AdmissionControl:
+    """Per-client rate limits and concurrency caps, checked before each request.
+
+    * `rate_limits` maps a rule ("POST auth.login", or an endpoint alone for
+      every method) to a rate ("10/minute"); each client IP and each
+      logged-in user gets its own token bucket. Over the limit: 429.
+    * `heavy` rules name CPU-heavy routes; at most `max_heavy` of them run
+      at once. Over the cap: 503, so cheap routes keep their threads.
+    * `max_in_flight` optionally caps all requests of the process: 503.
+
+    Rejections carry Retry-After. With `state_pool` (STATE_DB) the token
+    buckets are shared by all worker processes; without it each of the
+    `workers` processes gets 1/workers of every rate. The concurrency caps
+    are whole-server numbers split evenly between the `workers` processes
+    (at least 1 each). Buckets are bounded to `max_keys` per rule.
+    """
+
+    def __init__(
+        self,
+        rate_limits: Mapping[str, str],
+        heavy: Iterable[str] = (),
+        max_heavy: int = 4,
+        max_in_flight: int = 0,
+        max_keys: int = 10_000,
+        state_pool: Optional[Any] = None,
+        workers: int = 1,
+    ):
+        workers = max(1, int(workers))
+        self.limiters: Dict[Tuple[Optional[str], str], Any] = {}
+        for rule, spec in (rate_limits or {}).items():
+            rate, burst = parse_rate(spec)
+            if state_pool is not None:
+                limiter = SQLiteRateLimiter(
+                    state_pool, rule.strip(), rate, burst, max_keys
+                )
+            else:
+                limiter = RateLimiter(
+                    rate / workers, max(1.0, burst / workers), max_keys
+                )
+            self.limiters[_parse_rule(rule)] = limiter
+        self.heavy_rules = frozenset(_parse_rule(r) for r in heavy)
+        self.heavy = (
+            ConcurrencyLimiter(math.ceil(max_heavy / workers))
+            if max_heavy > 0
+            else None
+        )
+        self.in_flight = (
+            ConcurrencyLimiter(math.ceil(max_in_flight / workers))
+            if max_in_flight > 0
+            else None
+        )
+
+    def init_app(self, app: Flask) -> None:
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.admission = self
+
+    @staticmethod
+    def _matches(rules, method: str, endpoint: str) -> bool:
+        return (method, endpoint) in rules or (None, endpoint) in rules
+
+    def _rate_limiters(self, method: str, endpoint: str) -> List[Any]:
+        found = (
+            self.limiters.get((method, endpoint)),
+            self.limiters.get((None, endpoint)),
+        )
+        return [l for l in found if l is not None]
+
+    def _before_request(self):
+        endpoint = request.endpoint
+        if endpoint is None or endpoint == "static":
+            return None
+        method = request.method
+        # per-client limits first: cheap, and a flooding client should not
+        # take concurrency slots from everyone else
+        limiters = self._rate_limiters(method, endpoint)
+        # tokens taken so far; handed back if the request is rejected anyway,
+        # so a rejected request never costs the client its rate budget
+        charged: List[Tuple[Any, Tuple[str, Any]]] = []
+        if limiters:
+            clients = [("ip", request.remote_addr)]
+            if session.get("username"):
+                clients.append(("user", session["username"]))
+            wait = 0.0
+            for limiter in limiters:
+                for client in clients:
+                    w = limiter.hit(client)
+                    if w > 0:
+                        wait = max(wait, w)
+                    else:
+                        charged.append((limiter, client))
+            if wait > 0:
+                _refund(charged)
+                return _reject(429, wait, "リクエストが多すぎます")
+        if self.in_flight is not None:
+            if not self.in_flight.try_acquire():
+                _refund(charged)
+                return _reject(503, 1, "混雑しています")
+            g.admission_in_flight = True
+        if self.heavy is not None and self._matches(self.heavy_rules, method, endpoint):
+            if not self.heavy.try_acquire():
+                _refund(charged)
+                return _reject(503, 1, "混雑しています")
+            g.admission_heavy = True
+        return None
+
+    def _teardown_request(self, exc=None) -> None:
+        if g.pop("admission_heavy", False):
+            self.heavy.release()
+        if g.pop("admission_in_flight", False):
+            self.in_flight.release()
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "rate_limits": {
+                f"{method or '*'} {endpoint}": limiter.stats()
+                for (method, endpoint), limiter in self.limiters.items()
+            }
+        }
+        if self.heavy is not None:
+            out["heavy"] = self.heavy.stats()
+        if self.in_flight is not None:
+            out["in_flight"] = self.in_flight.stats()
+        return out
+
+
+def _refund(charged: List[Tuple[Any, Tuple[str, Any]]]) -> None:
+    for limiter, client in charged:
+        limiter.refund(client)
+
+
+def _reject(status: int, retry_after: float, message: str):
+    if request.accept_mimetypes.accept_html:
+        resp = make_response(message, status)
+        resp.mimetype = "text/plain"
+    else:
+        resp = make_response(jsonify({"error": message}), status)
+    resp.headers["Retry-After"] = str(max(1, math.ceil(min(retry_after, 86400))))
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+__all__ = ["AdmissionControl"]
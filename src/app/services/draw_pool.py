@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+log = logging.getLogger(__name__)
+
+
+class DrawPool:
+    """Ring buffer of prepared omikuji results, refilled on a daemon thread.
+
+    `produce()` draws a topic and returns its ready-to-send result (a dict
+    with at least "id"), or None. `pop()` hands out a prepared result without
+    touching the database or the renderer; when the buffer drops to
+    `low_water` the producer tops it up to `capacity` again.
+
+    `clear()` forgets everything (e.g. topics were changed elsewhere) and also
+    discards results that were being prepared at that moment. The producer
+    thread is started on first use in each process, so it survives a fork of
+    a preloaded app.
+    """
+
+    def __init__(
+        self,
+        produce: Callable[[], Optional[Dict[str, Any]]],
+        capacity: int = 256,
+        low_water: Optional[int] = None,
+        retry_delay: float = 1.0,
+    ):
+        self.produce = produce
+        self.capacity = max(1, int(capacity))
+        self.low_water = (
+            self.capacity // 2
+            if low_water is None
+            else min(int(low_water), self.capacity - 1)
+        )
+        self.retry_delay = retry_delay
+        self._items: "deque[Dict[str, Any]]" = deque(maxlen=self.capacity)
+        self._cond = threading.Condition()
+        # bumped by clear(); results prepared under an older one are dropped
+        self._generation = 0
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.dropped = 0
+        self.clears = 0
+        self.produced = 0
+        self.refills = 0
+        self.errors = 0
+        self.last_refill_seconds = 0.0
+        self.max_refill_seconds = 0.0
+        self._refill_seconds_total = 0.0
+        self._produce_seconds_total = 0.0
+
+    def _ensure_thread(self) -> None:
+        # threads do not survive fork(): start one per process on first use
+        if self._pid == os.getpid() or self._closed:
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="omikuji-pool", daemon=True
+            )
+            self._thread.start()
+
+    def pop(self, is_live: Callable[[Any], bool] = lambda tid: True):
+        """Return a prepared result, or None if none is ready.
+
+        Results whose topic `is_live` rejects (deleted since they were
+        prepared) are dropped on the way.
+        """
+        self._ensure_thread()
+        with self._cond:
+            try:
+                while self._items:
+                    item = self._items.popleft()
+                    if is_live(item["id"]):
+                        self.hits += 1
+                        return item
+                    self.dropped += 1
+                self.misses += 1
+                return None
+            finally:
+                if len(self._items) <= self.low_water:
+                    self._cond.notify()
+
+    def discard(self, tid: Any) -> None:
+        """Drop prepared results for topic `tid` (e.g. it was deleted)."""
+        tid = str(tid)
+        with self._cond:
+            kept = [item for item in self._items if str(item["id"]) != tid]
+            self.dropped += len(self._items) - len(kept)
+            self._items.clear()
+            self._items.extend(kept)
+
+    def clear(self) -> None:
+        with self._cond:
+            self._items.clear()
+            self._generation += 1
+            self.clears += 1
+            self._cond.notify()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and len(self._items) > self.low_water:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            if not self._refill():
+                # nothing to draw (or the database failed): do not spin, try
+                # again when results are asked for
+                with self._cond:
+                    if not self._closed:
+                        self._cond.wait()
+
+    def _refill(self) -> bool:
+        start = time.perf_counter()
+        while True:
+            with self._cond:
+                if self._closed or len(self._items) >= self.capacity:
+                    break
+                generation = self._generation
+            t0 = time.perf_counter()
+            try:
+                item = self.produce()
+            except Exception:
+                if self._closed:
+                    # shutting down: the database may already be closed
+                    return False
+                log.exception("preparing an omikuji draw failed")
+                with self._cond:
+                    self.errors += 1
+                time.sleep(self.retry_delay)
+                return False
+            if item is None:
+                return False
+            with self._cond:
+                self._produce_seconds_total += time.perf_counter() - t0
+                self.produced += 1
+                if generation == self._generation and len(self._items) < self.capacity:
+                    self._items.append(item)
+        elapsed = time.perf_counter() - start
+        with self._cond:
+            self.refills += 1
+            self.last_refill_seconds = elapsed
+            self.max_refill_seconds = max(self.max_refill_seconds, elapsed)
+            self._refill_seconds_total += elapsed
+        return True
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "depth": len(self._items),
+                "capacity": self.capacity,
+                "low_water": self.low_water,
+                "hits": self.hits,
+                "misses": self.misses,
+                "dropped": self.dropped,
+                "clears": self.clears,
+                "produced": self.produced,
+                "errors": self.errors,
+                "refills": self.refills,
+                "last_refill_seconds": self.last_refill_seconds,
+                "max_refill_seconds": self.max_refill_seconds,
+                "avg_refill_seconds": (
+                    self._refill_seconds_total / self.refills if self.refills else 0.0
+                ),
+                "avg_produce_seconds": (
+                    self._produce_seconds_total / self.produced
+                    if self.produced
+                    else 0.0
+                ),
+            }
+
+
+__all__ = ["DrawPool"]
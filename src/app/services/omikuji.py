@@ -1,12 +1,372 @@
 import random
-from typing import Optional
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from ..repositories.deck_store_sqlite import SQLiteDeckStore
 from ..repositories.topic_repo_sqlite import SQLiteTopicRepository
+from .draw_pool import DrawPool
+
+
+class RandomPickIndex:
+    """Set of topic ids supporting O(1) add, remove and uniform random choice.
+
+    Every id is interned to a stable integer ordinal so other structures (see
+    `TopicDeck`) can refer to topics by small ints. Live ordinals sit in a
+    dense array; removal swaps the last one into the freed slot so the array
+    never has holes. Ordinals of deleted ids are kept and reused if
+    the same id comes back.
+    """
+
+    def __init__(self, ids: Iterable[Any] = ()):
+        self._keys: List[str] = []  # ordinal -> id
+        self._ordinals: Dict[str, int] = {}  # id -> ordinal
+        self._live = array("i")  # dense live ordinals
+        self._pos = array("i")  # ordinal -> index in _live, or -1
+        self.reset(ids)
+
+    def _intern(self, tid: str) -> int:
+        o = self._ordinals.get(tid)
+        if o is None:
+            o = len(self._keys)
+            self._keys.append(tid)
+            self._ordinals[tid] = o
+            self._pos.append(-1)
+        return o
+
+    def reset(self, ids: Iterable[Any]) -> None:
+        live = array("i")
+        for tid in ids:
+            live.append(self._intern(str(tid)))
+        pos = array("i", [-1]) * len(self._keys)
+        for n, o in enumerate(live):
+            pos[o] = n
+        self._live, self._pos = live, pos
+
+    def add(self, tid: Any) -> None:
+        o = self._intern(str(tid))
+        if self._pos[o] >= 0:
+            return
+        self._pos[o] = len(self._live)
+        self._live.append(o)
+
+    def remove(self, tid: Any) -> None:
+        o = self._ordinals.get(str(tid))
+        if o is None or self._pos[o] < 0:
+            return
+        n = self._pos[o]
+        last = self._live.pop()
+        if n < len(self._live):
+            self._live[n] = last
+            self._pos[last] = n
+        self._pos[o] = -1
+
+    def choice(self, rng: random.Random = random) -> Optional[str]:
+        live = self._live
+        if not live:
+            return None
+        return self._keys[live[rng.randrange(len(live))]]
+
+    def is_live(self, ordinal: int) -> bool:
+        return self._pos[ordinal] >= 0
+
+    def key(self, ordinal: int) -> str:
+        return self._keys[ordinal]
+
+    @property
+    def high_water(self) -> int:
+        """Number of ordinals handed out so far; new ids get ordinals >= this."""
+        return len(self._keys)
+
+    def __contains__(self, tid: Any) -> bool:
+        o = self._ordinals.get(str(tid))
+        return o is not None and self._pos[o] >= 0
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix(x: int, seed: int, round_: int) -> int:
+    # splitmix64 finaliser of (x, seed, round): plain integer arithmetic, so
+    # every process computes the same permutation for the same seed
+    z = (x + seed + (round_ + 1) * 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+def _permute(i: int, n: int, seed: int) -> int:
+    """Position `i` of a seeded pseudo-random permutation of range(n).
+
+    A 4-round Feistel network over the smallest even number of bits that
+    covers n is a bijection on that power-of-two range; values >= n are
+    walked through it again (cycle walking) until they land inside.
+    """
+    if n <= 1:
+        return 0
+    bits = (n - 1).bit_length()
+    half = (bits + 1) // 2
+    mask = (1 << half) - 1
+    x = i
+    while True:
+        left, right = x >> half, x & mask
+        for r in range(4):
+            left, right = right, left ^ (_mix(right, seed, r) & mask)
+        x = (left << half) | right
+        if x < n:
+            return x
+
+
+class TopicDeck:
+    """No-repeat draw order over a `RandomPickIndex` (one per session/room).
+
+    With a `TopicIdSpace` instead of the index, cards are topic ids.
+
+    A deck holds no cards, only a cursor: a round visits the ordinals
+    [base, end) in the order of a seeded permutation (`_permute`), so a deck
+    is a few ints however many topics there are. When that range is used
+    up, ordinals the index handed out since form the next segment of the
+    same round; when there are none, a new round over all ordinals starts
+    with a fresh seed. Deleted topics are skipped when met.
+    """
+
+    __slots__ = ("seed", "base", "end", "pos")
+
+    def __init__(self, seed: int = 0, base: int = 0, end: int = 0, pos: int = 0):
+        self.seed = seed
+        self.base = base
+        self.end = end
+        self.pos = pos
+
+    def draw(
+        self, index: "RandomPickIndex | TopicIdSpace", rng: random.Random = random
+    ) -> Optional[str]:
+        if not len(index):
+            return None
+        while True:
+            if self.pos >= self.end - self.base:
+                high = index.high_water
+                # topics added during the round join it; otherwise start over
+                self.base = self.end if high > self.end else 0
+                self.end = high
+                # 63 bits: fits a (signed) SQLite integer
+                self.seed = rng.getrandbits(63)
+                self.pos = 0
+            card = self.base + _permute(self.pos, self.end - self.base, self.seed)
+            self.pos += 1
+            if index.is_live(card):
+                return index.key(card)
+
+    @property
+    def remaining(self) -> int:
+        """Cards left in the current segment (deleted topics included)."""
+        return self.end - self.base - self.pos
+
+
+class TopicIdSpace:
+    """`TopicDeck` cards that are integer topic ids rather than ordinals.
+
+    Ordinals depend on the order a process loaded its index; ids of the
+    SQLite backend mean the same in every process, so a deck over them can
+    be kept in a shared `SQLiteDeckStore`. Liveness comes from the index.
+    """
+
+    def __init__(self, index: RandomPickIndex):
+        self.index = index
+        # one past the largest id seen
+        self.high_water = 0
+
+    def reset(self, ids: Iterable[Any]) -> None:
+        self.high_water = max((int(i) for i in ids), default=-1) + 1
+
+    def add(self, tid: Any) -> None:
+        self.high_water = max(self.high_water, int(tid) + 1)
+
+    def is_live(self, card: int) -> bool:
+        return str(card) in self.index
+
+    def key(self, card: int) -> str:
+        return str(card)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+# draws retried when the drawn topic was deleted before it could be prepared
+_DRAW_ATTEMPTS = 3
 
 
 class OmikujiService:
-    def __init__(self, repo: Optional[SQLiteTopicRepository] = None):
+    def __init__(
+        self,
+        repo: Optional[SQLiteTopicRepository] = None,
+        use_index: bool = True,
+        max_decks: int = 10_000,
+        prepare: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None,
+        pool_size: int = 0,
+        deck_store: Optional[SQLiteDeckStore] = None,
+    ):
         self.repo = repo or SQLiteTopicRepository()
+        self.use_index = use_index
+        self.max_decks = max_decks
+        self._index = RandomPickIndex()
+        self._index_revision: Optional[int] = None
+        # deck key (session/room) -> TopicDeck, least recently used first
+        self._decks: "OrderedDict[str, TopicDeck]" = OrderedDict()
+        self._lock = threading.Lock()
+        # with a deck store (SQLite backend) decks live there, shared by all
+        # worker processes, and their cards are topic ids
+        self.deck_store = deck_store
+        self._ids = TopicIdSpace(self._index) if deck_store is not None else None
+        # `prepare(tid)` turns a drawn id into a ready result ({"id", ...});
+        # with a pool, plain draws are prepared ahead on a background thread
+        self.prepare = prepare
+        self.pool: Optional[DrawPool] = None
+        if prepare is not None and pool_size > 0 and use_index:
+            self.pool = DrawPool(self._produce, capacity=pool_size)
+
+    def _sync_index(self) -> None:
+        # one O(1) revision check per draw; the O(n) reload only happens when
+        # topics changed behind our back (another worker, manual edits, ...)
+        rev = self.repo.revision()
+        if rev == self._index_revision:
+            return
+        with self._lock:
+            if rev != self._index_revision:
+                ids = self.repo.list_topic_ids()
+                self._index.reset(ids)
+                if self._ids is not None:
+                    self._ids.reset(ids)
+                self._index_revision = rev
+                if self.pool is not None:
+                    # topics may have been edited elsewhere: drop prepared
+                    # results rather than serve old titles/HTML
+                    self.pool.clear()
+
+    def pick_random_topic(self, deck: Optional[str] = None) -> Optional[str]:
+        """Draw a topic id.
+
+        Without `deck` every draw is independent and uniform. With a deck key
+        (e.g. a session or room id) draws come from that key's `TopicDeck`, so
+        no topic repeats until every topic has been drawn once.
+        """
+        if deck is not None:
+            return self._draw_from_deck(deck)
+        if not self.use_index:
+            rid = self.repo.random_topic_id()
+            return str(rid) if rid is not None else None
+        self._sync_index()
+        return self._choice()
+
+    def draw_prepared(self, deck: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Draw a topic and return `prepare`'s result for it, or None.
+
+        Plain draws are served from the pre-drawn pool when it has results
+        (no database or rendering work on the request); otherwise, and for
+        deck draws, the topic is drawn and prepared now. A topic deleted
+        between drawing and preparing is redrawn a few times.
+        """
+        if self.prepare is None:
+            raise RuntimeError("OmikujiService was built without prepare()")
+        if deck is None and self.pool is not None:
+            self._sync_index()
+            item = self.pool.pop(self._index.__contains__)
+            if item is not None:
+                return item
+        for _ in range(_DRAW_ATTEMPTS):
+            tid = self.pick_random_topic(deck=deck)
+            if not tid:
+                return None
+            item = self.prepare(tid)
+            if item is not None:
+                return item
+        return None
+
+    def _produce(self) -> Optional[Dict[str, Any]]:
+        # runs on the pool's thread
+        self._sync_index()
+        tid = self._choice()
+        return self.prepare(tid) if tid else None
+
+    def _choice(self) -> Optional[str]:
+        # remove() swap-pops the live array: reading its length and then an
+        # element must not interleave with it (IndexError past the end)
+        with self._lock:
+            return self._index.choice()
+
+    def pool_stats(self) -> Optional[Dict[str, Any]]:
+        return self.pool.stats() if self.pool is not None else None
+
+    def _draw_from_deck(self, key: str) -> Optional[str]:
+        self._sync_index()
+        if self.deck_store is not None:
+            return self.deck_store.update(key, self._step_shared_deck)
+        with self._lock:
+            d = self._decks.get(key)
+            if d is None:
+                d = self._decks[key] = TopicDeck()
+                while len(self._decks) > self.max_decks:
+                    self._decks.popitem(last=False)
+            else:
+                self._decks.move_to_end(key)
+            return d.draw(self._index)
+
+    def _step_shared_deck(self, state):
+        # runs inside the deck store's transaction
+        deck = TopicDeck(*state) if state is not None else TopicDeck()
+        with self._lock:
+            tid = deck.draw(self._ids)
+        return (deck.seed, deck.base, deck.end, deck.pos), tid
+
+    def deck_stats(self) -> Dict[str, Any]:
+        if self.deck_store is not None:
+            return self.deck_store.stats()
+        with self._lock:
+            return {
+                "decks": len(self._decks),
+                "max_decks": self.max_decks,
+                "shared": False,
+            }
+
+    def _adopt_revision(self, step: Optional[int]) -> None:
+        # (under self._lock, after applying our own write to the index) the
+        # index now matches the revision our write produced -- unless another
+        # process wrote too, in which case the revision moved further and
+        # _sync_index must reload
+        if step is not None and self.repo.revision() == self._index_revision + step:
+            self._index_revision += step
+
+    def topic_created(self, tid: Any) -> None:
+        """Keep the pick index in sync after a topic was created through the app."""
+        with self._lock:
+            if self._index_revision is None:
+                return
+            self._index.add(tid)
+            if self._ids is not None:
+                self._ids.add(tid)
+            self._adopt_revision(self.repo.revision_step(created=1))
+
+    def topics_created(self, tids: Iterable[Any]) -> None:
+        """Like `topic_created` for a bulk import: one revision read in total."""
+        with self._lock:
+            if self._index_revision is None:
+                return
+            tids = list(tids)
+            for tid in tids:
+                self._index.add(tid)
+                if self._ids is not None:
+                    self._ids.add(tid)
+            self._adopt_revision(self.repo.revision_step(created=len(tids), bulk=True))
 
-    def pick_random_topic(self) -> Optional[str]:
-        rid = self.repo.random_topic_id()
-        return str(rid) if rid is not None else None
+    def topic_deleted(self, tid: Any) -> None:
+        """Keep the pick index in sync after a topic was deleted through the app."""
+        with self._lock:
+            if self._index_revision is None:
+                return
+            self._index.remove(tid)
+            self._adopt_revision(self.repo.revision_step(deleted=1))
+        if self.pool is not None:
+            self.pool.discard(tid)
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import atexit
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from ..repositories.deck_store_sqlite import SQLiteDeckStore
+from ..repositories.sqlite_pool import SQLiteConnectionPool
+from ..repositories.topic_repo import TopicRepoError, TopicRepository
+from ..repositories.topic_repo_file import FileTopicRepository
+from ..repositories.topic_repo_sqlite import SQLiteTopicRepository
+from ..utils.markdown import MarkdownRenderer
+from ..utils.render_cache import RenderCache, content_version
+from .omikuji import OmikujiService
+from .rerender import BackgroundRerenderer
+
+
+class ServiceRegistry:
+    """Application-scoped holder of the topic repository and services.
+
+    Built once by `create_app` and exposed as `app.services`. Each object can
+    be replaced with `override()` (e.g. to inject fakes in tests); services
+    that depend on a replaced object are rebuilt.
+    """
+
+    def __init__(
+        self,
+        config: Mapping[str, Any],
+        pool: Optional[SQLiteConnectionPool] = None,
+        state_pool: Optional[SQLiteConnectionPool] = None,
+    ):
+        self.config = config
+        self.pool = pool
+        # state shared by the worker processes (see STATE_DB)
+        self.state_pool = state_pool
+        self.topic_repo: Optional[TopicRepository] = None
+        self.omikuji: Optional[OmikujiService] = None
+        self.renderer: Optional[MarkdownRenderer] = None
+        self.render_cache: Optional[RenderCache] = None
+        self.rerenderer: Optional[BackgroundRerenderer] = None
+        # seconds spent constructing each object, keyed by name
+        self.build_times: Dict[str, float] = {}
+
+    def _timed(self, name: str, factory):
+        start = time.perf_counter()
+        obj = factory()
+        self.build_times[name] = time.perf_counter() - start
+        return obj
+
+    def _make_topic_repo(self) -> TopicRepository:
+        # Prefer a configured SQLite DB if provided; fall back to filesystem repo.
+        db_path = self.config.get("TOPICS_DB")
+        if db_path:
+            # render-on-write: the repository stores sanitized HTML
+            return SQLiteTopicRepository(
+                db_path=db_path, pool=self.pool, renderer=self.renderer
+            )
+        return FileTopicRepository(
+            self.config.get("TOPICS_DIR"),
+            index_path=self.config.get("TOPICS_INDEX_PATH") or None,
+            rescan_interval=float(self.config.get("TOPICS_RESCAN_INTERVAL", 30)),
+            search_index_path=self.config.get("TOPICS_SEARCH_INDEX") or None,
+        )
+
+    def _make_omikuji(self) -> OmikujiService:
+        max_decks = int(self.config.get("OMIKUJI_MAX_DECKS", 10_000))
+        deck_store = None
+        # shared decks need ids that mean the same in every process: SQLite's
+        # integer ids (the file backend keeps its decks per process)
+        if self.state_pool is not None and isinstance(
+            self.topic_repo, SQLiteTopicRepository
+        ):
+            deck_store = SQLiteDeckStore(self.state_pool, max_decks=max_decks)
+        return OmikujiService(
+            self.topic_repo,
+            max_decks=max_decks,
+            prepare=self.prepare_draw,
+            pool_size=int(self.config.get("OMIKUJI_POOL_SIZE", 0)),
+            deck_store=deck_store,
+        )
+
+    def render_topic(self, t: Dict[str, Any]) -> str:
+        """Return the rendered HTML of topic `t`.
+
+        Serves HTML stored at write time when it was produced by the current
+        renderer version; otherwise renders (at most once per content version,
+        via the render cache) and asks for the stored copy to be refreshed.
+        """
+        html = t.get("body_html")
+        if html is not None and t.get("render_version") == self.renderer.version:
+            return html
+        if "body_html" in t and self.rerenderer is not None:
+            self.rerenderer.trigger()
+        body = t.get("body", "")
+        return self.render_cache.get_or_render(
+            t.get("id"), content_version(body), lambda: self.renderer.render(body)
+        )
+
+    def prepare_draw(self, tid: str) -> Optional[Dict[str, Any]]:
+        """Omikuji result for topic `tid`: {id, title, html}, or None if gone."""
+        try:
+            t = self.topic_repo.get_topic(tid)
+        except TopicRepoError:
+            return None
+        if not t:
+            return None
+        return {"id": tid, "title": t.get("title"), "html": self.render_topic(t)}
+
+    def _make_rerenderer(self) -> Optional[BackgroundRerenderer]:
+        if not hasattr(self.topic_repo, "rerender_stale"):
+            return None
+        return BackgroundRerenderer(
+            self.topic_repo, batch_size=int(self.config.get("RERENDER_BATCH_SIZE", 500))
+        )
+
+    def build(self) -> "ServiceRegistry":
+        self.renderer = self._timed("renderer", MarkdownRenderer)
+        self.topic_repo = self._timed("topic_repo", self._make_topic_repo)
+        if hasattr(self.topic_repo, "close"):
+            # e.g. persist the file backend's index on shutdown
+            atexit.register(self.topic_repo.close)
+        if self.config.get("TOPICS_ENSURE_SCHEMA", True) and hasattr(
+            self.topic_repo, "ensure_schema"
+        ):
+            self._timed("ensure_schema", self.topic_repo.ensure_schema)
+        self.rerenderer = self._make_rerenderer()
+        self.render_cache = self._timed(
+            "render_cache",
+            lambda: RenderCache(
+                self.config.get("RENDER_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+            ),
+        )
+        self.omikuji = self._timed("omikuji", self._make_omikuji)
+        if self.omikuji.pool is not None:
+            # stop refilling before the repository is closed at exit
+            atexit.register(self.omikuji.pool.close)
+        return self
+
+    def override(self, **objects: Any) -> None:
+        """Replace registry objects, e.g. `override(topic_repo=FakeRepo())`."""
+        for name, obj in objects.items():
+            if name not in ("topic_repo", "omikuji", "renderer", "render_cache"):
+                raise AttributeError(f"unknown registry object: {name}")
+            setattr(self, name, obj)
+        if "topic_repo" in objects:
+            if "omikuji" not in objects:
+                self.omikuji = self._make_omikuji()
+            self.rerenderer = self._make_rerenderer()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters of the pools and caches held here (for sizing them)."""
+        out: Dict[str, Any] = {}
+        if self.pool is not None:
+            out["topics_pool"] = self.pool.stats()
+        if self.render_cache is not None:
+            out["render_cache"] = self.render_cache.stats()
+        if self.rerenderer is not None:
+            out["rerenderer"] = self.rerenderer.stats()
+        if self.omikuji is not None:
+            out["omikuji_decks"] = self.omikuji.deck_stats()
+            if self.omikuji.pool is not None:
+                out["omikuji_pool"] = self.omikuji.pool_stats()
+        return out
+
+    @property
+    def build_time_total(self) -> float:
+        return sum(self.build_times.values())
+
+
+__all__ = ["ServiceRegistry"]
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+log = logging.getLogger(__name__)
+
+
+class BackgroundRerenderer:
+    """Refresh stale stored topic HTML on a daemon thread.
+
+    `trigger()` is cheap and may be called on every read that finds HTML
+    from an older renderer version (or none at all); at most one re-render
+    pass runs at a time.
+    """
+
+    def __init__(self, repo: Any, batch_size: int = 500):
+        self.repo = repo
+        self.batch_size = batch_size
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.rows = 0
+        self.last_duration = 0.0
+
+    def trigger(self) -> bool:
+        """Start a re-render pass unless one is already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(
+                target=self._run, name="topic-rerender", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def _run(self) -> None:
+        start = time.perf_counter()
+        try:
+            n = self.repo.rerender_stale(batch_size=self.batch_size)
+        except Exception:
+            log.exception("background re-render failed")
+            return
+        self.last_duration = time.perf_counter() - start
+        self.runs += 1
+        self.rows += n
+        if n:
+            log.info("re-rendered %d topics in %.1fs", n, self.last_duration)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": bool(self._thread and self._thread.is_alive()),
+            "runs": self.runs,
+            "rows": self.rows,
+            "last_duration": self.last_duration,
+        }
+
+
+__all__ = ["BackgroundRerenderer"]
@@ -1,15 +1,25 @@
 (async function(){
-  // Show an animation GIF, wait until it's finished (by duration),
-  // and navigate to the picked topic once backend result is ready.
+  // Show an animation GIF while the draw is fetched, then show the picked
+  // topic in place once the animation has finished.
   const container = document.getElementById('omikuji');
   if (!container) return;
 
   // duration in ms; can be overridden by data-duration on the container
   const duration = parseInt(container.dataset.duration || '3000', 10) || 3000;
-  const gifSrc = '/static/omikuji_gif.gif';
+  // animation URLs come from the asset manifest (see omikuji.html); the
+  // WebP variant is much smaller and only present when it was built
+  const gifSrc = container.dataset.gif || '/static/omikuji_gif.gif';
+  const webpSrc = container.dataset.webp;
 
-  // render GIF
+  // render GIF (or WebP where supported)
   container.innerHTML = '';
+  const picture = document.createElement('picture');
+  if (webpSrc) {
+    const source = document.createElement('source');
+    source.type = 'image/webp';
+    source.srcset = webpSrc;
+    picture.appendChild(source);
+  }
   const img = document.createElement('img');
   img.src = gifSrc;
   img.alt = 'おみくじアニメーション';
@@ -17,7 +27,8 @@
   img.style.width = '100%';
   img.style.display = 'block';
   img.style.margin = '0 auto 18px';
-  container.appendChild(img);
+  picture.appendChild(img);
+  container.appendChild(picture);
 
   // small caption while animating
   const caption = document.createElement('div');
@@ -25,8 +36,9 @@
   caption.className = 'center';
   container.appendChild(caption);
 
-  // start backend request in parallel
-  const fetchPromise = fetch('/omikuji', { headers: { 'Accept': 'application/json' } })
+  // one request returns the topic with its rendered HTML
+  // (pass ?mode=deck&room=... through)
+  const fetchPromise = fetch('/omikuji/draw' + window.location.search, { headers: { 'Accept': 'application/json' } })
     .then(r => {
       if (!r.ok) throw new Error('no topics');
       return r.json();
@@ -35,10 +47,42 @@
   // wait for animation duration
   const timerPromise = new Promise(resolve => setTimeout(resolve, duration));
 
+  function showTopic(j) {
+    container.innerHTML = '';
+    const article = document.createElement('article');
+    const h2 = document.createElement('h2');
+    h2.textContent = j.title || String(j.id);
+    const content = document.createElement('div');
+    content.className = 'topic-content';
+    // sanitized on the server (bleach) before it is stored / cached
+    content.innerHTML = j.html;
+    article.appendChild(h2);
+    article.appendChild(content);
+    container.appendChild(article);
+
+    const actions = document.createElement('div');
+    const again = document.createElement('button');
+    again.className = 'btn';
+    again.textContent = 'もう一度引く';
+    again.addEventListener('click', () => window.location.reload());
+    const link = document.createElement('a');
+    link.className = 'btn secondary small';
+    link.href = j.url;
+    link.textContent = 'この話題のページ';
+    const home = document.createElement('a');
+    home.className = 'btn secondary small';
+    home.href = '/';
+    home.textContent = 'メインに戻る';
+    [again, link, home].forEach(el => {
+      actions.appendChild(el);
+      actions.appendChild(document.createTextNode(' '));
+    });
+    container.appendChild(actions);
+  }
+
   try {
     const [j] = await Promise.all([fetchPromise, timerPromise]);
-    // navigate to the selected topic
-    window.location.href = '/topics/' + encodeURIComponent(j.id);
+    showTopic(j);
   } catch (e) {
     container.innerHTML = '';
     container.innerText = '話題がありません';
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+from typing import Any, Dict, Optional
+
+from flask import Flask, abort, request, send_from_directory, url_for
+
+try:  # optional: .br variants
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:  # optional: animated WebP variant of GIF animations
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+MANIFEST_NAME = "manifest.json"
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_SUFFIXES = dict(ENCODINGS)
+
+# one year: hashed names change with their content
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# already compressed formats; gzip/brotli would not gain anything
+_NO_COMPRESS = {".gif", ".png", ".jpg", ".jpeg", ".webp", ".ico", ".woff2", ".mp4"}
+
+
+def _hashed_name(name: str, data: bytes) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def _write(path: str, data: bytes, replace: bool = False) -> None:
+    if not replace and os.path.exists(path) and os.path.getsize(path) == len(data):
+        # same hashed name, same content
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _compressed(data: bytes) -> Dict[str, bytes]:
+    out = {"gzip": gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        out["br"] = brotli.compress(data, quality=11)
+    # keep a variant only where it is worth a Content-Encoding
+    return {enc: c for enc, c in out.items() if len(c) < len(data) * 0.95}
+
+
+def animated_webp(data: bytes, quality: int = 60) -> Optional[bytes]:
+    """Re-encode an animated GIF as animated WebP (None without Pillow)."""
+    if Image is None:
+        return None
+    with Image.open(io.BytesIO(data)) as im:
+        buf = io.BytesIO()
+        im.save(
+            buf,
+            "WEBP",
+            save_all=True,
+            quality=quality,
+            method=6,
+            loop=im.info.get("loop", 0),
+        )
+    return buf.getvalue()
+
+
+def build_assets(
+    static_dir: str, out_dir: str, webp: bool = True, webp_quality: int = 60
+) -> Dict[str, Any]:
+    """Write content-hashed copies of the files in `static_dir` to `out_dir`.
+
+    Each text asset also gets `.gz` (and, with `brotli` installed, `.br`)
+    siblings, and each animated GIF an animated WebP variant (with Pillow),
+    registered under the GIF's name with a `.webp` extension. Files from
+    older builds are left alone so pages cached before a deploy keep
+    working. The manifest (logical name -> hashed file and encodings) is
+    written last and returned.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    out_real = os.path.realpath(out_dir)
+    assets: Dict[str, Any] = {}
+
+    def add(name: str, data: bytes) -> None:
+        hashed = _hashed_name(name, data)
+        _write(os.path.join(out_dir, hashed), data)
+        entry = {"file": hashed, "size": len(data), "encodings": {}}
+        if os.path.splitext(name)[1].lower() not in _NO_COMPRESS:
+            for enc, variant in _compressed(data).items():
+                _write(os.path.join(out_dir, hashed + _SUFFIXES[enc]), variant)
+                entry["encodings"][enc] = len(variant)
+        assets[name] = entry
+
+    for name in sorted(os.listdir(static_dir)):
+        path = os.path.join(static_dir, name)
+        if not os.path.isfile(path) or os.path.realpath(path).startswith(out_real):
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        add(name, data)
+        if webp and name.lower().endswith(".gif"):
+            variant = animated_webp(data, quality=webp_quality)
+            if variant is not None and len(variant) < len(data):
+                add(os.path.splitext(name)[0] + ".webp", variant)
+
+    manifest = {"assets": assets}
+    _write(
+        os.path.join(out_dir, MANIFEST_NAME),
+        json.dumps(manifest, indent=1, sort_keys=True).encode("utf-8"),
+        replace=True,
+    )
+    return manifest
+
+
+class AssetManifest:
+    """Serve built assets under `url_prefix` and resolve their URLs.
+
+    Registers the `asset_url(name)` template helper: the hashed URL when the
+    manifest has `name`, else the plain `/static/` URL if the file exists
+    there (assets not built), else None (e.g. the optional WebP variant).
+    Hashed files are served with `Cache-Control: immutable` and, when the
+    client accepts it, as their precompressed `.br`/`.gz` variant.
+    """
+
+    def __init__(
+        self,
+        assets_dir: str,
+        url_prefix: str = "/assets",
+        max_age: int = IMMUTABLE_MAX_AGE,
+    ):
+        self.assets_dir = assets_dir
+        self.url_prefix = url_prefix.rstrip("/")
+        self.max_age = max_age
+        self.assets: Dict[str, Any] = {}
+        # short hash of the manifest; part of page ETags (pages embed URLs)
+        self.fingerprint = ""
+        try:
+            with open(os.path.join(assets_dir, MANIFEST_NAME), "rb") as f:
+                raw = f.read()
+        except OSError:
+            raw = None
+        if raw is not None:
+            self.assets = json.loads(raw).get("assets", {})
+            self.fingerprint = hashlib.blake2b(raw, digest_size=8).hexdigest()
+        # hashed file name -> manifest entry
+        self._files = {e["file"]: e for e in self.assets.values()}
+        self._static_folder: Optional[str] = None
+
+    def init_app(self, app: Flask) -> None:
+        app.add_url_rule(
+            self.url_prefix + "/<path:filename>", "assets", self.send_asset
+        )
+        app.jinja_env.globals["asset_url"] = self.asset_url
+        self._static_folder = app.static_folder
+        app.assets = self
+
+    def url(self, name: str) -> Optional[str]:
+        entry = self.assets.get(name)
+        return f"{self.url_prefix}/{entry['file']}" if entry else None
+
+    def asset_url(self, name: str) -> Optional[str]:
+        url = self.url(name)
+        if url is None and self._static_folder is not None:
+            if os.path.isfile(os.path.join(self._static_folder, name)):
+                url = url_for("static", filename=name)
+        return url
+
+    def send_asset(self, filename: str):
+        entry = self._files.get(filename)
+        if entry is None:
+            abort(404)
+        path, encoding = filename, None
+        for enc, suffix in ENCODINGS:
+            if enc in entry["encodings"] and request.accept_encodings.quality(enc) > 0:
+                path, encoding = filename + suffix, enc
+                break
+        resp = send_from_directory(
+            self.assets_dir,
+            path,
+            mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            max_age=self.max_age,
+        )
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+        if entry["encodings"]:
+            resp.vary.add("Accept-Encoding")
+        resp.cache_control.public = True
+        resp.cache_control.immutable = True
+        return resp
+
+
+__all__ = ["build_assets", "animated_webp", "AssetManifest"]
@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:  # optional: Content-Encoding: br
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+DEFAULT_MIMETYPES = (
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "application/x-ndjson",
+    "application/xml",
+    "image/svg+xml",
+)
+
+# statuses that have no body (or must not be re-encoded)
+_SKIP_STATUS = {"204", "206", "304"}
+
+# streamed (unknown length) responses are flushed to the client after
+# roughly this much input, so exports keep moving
+_FLUSH_BYTES = 64 * 1024
+
+
+class _Gzip:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        self._c = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._c.flush()
+
+
+class _Brotli:
+    name = "br"
+
+    def __init__(self, quality: int):
+        self._c = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush()
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+
+def _header(headers: List[Tuple[str, str]], name: str) -> Optional[str]:
+    name = name.lower()
+    for k, v in headers:
+        if k.lower() == name:
+            return v
+    return None
+
+
+def _without(headers: List[Tuple[str, str]], *names: str) -> List[Tuple[str, str]]:
+    drop = {n.lower() for n in names}
+    return [(k, v) for k, v in headers if k.lower() not in drop]
+
+
+def _accepts(accept_encoding: str) -> Dict[str, float]:
+    # "br;q=1.0, gzip;q=0.8, *;q=0.1" -> {"br": 1.0, "gzip": 0.8, "*": 0.1}
+    out: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            out[coding.strip().lower()] = q
+    return out
+
+
+class CompressionMiddleware:
+    """WSGI middleware that gzip/brotli-compresses responses on the fly.
+
+    Only responses whose content type is in `mimetypes` and whose body is at
+    least `min_size` bytes are compressed; responses that already have a
+    Content-Encoding (precompressed assets, gzip exports), partial content
+    and `Cache-Control: no-transform` pass through. Bodies of unknown length
+    are compressed as they stream. Brotli (if installed) is preferred over
+    gzip when the client accepts both.
+
+    The ETag of a compressed response is made weak (the app compares
+    If-None-Match weakly), so conditional requests keep working.
+    """
+
+    def __init__(
+        self,
+        app: Callable,
+        min_size: int = 500,
+        mimetypes: Iterable[str] = DEFAULT_MIMETYPES,
+        level: int = 6,
+        brotli_quality: int = 4,
+    ):
+        self.app = app
+        self.min_size = int(min_size)
+        self.mimetypes = frozenset(m.lower() for m in mimetypes)
+        self.level = int(level)
+        self.brotli_quality = int(brotli_quality)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self.skipped = 0
+
+    def _negotiate(self, environ) -> Optional[str]:
+        if environ.get("REQUEST_METHOD") == "HEAD":
+            return None
+        accepted = _accepts(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        wildcard = accepted.get("*", 0.0)
+        best, best_q = None, 0.0
+        for coding in ("br", "gzip") if brotli is not None else ("gzip",):
+            q = accepted.get(coding, wildcard)
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    def _compressor(self, coding: str):
+        if coding == "br":
+            return _Brotli(self.brotli_quality)
+        return _Gzip(self.level)
+
+    def _eligible(self, status: str, headers: List[Tuple[str, str]]) -> bool:
+        if status[:3] in _SKIP_STATUS or _header(headers, "Content-Encoding"):
+            return False
+        ctype = (_header(headers, "Content-Type") or "").split(";")[0].strip()
+        if ctype.lower() not in self.mimetypes:
+            return False
+        if "no-transform" in (_header(headers, "Cache-Control") or "").lower():
+            return False
+        length = _header(headers, "Content-Length")
+        if length is not None and length.isdigit() and int(length) < self.min_size:
+            return False
+        return True
+
+    def __call__(self, environ, start_response):
+        coding = self._negotiate(environ)
+        state: Dict[str, Any] = {}
+
+        def _start_response(status, headers, exc_info=None):
+            # held back until we know whether the body gets compressed
+            state["args"] = (status, list(headers), exc_info)
+            return _no_write
+
+        app_iter = self.app(environ, _start_response)
+        return self._respond(app_iter, state, coding, start_response)
+
+    def _respond(self, app_iter, state, coding, start_response) -> Iterator[bytes]:
+        chunks = iter(app_iter)
+        try:
+            head: List[bytes] = []
+            while "args" not in state:
+                # start_response may be called on the first iteration
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                head.append(chunk)
+            status, headers, exc_info = state["args"]
+            if not self._eligible(status, headers):
+                start_response(status, headers, exc_info)
+                yield from head
+                yield from chunks
+                return
+            # the body may differ by Accept-Encoding from here on
+            vary = _header(headers, "Vary")
+            if not vary or "accept-encoding" not in vary.lower():
+                headers = _without(headers, "Vary")
+                headers.append(
+                    ("Vary", f"{vary}, Accept-Encoding" if vary else "Accept-Encoding")
+                )
+            if coding is None:
+                self._skip()
+                start_response(status, headers, exc_info)
+                yield from head
+                yield from chunks
+                return
+            # unknown length: look at the first min_size bytes before deciding
+            size = sum(len(c) for c in head)
+            ended = False
+            while size < self.min_size:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    ended = True
+                    break
+                head.append(chunk)
+                size += len(chunk)
+            if ended and size < self.min_size:
+                self._skip()
+                start_response(status, headers, exc_info)
+                yield from head
+                return
+            headers = _without(headers, "Content-Length", "Content-Encoding")
+            headers.append(("Content-Encoding", coding))
+            etag = _header(headers, "ETag")
+            if etag and not etag.startswith("W/"):
+                headers = _without(headers, "ETag")
+                headers.append(("ETag", "W/" + etag))
+            start_response(status, headers, exc_info)
+            yield from self._compress(coding, head, chunks)
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+    def _compress(self, coding: str, head: List[bytes], chunks) -> Iterator[bytes]:
+        comp = self._compressor(coding)
+        bytes_in = bytes_out = 0
+        cpu = 0.0
+        pending = 0
+        for source in (head, chunks):
+            for chunk in source:
+                t0 = time.thread_time()
+                out = comp.compress(chunk)
+                pending += len(chunk)
+                if pending >= _FLUSH_BYTES:
+                    out += comp.flush()
+                    pending = 0
+                cpu += time.thread_time() - t0
+                bytes_in += len(chunk)
+                if out:
+                    bytes_out += len(out)
+                    yield out
+        t0 = time.thread_time()
+        out = comp.finish()
+        cpu += time.thread_time() - t0
+        bytes_out += len(out)
+        self._record(coding, bytes_in, bytes_out, cpu)
+        yield out
+
+    def _skip(self) -> None:
+        with self._lock:
+            self.skipped += 1
+
+    def _record(self, coding: str, bytes_in: int, bytes_out: int, cpu: float) -> None:
+        with self._lock:
+            s = self._stats.setdefault(
+                coding,
+                {"responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0},
+            )
+            s["responses"] += 1
+            s["bytes_in"] += bytes_in
+            s["bytes_out"] += bytes_out
+            s["cpu_seconds"] += cpu
+
+    def stats(self) -> Dict[str, Any]:
+        """Per encoding: responses, bytes in/out, bytes saved and CPU time."""
+        with self._lock:
+            out: Dict[str, Any] = {
+                "level": self.level,
+                "brotli_quality": self.brotli_quality if brotli is not None else None,
+                "min_size": self.min_size,
+                # eligible responses sent uncompressed (client did not ask,
+                # or the body was smaller than min_size)
+                "skipped": self.skipped,
+            }
+            for coding, s in self._stats.items():
+                out[coding] = dict(
+                    s,
+                    bytes_saved=s["bytes_in"] - s["bytes_out"],
+                    ratio=s["bytes_out"] / s["bytes_in"] if s["bytes_in"] else 0.0,
+                )
+            return out
+
+
+def _no_write(data: bytes) -> None:
+    raise RuntimeError("CompressionMiddleware does not support write()")
+
+
+__all__ = ["CompressionMiddleware", "DEFAULT_MIMETYPES"]
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import json
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+# fields written per topic; the lines can be fed back to POST /topics/bulk
+EXPORT_FIELDS = ("id", "slug", "title", "body", "created_at", "updated_at")
+
+# flush compressed output after roughly this much input so a stream keeps
+# moving (and memory stays flat) on large exports
+_GZIP_FLUSH_BYTES = 256 * 1024
+
+
+def export_bound(value: Optional[str]) -> Optional[str]:
+    """Normalize a `since`/`until` value to the stored "YYYY-MM-DD HH:MM:SS" form.
+
+    Accepts a date or an ISO 8601 timestamp (naive values are UTC); raises
+    ValueError otherwise.
+    """
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def ndjson_lines(topics: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """Encode topics as NDJSON, one UTF-8 line per topic."""
+    for t in topics:
+        row = {k: t[k] for k in EXPORT_FIELDS if k in t}
+        yield json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a stream of byte chunks into a gzip stream, incrementally."""
+    comp = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+    pending = 0
+    for chunk in chunks:
+        out = comp.compress(chunk)
+        pending += len(chunk)
+        if pending >= _GZIP_FLUSH_BYTES:
+            out += comp.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if out:
+            yield out
+    yield comp.flush()
+
+
+def export_topics(
+    repo: Any,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    gzip: bool = False,
+) -> Iterator[bytes]:
+    """Stream the topics created in [since, until) as (optionally gzipped) NDJSON."""
+    chunks = ndjson_lines(repo.iter_topics(since=since, until=until))
+    return gzip_chunks(chunks) if gzip else chunks
+
+
+__all__ = [
+    "EXPORT_FIELDS",
+    "export_bound",
+    "ndjson_lines",
+    "gzip_chunks",
+    "export_topics",
+]
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional, Union
+
+from flask import make_response, request
+
+
+def make_etag(*parts: Any) -> str:
+    """Hash the given version parts into a short entity tag."""
+    raw = "\x1f".join(str(p) for p in parts).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=12).hexdigest()
+
+
+def tree_fingerprint(folder: str) -> str:
+    """Hash of all files under `folder`; changes whenever a template changes."""
+    h = hashlib.blake2b(digest_size=8)
+    for root, _, files in sorted(os.walk(folder)):
+        for name in sorted(files):
+            h.update(name.encode("utf-8"))
+            with open(os.path.join(root, name), "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def parse_timestamp(value: Union[str, datetime, None]) -> Optional[datetime]:
+    """Parse a SQLite `datetime('now')` style UTC timestamp."""
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        dt = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def is_not_modified(etag: str, last_modified: Optional[datetime] = None) -> bool:
+    # If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def conditional_response(
+    build: Callable[[], Any],
+    etag: str,
+    last_modified: Optional[datetime] = None,
+    cache_control: Optional[str] = None,
+):
+    """Answer with 304 when the client's validators match, else call `build`.
+
+    `build` (which does the expensive DB/render work) only runs on a miss.
+    Both responses carry the validators and the Cache-Control policy.
+    """
+    if is_not_modified(etag, last_modified):
+        resp = make_response("", 304)
+    else:
+        resp = make_response(build())
+    resp.set_etag(etag)
+    if last_modified is not None:
+        resp.last_modified = last_modified
+    if cache_control:
+        resp.headers["Cache-Control"] = cache_control
+    # responses depend on the Accept header and on the logged-in user
+    resp.vary.update(("Accept", "Cookie"))
+    return resp
+
+
+__all__ = [
+    "make_etag",
+    "tree_fingerprint",
+    "parse_timestamp",
+    "is_not_modified",
+    "conditional_response",
+]
@@ -1,6 +1,14 @@
+import hashlib
+import json
+
 import markdown as _md
 import bleach
 
+try:  # optional: codehilite highlights code blocks only when it is installed
+    import pygments
+except ImportError:  # pragma: no cover
+    pygments = None
+
 ALLOWED_TAGS = [
     "p",
     "br",
@@ -20,16 +28,44 @@ ALLOWED_TAGS = [
 ALLOWED_ATTRIBUTES = {
     "a": ["href", "title", "rel"],
 }
+EXTENSIONS = ["fenced_code", "codehilite"]
+# Pygments style of highlighted code (codehilite's default)
+PYGMENTS_STYLE = "default"
+EXTENSION_CONFIGS = {"codehilite": {"pygments_style": PYGMENTS_STYLE}}
+
+
+def _render_version() -> str:
+    # anything that changes the output of render() must be part of this stamp
+    settings = {
+        "tags": ALLOWED_TAGS,
+        "attributes": ALLOWED_ATTRIBUTES,
+        "extensions": EXTENSIONS,
+        "extension_configs": EXTENSION_CONFIGS,
+        "markdown": getattr(_md, "__version__", ""),
+        "bleach": getattr(bleach, "__version__", ""),
+        # highlighted HTML changes with Pygments releases (None: not installed)
+        "pygments": getattr(pygments, "__version__", None),
+    }
+    raw = json.dumps(settings, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()[:12]
+
+
+RENDER_VERSION = _render_version()
 
 
 class MarkdownRenderer:
+    # stored HTML rendered under a different version is stale
+    version = RENDER_VERSION
+
     def __init__(self):
         pass
 
     def render(self, text: str) -> str:
         if text is None:
             return ""
-        html = _md.markdown(text, extensions=["fenced_code", "codehilite"])
+        html = _md.markdown(
+            text, extensions=EXTENSIONS, extension_configs=EXTENSION_CONFIGS
+        )
         clean = bleach.clean(
             html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, strip=True
         )
@@ -0,0 +1,448 @@
+from __future__ import annotations
+
+import atexit
+import functools
+import glob
+import inspect
+import json
+import math
+import os
+import re
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from flask import Flask, Response, abort, g, request
+
+# seconds; latency buckets for requests, queries, rendering and hashing
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# histograms of worker processes that have exited, kept so totals never drop
+ARCHIVE_NAME = "archive.json"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _sanitize(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]+", "_", name).strip("_").lower()
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels: Iterable[Tuple[str, Any]]) -> str:
+    inner = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return "{" + inner + "}" if inner else ""
+
+
+def _fmt_value(value: float) -> str:
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _flatten(prefix: str, stats: Mapping[str, Any], out: Dict[str, float]) -> None:
+    # {"render_cache": {"hits": 3}} -> {"<prefix>_render_cache_hits": 3};
+    # keys already starting with the prefix ("omikuji_pool") keep their name
+    for key, value in stats.items():
+        name = _sanitize(str(key))
+        if prefix and not name.startswith(f"{prefix}_"):
+            name = f"{prefix}_{name}"
+        if isinstance(value, Mapping):
+            _flatten(name, value, out)
+        elif isinstance(value, bool):
+            out[name] = int(value)
+        elif isinstance(value, (int, float)):
+            out[name] = value
+
+
+def clear_directory(directory: str) -> None:
+    """Remove the snapshots of an earlier server run from `directory`."""
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _write_json(path: str, data: Any) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class Metrics:
+    """Latency histograms and stats gauges, exported as Prometheus text.
+
+    `observe()` adds to a histogram owned by the calling thread, so the hot
+    path takes no lock; shards are only summed when metrics are read. The
+    existing `stats()` methods are exported as gauges through
+    `add_collector()`.
+
+    With a `directory` (gunicorn), every process writes its snapshot there
+    every `flush_interval` seconds and `/metrics` merges all snapshots:
+    histograms are summed over processes, gauges carry a `pid` label.
+    `process_exited(pid)` (called by the master) folds a finished worker's
+    histograms into an archive so totals never go backwards.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        flush_interval: float = 5.0,
+        namespace: str = "omikuji",
+    ):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.namespace = namespace
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Tuple[str, Callable[[], Mapping[str, Any]]]] = []
+        self._local = threading.local()
+        # per-thread {(name, labels): [count per bucket..., +Inf count, sum]}
+        self._shards: List[Dict[Tuple[str, Labels], List[float]]] = []
+        self._shards_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._flusher_pid: Optional[int] = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # fork/exit hooks cannot be unregistered: one module-level hook
+        # serves all live instances (see _after_fork_all / _flush_all)
+        _instances.add(self)
+
+    # --- recording ---------------------------------------------------------
+
+    def histogram(
+        self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> str:
+        """Declare a histogram; returns its full name for `observe()`."""
+        full = f"{self.namespace}_{name}"
+        self._buckets[full] = tuple(sorted(buckets))
+        self._help[full] = help
+        return full
+
+    def _new_shard(self) -> Dict[Tuple[str, Labels], List[float]]:
+        shard: Dict[Tuple[str, Labels], List[float]] = {}
+        with self._shards_lock:
+            self._shards.append(shard)
+        self._local.shard = shard
+        self._ensure_flusher()
+        return shard
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        key = (name, labels)
+        h = shard.get(key)
+        bounds = self._buckets[name]
+        if h is None:
+            h = shard[key] = [0] * (len(bounds) + 1) + [0.0]
+        h[bisect_left(bounds, value)] += 1
+        h[-1] += value
+
+    def timed(self, fn: Callable, name: str, labels: Labels) -> Callable:
+        """Wrap `fn` so every call is observed in histogram `name`."""
+        observe, clock = self.observe, time.perf_counter
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(name, labels, clock() - start)
+
+        return wrapper
+
+    def instrument(
+        self,
+        obj: Any,
+        name: str,
+        methods: Iterable[str] | Mapping[str, str],
+        label: str = "method",
+        **labels: str,
+    ) -> None:
+        """Time the given methods of `obj` (in place) into histogram `name`.
+
+        `methods` lists attribute names, or maps them to the value of the
+        `label` label. Missing methods and generators are skipped.
+        """
+        if not isinstance(methods, Mapping):
+            methods = {m: m for m in methods}
+        for attr, value in methods.items():
+            fn = getattr(obj, attr, None)
+            if fn is None or inspect.isgeneratorfunction(fn):
+                continue
+            key = tuple(sorted({**labels, label: value.lstrip("_")}.items()))
+            setattr(obj, attr, self.timed(fn, name, key))
+
+    def add_collector(self, prefix: str, fn: Callable[[], Mapping[str, Any]]) -> None:
+        """Export the numbers of `fn()` (a nested stats dict) as gauges."""
+        self._collectors.append((prefix, fn))
+
+    # --- Flask ------------------------------------------------------------
+
+    def init_app(self, app: Flask, token: Optional[str] = None) -> None:
+        """Time every request per endpoint and serve `GET /metrics`.
+
+        Register this before other before_request hooks so requests they
+        reject are timed too. With `token`, /metrics requires
+        `Authorization: Bearer <token>`.
+        """
+        hist = self.histogram(
+            "http_request_duration_seconds", "Request latency by endpoint"
+        )
+        clock = time.perf_counter
+
+        def start_timer():
+            g.metrics_start = clock()
+
+        def stop_timer(response):
+            start = g.pop("metrics_start", None)
+            if start is not None:
+                labels = (
+                    ("endpoint", request.endpoint or "<unmatched>"),
+                    ("method", request.method),
+                    ("status", str(response.status_code)),
+                )
+                self.observe(hist, labels, clock() - start)
+            return response
+
+        def metrics_view():
+            if token and request.headers.get("Authorization") != f"Bearer {token}":
+                abort(403)
+            return Response(
+                self.render(), mimetype="text/plain; version=0.0.4; charset=utf-8"
+            )
+
+        app.before_request(start_timer)
+        app.after_request(stop_timer)
+        app.add_url_rule("/metrics", "metrics", metrics_view)
+        app.metrics = self
+
+    # --- reading ----------------------------------------------------------
+
+    def _histograms(self) -> Dict[Tuple[str, Labels], List[float]]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        total: Dict[Tuple[str, Labels], List[float]] = {}
+        for shard in shards:
+            for key, h in list(shard.items()):
+                _add_into(total, key, list(h))
+        return total
+
+    def _gauges(self) -> Dict[str, float]:
+        out: Dict[str, float] = {}
+        for prefix, fn in self._collectors:
+            try:
+                stats = fn()
+            except Exception:
+                continue
+            _flatten(self.namespace, {prefix: stats} if prefix else stats, out)
+        return out
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "histograms": [
+                [name, list(labels), h]
+                for (name, labels), h in self._histograms().items()
+            ],
+            "gauges": self._gauges(),
+            "buckets": {k: list(v) for k, v in self._buckets.items()},
+            "help": self._help,
+        }
+
+    def flush(self) -> None:
+        """Write this process's snapshot to the directory (if any)."""
+        if self.directory:
+            _write_json(
+                os.path.join(self.directory, f"{os.getpid()}.json"), self.snapshot()
+            )
+
+    def process_exited(self, pid: int) -> None:
+        """Fold an exited process's histograms into the archive (master only)."""
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f"{pid}.json")
+        snap = _read_json(path)
+        if snap is None:
+            return
+        archive_path = os.path.join(self.directory, ARCHIVE_NAME)
+        archive = _read_json(archive_path) or {
+            "histograms": [],
+            "buckets": {},
+            "help": {},
+        }
+        merged: Dict[Tuple[str, Labels], List[float]] = {}
+        for src in (archive, snap):
+            for name, labels, h in src["histograms"]:
+                _add_into(merged, (name, _labels(labels)), h)
+        archive = {
+            "histograms": [[n, list(l), h] for (n, l), h in merged.items()],
+            "buckets": {**archive["buckets"], **snap["buckets"]},
+            "help": {**archive["help"], **snap["help"]},
+        }
+        _write_json(archive_path, archive)
+        os.remove(path)
+
+    def render(self) -> str:
+        """All metrics (of every process, with a directory) as Prometheus text."""
+        histograms = self._histograms()
+        buckets, help = dict(self._buckets), dict(self._help)
+        gauges: Dict[str, List[Tuple[Labels, float]]] = {}
+        pid = str(os.getpid())
+        if not self.directory:
+            for name, value in self._gauges().items():
+                gauges.setdefault(name, []).append(((), value))
+        else:
+            self.flush()
+            histograms = {}
+            for path in sorted(glob.glob(os.path.join(self.directory, "*.json"))):
+                snap = _read_json(path)
+                if snap is None:
+                    continue
+                for name, labels, h in snap["histograms"]:
+                    _add_into(histograms, (name, _labels(labels)), h)
+                buckets.update(
+                    {k: tuple(v) for k, v in snap.get("buckets", {}).items()}
+                )
+                help.update(snap.get("help", {}))
+                if "pid" in snap:
+                    # gauges only make sense for live processes
+                    for name, value in snap["gauges"].items():
+                        gauges.setdefault(name, []).append(
+                            ((("pid", str(snap["pid"])),), value)
+                        )
+        lines: List[str] = []
+        by_name: Dict[str, List[Tuple[Labels, List[float]]]] = {}
+        for (name, labels), h in histograms.items():
+            by_name.setdefault(name, []).append((labels, h))
+        for name in sorted(by_name):
+            bounds = buckets.get(name, DEFAULT_BUCKETS)
+            lines.append(f"# HELP {name} {help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, h in sorted(by_name[name]):
+                cumulative = 0
+                for bound, n in zip(list(bounds) + [math.inf], h[:-1]):
+                    cumulative += n
+                    lbl = _fmt_labels(list(labels) + [("le", _fmt_value(float(bound)))])
+                    lines.append(f"{name}_bucket{lbl} {cumulative}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_value(h[-1])}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {cumulative}")
+        for name in sorted(gauges):
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in gauges[name]:
+                lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    # --- processes --------------------------------------------------------
+
+    def _ensure_flusher(self) -> None:
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        with self._shards_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            self._flusher = threading.Thread(
+                target=_flush_loop,
+                args=(weakref.ref(self), self.flush_interval),
+                name="metrics-flush",
+                daemon=True,
+            )
+            self._flusher.start()
+
+    def _after_fork(self) -> None:
+        self._shards_lock = threading.Lock()
+        self._shards = []
+        self._local = threading.local()
+        self._flusher = None
+        self._flusher_pid = None
+
+
+# every Metrics instance that is still referenced somewhere
+_instances: "weakref.WeakSet[Metrics]" = weakref.WeakSet()
+
+
+def _flush_loop(ref: "weakref.ref[Metrics]", interval: float) -> None:
+    # holds the instance only while flushing, so it can still be collected
+    while True:
+        time.sleep(interval)
+        metrics = ref()
+        if metrics is None:
+            return
+        try:
+            metrics.flush()
+        except OSError:
+            pass
+        del metrics
+
+
+def _after_fork_all() -> None:
+    # a forked worker starts from zero (the master's numbers, if any, are
+    # not its own) and needs its own flusher thread
+    for metrics in list(_instances):
+        metrics._after_fork()
+
+
+def _flush_all() -> None:
+    for metrics in list(_instances):
+        try:
+            metrics.flush()
+        except OSError:
+            pass
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_all)
+atexit.register(_flush_all)
+
+
+def _labels(pairs: Iterable[Iterable[str]]) -> Labels:
+    return tuple((k, v) for k, v in pairs)
+
+
+def _add_into(
+    total: Dict[Tuple[str, Labels], List[float]],
+    key: Tuple[str, Labels],
+    h: List[float],
+) -> None:
+    acc = total.get(key)
+    if acc is None:
+        total[key] = list(h)
+    else:
+        for i, v in enumerate(h):
+            acc[i] += v
+
+
+__all__ = ["Metrics", "DEFAULT_BUCKETS", "clear_directory"]
@@ -3,63 +3,233 @@ PasswordManager
 
 Provides secure password hashing, verification and rotation utilities.
 
-Uses PBKDF2-HMAC-SHA256 with a per-user random salt.
+Hashes are stored in an encoded form that names the scheme and its cost
+parameters, so the cost can be raised (or the scheme changed) later and
+existing hashes upgraded when users log in:
+
+    pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>
+    scrypt$<n>,<r>,<p>$<salt hex>$<hash hex>
+
+Bare hex hashes from older releases (PBKDF2-HMAC-SHA256 with the salt kept
+in a separate column) are still verified.
+
+Key derivation runs on a small bounded thread pool (hashlib releases the
+GIL while deriving), so a burst of logins cannot occupy every request
+thread with KDF work.
 """
 
 from __future__ import annotations
 
 import hashlib
 import hmac
+import os
 import secrets
-from typing import Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
+SCHEMES = ("pbkdf2_sha256", "scrypt")
+
+# iteration count of the bare (un-encoded) hashes written by older releases
+LEGACY_PBKDF2_ITERATIONS = 200_000
+
+
+class HashingBusy(RuntimeError):
+    """Raised when too many password hashes are already queued."""
+
+
+def _scrypt_maxmem(n: int, r: int, p: int) -> int:
+    # OpenSSL needs 128*r*(n+2) bytes for V plus 128*r*p for B
+    return 128 * r * (n + 2) + 128 * r * p + 1024 * 1024
 
 
 class PasswordManager:
     def __init__(
-        self, iterations: int = 200_000, dklen: int = 32, salt_bytes: int = 16
+        self,
+        iterations: int = 200_000,
+        dklen: int = 32,
+        salt_bytes: int = 16,
+        scheme: str = "pbkdf2_sha256",
+        scrypt_n: int = 2**14,
+        scrypt_r: int = 8,
+        scrypt_p: int = 1,
+        max_workers: int = 2,
+        max_pending: int = 32,
     ):
+        if scheme not in SCHEMES:
+            raise ValueError(f"unknown password hash scheme: {scheme}")
         self.iterations = iterations
         self.dklen = dklen
         self.salt_bytes = salt_bytes
+        self.scheme = scheme
+        self.scrypt_params = (scrypt_n, scrypt_r, scrypt_p)
+        # at most `max_workers` derivations run at once; beyond that up to
+        # `max_pending` callers wait, and any more get HashingBusy
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._executor_lock = threading.Lock()
+
+    # --- executor ----------------------------------------------------------
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # threads do not survive fork(): a forked worker starts its own pool
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            with self._executor_lock:
+                if self._executor is None or self._executor_pid != pid:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="password-hash",
+                    )
+                    self._executor_pid = pid
+        return self._executor
+
+    def _run(self, fn: Callable[..., bytes], *args, **kwargs) -> bytes:
+        if self.max_workers <= 0:
+            return fn(*args, **kwargs)  # inline (e.g. CLI tools)
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy("too many password hashes in progress")
+        try:
+            return self._get_executor().submit(fn, *args, **kwargs).result()
+        finally:
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        """Stop the hashing threads (they are restarted on next use)."""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+            self._executor = None
+
+    # --- derivation --------------------------------------------------------
+
+    def _pbkdf2(self, password: str, salt: bytes, iterations: int, dklen: int) -> bytes:
+        return self._run(
+            hashlib.pbkdf2_hmac,
+            "sha256",
+            password.encode("utf-8"),
+            salt,
+            iterations,
+            dklen=dklen,
+        )
+
+    def _scrypt(
+        self, password: str, salt: bytes, n: int, r: int, p: int, dklen: int
+    ) -> bytes:
+        return self._run(
+            hashlib.scrypt,
+            password.encode("utf-8"),
+            salt=salt,
+            n=n,
+            r=r,
+            p=p,
+            maxmem=_scrypt_maxmem(n, r, p),
+            dklen=dklen,
+        )
+
+    def _params(self) -> str:
+        if self.scheme == "scrypt":
+            return ",".join(str(v) for v in self.scrypt_params)
+        return str(self.iterations)
+
+    def _derive(
+        self, password: str, scheme: str, params: str, salt: bytes, dklen: int
+    ) -> bytes:
+        if scheme == "pbkdf2_sha256":
+            return self._pbkdf2(password, salt, int(params), dklen)
+        if scheme == "scrypt":
+            n, r, p = (int(v) for v in params.split(","))
+            return self._scrypt(password, salt, n, r, p, dklen)
+        raise ValueError(f"unknown password hash scheme: {scheme}")
+
+    # --- public API --------------------------------------------------------
 
     def generate_salt(self, length: int | None = None) -> str:
         """Generate a random salt and return it as a hex string."""
         length = length or self.salt_bytes
         return secrets.token_bytes(length).hex()
 
+    def encode(self, password: str, salt_hex: str | None = None) -> str:
+        """Hash `password` with the configured scheme; returns the encoded hash."""
+        salt_hex = salt_hex or self.generate_salt()
+        params = self._params()
+        dk = self._derive(
+            password, self.scheme, params, bytes.fromhex(salt_hex), self.dklen
+        )
+        return f"{self.scheme}${params}${salt_hex}${dk.hex()}"
+
+    def new_hash(self, password: str) -> Tuple[str, str]:
+        """Return (salt_hex, encoded_hash) for a new password.
+
+        The salt is also part of the encoded hash; it is returned separately
+        for the `salt` column of the users table.
+        """
+        salt_hex = self.generate_salt()
+        return salt_hex, self.encode(password, salt_hex)
+
     def hash_password(self, password: str, salt_hex: str) -> str:
-        """Return hex-encoded PBKDF2-HMAC-SHA256 derived key for given password+salt."""
-        dk = hashlib.pbkdf2_hmac(
-            "sha256",
-            password.encode("utf-8"),
-            bytes.fromhex(salt_hex),
-            self.iterations,
-            dklen=self.dklen,
+        """Return hex-encoded PBKDF2-HMAC-SHA256 derived key for given password+salt.
+
+        This is the legacy bare format; new hashes should use `encode`.
+        """
+        dk = self._pbkdf2(
+            password, bytes.fromhex(salt_hex), self.iterations, self.dklen
         )
         return dk.hex()
 
     def verify_password(
         self, password: str, salt_hex: str, expected_hash_hex: str
     ) -> bool:
-        """Verify that `password` with `salt_hex` produces `expected_hash_hex`.
+        """Verify that `password` matches a stored hash.
 
-        Comparison is done with constant-time `hmac.compare_digest`.
+        `expected_hash_hex` may be an encoded hash (its own salt is used) or a
+        bare legacy hash salted with `salt_hex`. Comparison is done with
+        constant-time `hmac.compare_digest`.
         """
-        computed = self.hash_password(password, salt_hex)
+        if "$" in expected_hash_hex:
+            try:
+                scheme, params, salt, digest = expected_hash_hex.split("$")
+                expected = bytes.fromhex(digest)
+                computed = self._derive(
+                    password, scheme, params, bytes.fromhex(salt), len(expected)
+                )
+            except ValueError:
+                return False  # malformed or unknown scheme
+            return hmac.compare_digest(computed, expected)
+        computed = self._pbkdf2(
+            password,
+            bytes.fromhex(salt_hex),
+            LEGACY_PBKDF2_ITERATIONS,
+            len(expected_hash_hex) // 2,
+        ).hex()
         return hmac.compare_digest(computed, expected_hash_hex)
 
+    def needs_rehash(self, stored_hash: str) -> bool:
+        """True if `stored_hash` is not in the configured scheme and cost."""
+        parts = stored_hash.split("$")
+        if len(parts) != 4:
+            return True  # legacy bare hash
+        scheme, params, _, digest = parts
+        return (
+            scheme != self.scheme
+            or params != self._params()
+            or len(digest) != self.dklen * 2
+        )
+
     def change_password(
         self, old_password: str, new_password: str, salt_hex: str, stored_hash_hex: str
     ) -> Tuple[str, str]:
-        """If `old_password` matches the stored hash, generate a new salt and return (new_salt_hex, new_hash_hex).
+        """If `old_password` matches the stored hash, generate a new salt and return (new_salt_hex, new_hash).
 
+        The new hash is encoded with the configured scheme.
         Raises ValueError if verification fails.
         """
         if not self.verify_password(old_password, salt_hex, stored_hash_hex):
             raise ValueError("old password does not match")
-        new_salt = self.generate_salt()
-        new_hash = self.hash_password(new_password, new_salt)
-        return new_salt, new_hash
+        return self.new_hash(new_password)
 
 
-__all__ = ["PasswordManager"]
+__all__ = ["PasswordManager", "HashingBusy", "SCHEMES", "LEGACY_PBKDF2_ITERATIONS"]
@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import cProfile
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from flask import Flask, g, request
+
+# file extensions written to the profile directory
+PSTATS_EXT = "pstats"
+COLLAPSED_EXT = "collapsed"
+
+# <time>-<pid>-<seq>.<endpoint>.<duration>ms.<kind>
+_NAME_RE = re.compile(
+    rf"(\d{{8}}T\d{{6}})-(\d+)-(\d+)\.(.+)\.(\d+)ms\.({PSTATS_EXT}|{COLLAPSED_EXT})"
+)
+
+# deepest stack recorded by the sampler (frames beyond are cut at the root)
+_MAX_DEPTH = 128
+
+
+def _frame_name(code) -> str:
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+def _collapse(frame) -> str:
+    # root-first "a (x.py:1);b (y.py:7)", the format of flamegraph.pl/speedscope
+    names: List[str] = []
+    while frame is not None and len(names) < _MAX_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def parse_name(name: str) -> Optional[Dict[str, Any]]:
+    """Split a profile file name into its parts, or None if it is not one.
+
+    Names look like `20261017T101112-4321-7.topics.get_topic.842ms.pstats`:
+    time, pid, sequence number, endpoint, duration and kind.
+    """
+    m = _NAME_RE.fullmatch(name)
+    if m is None:
+        return None
+    return {
+        "name": name,
+        "time": m.group(1),
+        "pid": int(m.group(2)),
+        "endpoint": m.group(4),
+        "duration_ms": int(m.group(5)),
+        "kind": m.group(6),
+    }
+
+
+class RequestProfiler:
+    """Opt-in profiling of live requests, written to a bounded directory.
+
+    Two independent triggers:
+
+    * `sample_rate`: this fraction of requests runs under cProfile and is
+      saved as a `.pstats` file (`python -m pstats <file>`, snakeviz). Only
+      one request per process is profiled at a time; requests that would
+      overlap are skipped (counted as `busy`).
+    * `slow_ms`: a daemon thread samples the stacks of all in-flight requests
+      every `interval_ms`; requests that end up slower than `slow_ms` are
+      saved as collapsed stacks (`.collapsed`, for flamegraph.pl or
+      speedscope). The sampler sleeps while no request is running.
+
+    `endpoints` limits both to some routes ("topics.get_topic",
+    "auth.login"). File names carry the endpoint and duration (see
+    `parse_name`); the oldest files beyond `max_files` are removed. With
+    both triggers off the app is left untouched.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        sample_rate: float = 0.0,
+        slow_ms: float = 0.0,
+        interval_ms: float = 5.0,
+        endpoints: Iterable[str] = (),
+        max_files: int = 200,
+    ):
+        self.directory = directory
+        self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        self.slow_ms = max(0.0, float(slow_ms))
+        self.interval = max(0.001, float(interval_ms) / 1000)
+        self.endpoints = frozenset(e.strip() for e in endpoints if e.strip())
+        self.max_files = max(1, int(max_files))
+        # cProfile can only have one active profiler per process on newer
+        # Pythons (sys.monitoring); never block a request waiting for it
+        self._cprofile_lock = threading.Lock()
+        self._cond = threading.Condition()
+        # thread ident -> stack counts of the request that thread is serving
+        self._active: Dict[int, "Counter[str]"] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._seq = 0
+        self._stats_lock = threading.Lock()
+        self.profiled = 0
+        self.busy = 0
+        self.slow = 0
+        self.written = 0
+        self.removed = 0
+        self.errors = 0
+        self.sampler_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_ms > 0
+
+    def init_app(self, app: Flask) -> None:
+        app.profiler = self
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    # --- request hooks ----------------------------------------------------
+
+    def _before_request(self) -> None:
+        endpoint = request.endpoint or "<unmatched>"
+        if self.endpoints and endpoint not in self.endpoints:
+            return
+        if self.sample_rate and random.random() < self.sample_rate:
+            if self._cprofile_lock.acquire(blocking=False):
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError:
+                    # another profiling tool (a debugger) is active
+                    self._cprofile_lock.release()
+                else:
+                    g.profile = profile
+            else:
+                with self._stats_lock:
+                    self.busy += 1
+        if self.slow_ms:
+            self._ensure_thread()
+            counts: "Counter[str]" = Counter()
+            with self._cond:
+                self._active[threading.get_ident()] = counts
+                self._cond.notify()
+            g.profile_stacks = counts
+        g.profile_start = time.perf_counter()
+
+    def _teardown_request(self, exc=None) -> None:
+        start = g.pop("profile_start", None)
+        if start is None:
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        endpoint = request.endpoint or "<unmatched>"
+        profile = g.pop("profile", None)
+        if profile is not None:
+            profile.disable()
+            self._cprofile_lock.release()
+            with self._stats_lock:
+                self.profiled += 1
+            self._write(endpoint, elapsed_ms, PSTATS_EXT, profile.dump_stats)
+        counts = g.pop("profile_stacks", None)
+        if counts is not None:
+            with self._cond:
+                self._active.pop(threading.get_ident(), None)
+            if elapsed_ms >= self.slow_ms and counts:
+                with self._stats_lock:
+                    self.slow += 1
+                self._write(endpoint, elapsed_ms, COLLAPSED_EXT, counts.most_common)
+
+    # --- sampler ----------------------------------------------------------
+
+    def _ensure_thread(self) -> None:
+        # threads do not survive fork(): start one per process on first use
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._active = {}
+            self._thread = threading.Thread(
+                target=self._sample_loop, name="request-profiler", daemon=True
+            )
+            self._thread.start()
+
+    def _sample_loop(self) -> None:
+        me = threading.get_ident()
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+                # under the lock: a finishing request reads its counts
+                # right after leaving _active
+                t0 = time.perf_counter()
+                frames = sys._current_frames()
+                for ident, counts in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None and ident != me:
+                        counts[_collapse(frame)] += 1
+                del frames
+                self.sampler_seconds += time.perf_counter() - t0
+            time.sleep(self.interval)
+
+    # --- files ------------------------------------------------------------
+
+    def _write(self, endpoint: str, elapsed_ms: float, ext: str, source) -> None:
+        with self._stats_lock:
+            self._seq += 1
+            seq = self._seq
+        name = "{}-{}-{}.{}.{}ms.{}".format(
+            time.strftime("%Y%m%dT%H%M%S"),
+            os.getpid(),
+            seq,
+            re.sub(r"[^A-Za-z0-9_.<>-]+", "_", endpoint),
+            int(elapsed_ms),
+            ext,
+        )
+        path = os.path.join(self.directory, name)
+        tmp = f"{path}.tmp"
+        try:
+            if ext == PSTATS_EXT:
+                source(tmp)
+            else:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    for stack, count in source():
+                        f.write(f"{stack} {count}\n")
+            os.replace(tmp, path)
+        except OSError:
+            with self._stats_lock:
+                self.errors += 1
+            return
+        with self._stats_lock:
+            self.written += 1
+        self._prune()
+
+    def _prune(self) -> None:
+        # the directory is shared by all workers: tolerate files vanishing
+        entries = []
+        for name in os.listdir(self.directory):
+            if parse_name(name) is None:
+                continue
+            try:
+                entries.append(
+                    (os.path.getmtime(os.path.join(self.directory, name)), name)
+                )
+            except OSError:
+                continue
+        if len(entries) <= self.max_files:
+            return
+        entries.sort()
+        for _, name in entries[: len(entries) - self.max_files]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            with self._stats_lock:
+                self.removed += 1
+
+    def list_profiles(self, endpoint: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Profiles on disk (of all workers), newest first."""
+        out = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return out
+        for name in names:
+            info = parse_name(name)
+            if info is None or (endpoint and info["endpoint"] != endpoint):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            info["size"] = st.st_size
+            info["mtime"] = st.st_mtime
+            out.append(info)
+        out.sort(key=lambda i: i["mtime"], reverse=True)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "enabled": self.enabled,
+                "sample_rate": self.sample_rate,
+                "slow_ms": self.slow_ms,
+                # requests run under cProfile / skipped because one already was
+                "profiled": self.profiled,
+                "busy": self.busy,
+                # requests over slow_ms saved from the stack sampler
+                "slow": self.slow,
+                "written": self.written,
+                "removed": self.removed,
+                "errors": self.errors,
+                "in_flight": len(self._active),
+                "sampler_seconds": self.sampler_seconds,
+            }
+
+
+__all__ = ["RequestProfiler", "parse_name", "PSTATS_EXT", "COLLAPSED_EXT"]
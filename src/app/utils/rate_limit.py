@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+log = logging.getLogger(__name__)
+
+_PERIODS = {"second": 1.0, "minute": 60.0, "hour": 3600.0, "day": 86400.0}
+_RATE_RE = re.compile(
+    r"^\s*(\d+)\s*/\s*(?:(\d+)\s*)?(second|minute|hour|day)s?"
+    r"(?:\s*;\s*burst\s*=\s*(\d+))?\s*$"
+)
+
+
+def parse_rate(spec: str) -> Tuple[float, float]:
+    """Parse "10/minute", "5/10 seconds" or "100/hour; burst=20".
+
+    Returns (tokens per second, bucket size). The burst defaults to the count,
+    i.e. a client may use a whole period's allowance at once.
+    """
+    m = _RATE_RE.match(spec or "")
+    if not m:
+        raise ValueError(f"invalid rate limit: {spec!r}")
+    count, mult, period, burst = m.groups()
+    seconds = _PERIODS[period] * int(mult or 1)
+    return int(count) / seconds, float(burst or count)
+
+
+class RateLimiter:
+    """Token buckets keyed by client (IP, user, ...), bounded in memory.
+
+    Each key gets a bucket of `burst` tokens refilled at `rate` tokens per
+    second. At most `max_keys` buckets are kept; the least recently used ones
+    are dropped first, which only forgets that client's spent tokens, so
+    address churn cannot grow memory.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        max_keys: int = 10_000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_keys = int(max_keys)
+        self._clock = clock
+        # key -> (tokens, last refill time)
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+        self.evictions = 0
+
+    def hit(self, key: Hashable, cost: float = 1.0) -> float:
+        """Take `cost` tokens for `key`.
+
+        Returns 0.0 if allowed, otherwise the seconds until enough tokens
+        are available (nothing is taken then).
+        """
+        now = self._clock()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+                self.allowed += 1
+            else:
+                wait = (cost - tokens) / self.rate if self.rate > 0 else float("inf")
+                self.limited += 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+            return wait
+
+    def refund(self, key: Hashable, cost: float = 1.0) -> None:
+        """Give back `cost` tokens taken by `hit()` (request rejected anyway)."""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                return  # evicted meanwhile: the bucket starts full again
+            tokens, last = bucket
+            self._buckets[key] = (min(self.burst, tokens + cost), last)
+            self.allowed -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "keys": len(self._buckets),
+                "max_keys": self.max_keys,
+                "rate": self.rate,
+                "burst": self.burst,
+                "allowed": self.allowed,
+                "limited": self.limited,
+                "evictions": self.evictions,
+            }
+
+
+def _bucket_key(key: Hashable) -> str:
+    # ("ip", "10.0.0.1") -> "ip:10.0.0.1"
+    if isinstance(key, tuple):
+        return ":".join(str(k) for k in key)
+    return str(key)
+
+
+class SQLiteRateLimiter:
+    """`RateLimiter` whose buckets live in SQLite, shared by worker processes.
+
+    With per-process buckets every gunicorn worker would allow the full rate,
+    multiplying the limit by the number of workers. Here each `hit()` reads
+    and rewrites the client's row of the `rate_buckets` table (one table for
+    all rules, keyed by `name`) in a `BEGIN IMMEDIATE` transaction. At most
+    `max_keys` buckets per rule are kept, least recently used dropped first.
+    If the database fails, requests are let through (and counted as errors)
+    rather than rejected.
+    """
+
+    def __init__(
+        self,
+        pool: Any,
+        name: str,
+        rate: float,
+        burst: float,
+        max_keys: int = 10_000,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.pool = pool
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_keys = int(max_keys)
+        # wall clock: shared by all processes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+        self.errors = 0
+        with self.pool.connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                  rule TEXT NOT NULL,
+                  key TEXT NOT NULL,
+                  tokens REAL NOT NULL,
+                  updated_at REAL NOT NULL,
+                  PRIMARY KEY (rule, key)
+                );
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS rate_buckets_rule_updated_at"
+                " ON rate_buckets (rule, updated_at)"
+            )
+            conn.commit()
+
+    def hit(self, key: Hashable, cost: float = 1.0) -> float:
+        """Take `cost` tokens for `key`; see `RateLimiter.hit`."""
+        bkey = _bucket_key(key)
+        try:
+            with self.pool.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                now = self._clock()
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM rate_buckets"
+                    " WHERE rule = ? AND key = ?",
+                    (self.name, bkey),
+                ).fetchone()
+                tokens, last = tuple(row) if row is not None else (self.burst, now)
+                tokens = min(self.burst, tokens + max(0.0, now - last) * self.rate)
+                if tokens >= cost:
+                    tokens -= cost
+                    wait = 0.0
+                else:
+                    wait = (
+                        (cost - tokens) / self.rate if self.rate > 0 else float("inf")
+                    )
+                conn.execute(
+                    "INSERT INTO rate_buckets (rule, key, tokens, updated_at)"
+                    " VALUES (?, ?, ?, ?) ON CONFLICT (rule, key) DO UPDATE"
+                    " SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                    (self.name, bkey, tokens, now),
+                )
+                if row is None:
+                    conn.execute(
+                        "DELETE FROM rate_buckets WHERE rule = ? AND updated_at < ("
+                        " SELECT updated_at FROM rate_buckets WHERE rule = ?"
+                        " ORDER BY updated_at DESC LIMIT 1 OFFSET ?)",
+                        (self.name, self.name, self.max_keys - 1),
+                    )
+                conn.commit()
+        except Exception:
+            # sqlite3.Error, PoolTimeout, ...
+            log.warning("rate limit check failed; letting the request through")
+            with self._lock:
+                self.errors += 1
+            return 0.0
+        with self._lock:
+            if wait == 0.0:
+                self.allowed += 1
+            else:
+                self.limited += 1
+        return wait
+
+    def refund(self, key: Hashable, cost: float = 1.0) -> None:
+        """Give back `cost` tokens taken by `hit()` (request rejected anyway)."""
+        try:
+            with self.pool.connection() as conn:
+                conn.execute(
+                    "UPDATE rate_buckets SET tokens = min(?, tokens + ?)"
+                    " WHERE rule = ? AND key = ?",
+                    (self.burst, cost, self.name, _bucket_key(key)),
+                )
+                conn.commit()
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            return
+        with self._lock:
+            self.allowed -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            with self.pool.connection() as conn:
+                keys = conn.execute(
+                    "SELECT count(*) FROM rate_buckets WHERE rule = ?", (self.name,)
+                ).fetchone()[0]
+        except Exception:
+            keys = None
+        with self._lock:
+            return {
+                "keys": keys,
+                "max_keys": self.max_keys,
+                "rate": self.rate,
+                "burst": self.burst,
+                "allowed": self.allowed,
+                "limited": self.limited,
+                "errors": self.errors,
+                "shared": True,
+            }
+
+
+class ConcurrencyLimiter:
+    """Caps how many requests run at once; excess requests are rejected.
+
+    Rejecting immediately (instead of queueing) keeps worker threads free
+    for other routes while the limited ones are saturated.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = int(limit)
+        self._sem = threading.BoundedSemaphore(max(1, self.limit))
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if not self._sem.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.in_flight += 1
+            self.admitted += 1
+            self.peak = max(self.peak, self.in_flight)
+        return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        self._sem.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "peak": self.peak,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+
+
+__all__ = ["parse_rate", "RateLimiter", "SQLiteRateLimiter", "ConcurrencyLimiter"]
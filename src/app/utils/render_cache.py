@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def content_version(text: str) -> str:
+    """Short content hash used to key cached renders of `text`."""
+    return hashlib.blake2b((text or "").encode("utf-8"), digest_size=12).hexdigest()
+
+
+class RenderCache:
+    """LRU cache of rendered topic HTML bounded by total size in bytes.
+
+    Entries are keyed by topic id and carry a version (content hash or
+    `updated_at`); a lookup with a different version is a miss and the stale
+    entry is replaced, so edits never serve old HTML.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = int(max_bytes)
+        self._entries: "OrderedDict[str, Tuple[str, str, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, tid: Any, version: str) -> Optional[str]:
+        key = str(tid)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, tid: Any, version: str, html: str) -> None:
+        key = str(tid)
+        size = sys.getsizeof(html)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (version, html, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def get_or_render(self, tid: Any, version: str, render: Callable[[], str]) -> str:
+        html = self.get(tid, version)
+        if html is None:
+            html = render()
+            self.put(tid, version, html)
+        return html
+
+    def invalidate(self, tid: Any) -> None:
+        with self._lock:
+            old = self._entries.pop(str(tid), None)
+            if old is not None:
+                self._bytes -= old[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+__all__ = ["RenderCache", "content_version"]
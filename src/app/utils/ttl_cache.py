@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    `None` is a valid cached value (e.g. "no such user"), so lookups return
+    a `(found, value)` pair. Expiry bounds how long another process's change
+    can go unnoticed; changes made through this process should `invalidate`.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = int(max_entries)
+        self.ttl = float(ttl)
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        expires = self._clock() + self.ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+__all__ = ["TTLCache"]
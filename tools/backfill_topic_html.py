@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Migrate the topics DB and fill `body_html` for existing rows.
+
+Adds the `body_html` / `render_version` columns if missing, then renders
+every row whose stored HTML is missing or was produced by a different
+MarkdownRenderer version, in batches (one transaction per batch).
+
+Usage:
+  PYTHONPATH=src python3 tools/backfill_topic_html.py [--db data/data.db] [--batch-size 500] [--force]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+from app.repositories.topic_repo_sqlite import SQLiteTopicRepository
+from app.utils.markdown import MarkdownRenderer
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill rendered topic HTML")
+    parser.add_argument(
+        "--db",
+        default=os.environ.get("TOPICS_DB", "data/data.db"),
+        help="Path to topics DB",
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument(
+        "--force", action="store_true", help="re-render every row, not only stale ones"
+    )
+    args = parser.parse_args()
+
+    repo = SQLiteTopicRepository(db_path=args.db, renderer=MarkdownRenderer())
+    repo.ensure_schema()
+    start = time.perf_counter()
+    n = repo.rerender_stale(batch_size=args.batch_size, force=args.force)
+    print(
+        f"rendered {n} topics with renderer {repo.renderer.version} "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+    repo.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark: random topic selection with and without the in-memory pick index.
+
+Compares `random_topic_id()` (ORDER BY RANDOM() / directory glob) against
+`OmikujiService.pick_random_topic()` backed by `RandomPickIndex` on a
+synthetic corpus in a temporary directory.
+
+Usage:
+  PYTHONPATH=src python3 tools/bench_random_topic.py [--sqlite-count 1000000] [--file-count 20000] [--draws 200]
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from app.repositories.topic_repo_file import FileTopicRepository
+from app.repositories.topic_repo_sqlite import SQLiteTopicRepository
+from app.services.omikuji import OmikujiService
+
+
+def fill_sqlite(repo: SQLiteTopicRepository, count: int) -> None:
+    # bulk insert straight through sqlite3; the FTS trigger is not needed here
+    conn = sqlite3.connect(repo.db_path)
+    try:
+        conn.execute("DROP TRIGGER IF EXISTS topics_ai")
+        conn.executemany(
+            "INSERT INTO topics (slug, title, body) VALUES (?, ?, ?)",
+            ((f"topic-{i}", f"topic {i}", "body") for i in range(count)),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def fill_files(topics_dir: Path, count: int) -> None:
+    for i in range(count):
+        (topics_dir / f"20260101_000000_topic-{i}.md").write_text(
+            f"topic {i}\nbody\n", encoding="utf-8"
+        )
+
+
+def measure(fn, draws: int) -> list[float]:
+    samples = []
+    for _ in range(draws):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label: str, samples: list[float]) -> None:
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"  {label:<28} p50={statistics.median(samples):9.4f}ms  p99={p99:9.4f}ms")
+
+
+def bench(name: str, repo, draws: int) -> None:
+    print(f"{name}:")
+    report("random_topic_id()", measure(repo.random_topic_id, draws))
+    service = OmikujiService(repo)
+    start = time.perf_counter()
+    service.pick_random_topic()
+    print(
+        f"  {'index build (first draw)':<28} {(time.perf_counter() - start) * 1000:9.1f}ms"
+    )
+    report("pick_random_topic() [index]", measure(service.pick_random_topic, draws))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sqlite-count", type=int, default=1_000_000)
+    parser.add_argument("--file-count", type=int, default=20_000)
+    parser.add_argument("--draws", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.sqlite_count:
+            repo = SQLiteTopicRepository(db_path=str(Path(tmp) / "bench.db"))
+            repo.ensure_schema()
+            fill_sqlite(repo, args.sqlite_count)
+            bench(f"sqlite ({args.sqlite_count} topics)", repo, args.draws)
+            repo.close()
+        if args.file_count:
+            topics_dir = Path(tmp) / "topics"
+            topics_dir.mkdir()
+            fill_files(topics_dir, args.file_count)
+            bench(
+                f"file ({args.file_count} topics)",
+                FileTopicRepository(str(topics_dir)),
+                args.draws,
+            )
+
+
+if __name__ == "__main__":
+    main()
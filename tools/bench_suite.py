@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: repository methods and Flask routes on synthetic corpora.
+
+`run` generates deterministic Japanese and/or English topic corpora of the
+given sizes for the SQLite and file backends, then measures every
+repository method and the main routes (through the Flask test client) and
+reports p50/p99 latency and throughput. Results can be written as JSON
+(`--output`) and checked against a saved run (`--baseline`). `compare`
+checks two saved runs. Both exit with status 1 when a case got slower than
+`--threshold` (p50 or p99, relative).
+
+Corpora are generated in a temporary directory unless `--workdir` is given;
+there they are kept and reused by later runs (1M topics take a while to
+generate: a few minutes for SQLite, far longer for the file backend).
+
+Usage:
+  PYTHONPATH=src python3 tools/bench_suite.py run [--backends sqlite,file] \
+      [--corpora ja,en] [--sizes 1k,100k,1m] [--iterations 200] \
+      [--workdir bench-data] [--output results.json] \
+      [--baseline baseline.json] [--threshold 0.2]
+  PYTHONPATH=src python3 tools/bench_suite.py compare baseline.json results.json \
+      [--threshold 0.2]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from app import create_app
+from app.repositories.topic_repo import encode_cursor
+from app.repositories.topic_repo_file import FileTopicRepository
+from app.repositories.topic_repo_sqlite import SQLiteTopicRepository
+from app.services.omikuji import OmikujiService
+
+FORMAT_VERSION = 1
+
+# --- synthetic corpora -------------------------------------------------------
+
+_JA_WORDS = (
+    "最近 ハマっている 趣味 休日 過ごし方 好きな 食べ物 子供の頃 夢 旅行 行きたい 場所 "
+    "おすすめ 映画 音楽 ラーメン コーヒー 朝ごはん 週末 思い出 失敗談 仕事 勉強 "
+    "プログラミング 温泉 猫 犬 季節 夏休み 冬 雪 桜 お祭り 花火 カレー 寿司 "
+    "読書 漫画 アニメ ゲーム 運動 散歩 料理 お弁当 電車 自転車 雨の日 天気 "
+    "図書館 美術館 動物園 水族館 山登り 海 キャンプ 写真 カメラ 友達 家族"
+).split()
+_JA_JOINERS = ("の", "と", "について", "で", "が好きな", "に関する")
+_JA_ENDINGS = ("は何ですか？", "を教えてください。", "について話そう。", "はありますか？")
+
+_EN_WORDS = (
+    "favorite food travel weekend hobby childhood dream movie music coffee "
+    "breakfast summer winter memory mistake work study programming garden "
+    "cat dog season festival camping photo camera friend family book comic "
+    "game running cooking lunch train bicycle rain weather library museum "
+    "ocean mountain island recipe holiday concert podcast language puzzle"
+).split()
+_EN_JOINERS = ("and", "of", "about", "with", "for", "during")
+_EN_STARTS = ("What is your", "Tell us about your", "Share a", "Do you have a")
+
+
+def _ja_phrase(rng: random.Random) -> str:
+    words = rng.sample(_JA_WORDS, rng.randint(2, 3))
+    return rng.choice(_JA_JOINERS).join(words)
+
+
+def _en_phrase(rng: random.Random) -> str:
+    words = rng.sample(_EN_WORDS, rng.randint(2, 3))
+    return f" {rng.choice(_EN_JOINERS)} ".join(words)
+
+
+def make_topic(rng: random.Random, corpus: str, i: int) -> Dict[str, str]:
+    """One synthetic Markdown topic; the same (seed, corpus, i) gives the same topic."""
+    if corpus == "ja":
+        title = _ja_phrase(rng) + rng.choice(_JA_ENDINGS)
+        sentences = [_ja_phrase(rng) + rng.choice(_JA_ENDINGS) for _ in range(4)]
+        items = [_ja_phrase(rng) for _ in range(3)]
+    else:
+        title = f"{rng.choice(_EN_STARTS)} {_en_phrase(rng)}?"
+        sentences = [f"{rng.choice(_EN_STARTS)} {_en_phrase(rng)}." for _ in range(4)]
+        items = [_en_phrase(rng) for _ in range(3)]
+    body = (
+        f"{sentences[0]} **{sentences[1]}**\n\n"
+        + "\n".join(f"- {item}" for item in items)
+        + f"\n\n{sentences[2]} {sentences[3]} #{i}\n"
+    )
+    return {"title": title, "body": body}
+
+
+def corpus_topics(corpus: str, size: int, seed: int = 1) -> Iterator[Dict[str, str]]:
+    rng = random.Random(f"{seed}-{corpus}")
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for i in range(size):
+        t = make_topic(rng, corpus, i)
+        # spread creation times so keyset paging sees realistic keys
+        t["created_at"] = (start + timedelta(seconds=30 * i)).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+        yield t
+
+
+def search_terms(corpus: str) -> List[str]:
+    # a mix of trigram-indexed (3+ chars) and short (LIKE-filtered) terms
+    if corpus == "ja":
+        return ["コーヒー", "プログラミング", "温泉", "旅行 写真", "猫", "図書館 友達"]
+    return ["coffee", "programming", "travel photo", "cat", "museum*", "rain weather"]
+
+
+def build_sqlite(path: Path, corpus: str, size: int) -> None:
+    repo = SQLiteTopicRepository(db_path=str(path))
+    repo.ensure_schema()
+    repo.create_topics_bulk(corpus_topics(corpus, size))
+    repo.close()
+
+
+def build_files(topics_dir: Path, corpus: str, size: int) -> None:
+    topics_dir.mkdir(parents=True, exist_ok=True)
+    for i, t in enumerate(corpus_topics(corpus, size)):
+        ts = datetime.strptime(t["created_at"], "%Y-%m-%d %H:%M:%S")
+        name = f"{ts:%Y%m%d_%H%M%S}_bench-{i}.md"
+        (topics_dir / name).write_text(f"{t['title']}\n{t['body']}", encoding="utf-8")
+
+
+def prepare_corpus(workdir: Path, backend: str, corpus: str, size: int) -> Path:
+    """Generate (or reuse) a corpus; returns the DB file or the topics dir."""
+    base = workdir / f"{backend}-{corpus}-{size}"
+    done = base / ".complete"
+    target = base / ("data.db" if backend == "sqlite" else "topics")
+    if done.exists():
+        return target
+    if base.exists():
+        # interrupted earlier: start over
+        for p in sorted(base.rglob("*"), reverse=True):
+            p.rmdir() if p.is_dir() else p.unlink()
+    base.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    if backend == "sqlite":
+        build_sqlite(target, corpus, size)
+    else:
+        build_files(target, corpus, size)
+    done.write_text(f"{time.perf_counter() - start:.1f}s\n")
+    print(
+        f"# generated {backend}/{corpus}/{size} in {time.perf_counter() - start:.1f}s",
+        file=sys.stderr,
+    )
+    return target
+
+
+# --- measuring ---------------------------------------------------------------
+
+
+def measure(
+    fn: Callable[[Any], Any], args: Sequence[Any], warmup: int = 5
+) -> List[float]:
+    """Call `fn(arg)` for each arg (after `warmup` unmeasured calls); ms per call."""
+    for arg in args[:warmup]:
+        fn(arg)
+    samples = []
+    for arg in args:
+        start = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    s = sorted(samples)
+    total = sum(s)
+    return {
+        "n": len(s),
+        "p50_ms": statistics.median(s),
+        "p99_ms": s[min(len(s) - 1, int(len(s) * 0.99))],
+        "mean_ms": total / len(s),
+        "ops_per_s": len(s) / (total / 1000) if total else 0.0,
+    }
+
+
+class Suite:
+    def __init__(self, iterations: int, seed: int = 1):
+        self.iterations = iterations
+        self.rng = random.Random(seed)
+        self.results: List[Dict[str, Any]] = []
+
+    def case(
+        self, context: Dict[str, Any], kind: str, name: str, fn, args, warmup: int = 5
+    ) -> None:
+        samples = measure(fn, args, warmup=warmup)
+        row = dict(context, kind=kind, name=name, **summarize(samples))
+        self.results.append(row)
+        print(
+            f"  {kind:<5} {name:<34} p50={row['p50_ms']:9.3f}ms "
+            f"p99={row['p99_ms']:9.3f}ms {row['ops_per_s']:10.0f}/s"
+        )
+
+    def sample(self, population: Sequence[Any], k: Optional[int] = None) -> List[Any]:
+        k = k or self.iterations
+        return [self.rng.choice(population) for _ in range(k)]
+
+    def bench_repo(self, context, repo, ids: List[Any], corpus: str) -> None:
+        n = self.iterations
+        # O(n) operations get fewer rounds on big corpora
+        few = max(5, min(n, 2_000_000 // max(1, len(ids))))
+        self.case(context, "repo", "get_topic", repo.get_topic, self.sample(ids))
+        self.case(
+            context,
+            "repo",
+            "list_topics(limit=50)",
+            lambda _: repo.list_topics(limit=50),
+            range(n),
+        )
+        # keyset positions spread over (up to) the newest 20k topics
+        cursors = [
+            encode_cursor(t["created_at"], t["id"])
+            for t in repo.list_topics(limit=min(len(ids), 20_000))
+        ]
+        self.case(
+            context,
+            "repo",
+            "list_topics(limit=50, cursor)",
+            lambda c: repo.list_topics(limit=50, cursor=c),
+            self.sample(cursors),
+        )
+        self.case(
+            context,
+            "repo",
+            "iter_topics (1000 topics)",
+            lambda _: sum(1 for _ in islice(repo.iter_topics(), 1000)),
+            range(min(n, 50)),
+        )
+        self.case(
+            context,
+            "repo",
+            "list_topic_ids",
+            lambda _: repo.list_topic_ids(),
+            range(few),
+        )
+        self.case(
+            context,
+            "repo",
+            "random_topic_id",
+            lambda _: repo.random_topic_id(),
+            range(few),
+        )
+        self.case(context, "repo", "revision", lambda _: repo.revision(), range(n))
+        self.case(
+            context,
+            "repo",
+            "search(limit=20)",
+            lambda q: repo.search(q, limit=20),
+            self.sample(search_terms(corpus), min(n, 100)),
+        )
+        service = OmikujiService(repo)
+        service.pick_random_topic()
+        self.case(
+            context,
+            "repo",
+            "omikuji pick (index)",
+            lambda _: service.pick_random_topic(),
+            range(n),
+        )
+        # writes last; every created topic is deleted again so a reused
+        # corpus keeps its size
+        created: List[Any] = []
+        new = [make_topic(self.rng, corpus, i) for i in range(min(n, 100))]
+        for i, t in enumerate(new):
+            # the file backend names files by second + ASCII slug of the title
+            t["title"] += f" bench-{i}"
+
+        self.case(
+            context,
+            "repo",
+            "create_topic",
+            lambda t: created.append(repo.create_topic(t["title"], t["body"])),
+            new,
+            warmup=0,
+        )
+        self.case(
+            context,
+            "repo",
+            "delete_topic",
+            repo.delete_topic,
+            list(dict.fromkeys(created)),
+            warmup=0,
+        )
+
+    def bench_routes(self, context, app, ids: List[Any], corpus: str) -> None:
+        n = self.iterations
+        client = app.test_client()
+        with client.session_transaction() as s:
+            s["username"] = "bench"
+            s["roles"] = ["admin"]
+        as_json = {"Accept": "application/json"}
+        as_html = {"Accept": "text/html"}
+
+        def get(path, headers):
+            def call(arg):
+                r = client.get(path.format(arg), headers=headers)
+                if r.status_code != 200:
+                    raise RuntimeError(f"{path.format(arg)}: {r.status_code}")
+                r.close()
+
+            return call
+
+        self.case(
+            context, "route", "GET /omikuji (json)", get("/omikuji", as_json), range(n)
+        )
+        self.case(
+            context,
+            "route",
+            "GET /omikuji/draw",
+            get("/omikuji/draw", as_json),
+            range(n),
+        )
+        self.case(
+            context,
+            "route",
+            "GET /topics?limit=50",
+            get("/topics?limit=50", as_json),
+            range(n),
+        )
+        self.case(
+            context, "route", "GET /topics (html)", get("/topics", as_html), range(n)
+        )
+        self.case(
+            context,
+            "route",
+            "GET /topics/<id> (html)",
+            get("/topics/{}", as_html),
+            self.sample(ids),
+        )
+        self.case(
+            context,
+            "route",
+            "GET /topics/<id> (json)",
+            get("/topics/{}", as_json),
+            self.sample(ids),
+        )
+        self.case(
+            context,
+            "route",
+            "GET /topics/search",
+            get("/topics/search?q={}&limit=20", as_json),
+            self.sample(search_terms(corpus), min(n, 100)),
+        )
+
+
+def make_app(backend: str, target: Path, tmp: Path):
+    config = {
+        "USERS_DB": str(tmp / "users.db"),
+        # measure the work, not the protection around it
+        "RATE_LIMITS": {},
+        "ADMISSION_MAX_HEAVY": 0,
+    }
+    if backend == "sqlite":
+        config["TOPICS_DB"] = str(target)
+    else:
+        config.update(TOPICS_DB="", TOPICS_DIR=str(target))
+        config["TOPICS_SEARCH_INDEX"] = str(target.parent / "search.idx")
+    return create_app(config)
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * mult)
+
+
+def run(args) -> int:
+    suite = Suite(args.iterations, seed=args.seed)
+    with tempfile.TemporaryDirectory() as tmp_name:
+        tmp = Path(tmp_name)
+        workdir = Path(args.workdir) if args.workdir else tmp / "corpora"
+        for backend in args.backends.split(","):
+            for corpus in args.corpora.split(","):
+                for size in map(parse_size, args.sizes.split(",")):
+                    target = prepare_corpus(workdir, backend, corpus, size)
+                    context = {"backend": backend, "corpus": corpus, "size": size}
+                    print(f"{backend} / {corpus} / {size} topics:")
+                    if backend == "sqlite":
+                        repo = SQLiteTopicRepository(db_path=str(target))
+                    else:
+                        repo = FileTopicRepository(
+                            str(target),
+                            search_index_path=str(target.parent / "search.idx"),
+                        )
+                    ids = repo.list_topic_ids()
+                    if not args.routes_only:
+                        suite.bench_repo(context, repo, ids, corpus)
+                    if hasattr(repo, "close"):
+                        repo.close()
+                    if not args.repo_only:
+                        app = make_app(backend, target, tmp)
+                        suite.bench_routes(context, app, ids, corpus)
+                        app.user_repo.close()
+                        if hasattr(app.services.topic_repo, "close"):
+                            app.services.topic_repo.close()
+    report = {
+        "format": FORMAT_VERSION,
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "iterations": args.iterations,
+        },
+        "results": suite.results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=1), encoding="utf-8")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        return compare(baseline, report, args.threshold)
+    return 0
+
+
+# --- comparing ---------------------------------------------------------------
+
+
+def _key(row: Dict[str, Any]):
+    return (row["backend"], row["corpus"], row["size"], row["kind"], row["name"])
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> int:
+    """Print per-case changes; returns 1 if any case regressed beyond `threshold`."""
+    base = {_key(r): r for r in baseline["results"]}
+    regressions = 0
+    print(f"{'case':<70} {'p50':>16} {'p99':>16}")
+    for row in current["results"]:
+        old = base.get(_key(row))
+        label = "{} {} {} {} {}".format(*_key(row))
+        if old is None:
+            print(f"{label:<70} {'(new)':>16}")
+            continue
+        cells, flagged = [], False
+        for metric in ("p50_ms", "p99_ms"):
+            change = (row[metric] - old[metric]) / old[metric] if old[metric] else 0.0
+            flagged |= change > threshold
+            cells.append(f"{change:+.1%}")
+        regressions += flagged
+        mark = "  REGRESSION" if flagged else ""
+        print(f"{label:<70} {cells[0]:>16} {cells[1]:>16}{mark}")
+    print(f"{regressions} regression(s) over {threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("run", help="generate corpora and run the benchmarks")
+    p.add_argument("--backends", default="sqlite,file")
+    p.add_argument("--corpora", default="ja,en")
+    p.add_argument("--sizes", default="1k", help="e.g. 1k,100k,1m")
+    p.add_argument("--iterations", type=int, default=200)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--workdir", help="keep and reuse generated corpora here")
+    p.add_argument("--output", help="write results as JSON")
+    p.add_argument("--baseline", help="compare against a saved results file")
+    p.add_argument("--threshold", type=float, default=0.2)
+    p.add_argument("--repo-only", action="store_true")
+    p.add_argument("--routes-only", action="store_true")
+    c = sub.add_parser("compare", help="compare two saved results files")
+    c.add_argument("baseline")
+    c.add_argument("current")
+    c.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        sys.exit(run(args))
+    load = lambda path: json.loads(Path(path).read_text(encoding="utf-8"))
+    sys.exit(compare(load(args.baseline), load(args.current), args.threshold))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Build fingerprinted static assets for production.
+
+Copies every file in the static folder to `<name>.<content hash>.<ext>` in
+the assets directory, adds `.gz` (and `.br`, if the `brotli` package is
+installed) variants of text assets, an animated WebP version of the omikuji
+GIF (if Pillow is installed) and a `manifest.json` that the app reads at
+startup. Templates then link the hashed files under /assets/, served with
+`Cache-Control: immutable`. Restart the app after a build.
+
+Usage:
+  PYTHONPATH=src python3 tools/build_assets.py [--static src/app/static] \
+      [--out src/app/static/dist] [--no-webp] [--webp-quality 60]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+from app.utils.assets import build_assets
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build hashed static assets")
+    parser.add_argument(
+        "--static", default="src/app/static", help="Folder with the source files"
+    )
+    parser.add_argument(
+        "--out",
+        default=os.environ.get("ASSETS_DIR", "src/app/static/dist"),
+        help="Output folder (the app's ASSETS_DIR)",
+    )
+    parser.add_argument(
+        "--no-webp", action="store_true", help="Skip the animated WebP variant"
+    )
+    parser.add_argument("--webp-quality", type=int, default=60)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = build_assets(
+        args.static, args.out, webp=not args.no_webp, webp_quality=args.webp_quality
+    )
+    for name, entry in manifest["assets"].items():
+        encodings = ", ".join(f"{e}={n}" for e, n in entry["encodings"].items())
+        print(
+            f"{name} -> {entry['file']} ({entry['size']} bytes{', ' if encodings else ''}{encodings})"
+        )
+    print(
+        f"built {len(manifest['assets'])} assets in {time.perf_counter() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Build or update the on-disk search index of the file topic backend.
+
+By default only topics added or changed since the last run are (re)indexed;
+`--rebuild` drops the index and indexes every topic again.
+
+Usage:
+  PYTHONPATH=src python3 tools/build_search_index.py --index data/topics_search.db [--topics-dir topics] [--rebuild]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+from app.repositories.topic_repo_file import FileTopicRepository
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the file backend search index")
+    parser.add_argument("--topics-dir", default=os.environ.get("TOPICS_DIR", "topics"))
+    parser.add_argument(
+        "--index",
+        default=os.environ.get("TOPICS_SEARCH_INDEX", "data/topics_search.db"),
+        help="Path to the search index (keep it outside the topics dir)",
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="drop and rebuild the whole index"
+    )
+    args = parser.parse_args()
+
+    repo = FileTopicRepository(args.topics_dir, search_index_path=args.index)
+    start = time.perf_counter()
+    if args.rebuild:
+        repo.search_index.clear()
+    repo.list_topic_ids()  # scan the directory
+    indexed, removed = repo.sync_search_index()
+    print(
+        f"indexed {indexed} topics, removed {removed} "
+        f"({repo.search_index.count()} in index) in {time.perf_counter() - start:.1f}s"
+    )
+    repo.close()
+
+
+if __name__ == "__main__":
+    main()
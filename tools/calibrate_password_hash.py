@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Pick password hashing costs that take about `--target-ms` on this host.
+
+Measures PBKDF2-HMAC-SHA256 and scrypt (the median of a few runs per
+setting) and prints the settings to put in the environment. Existing users
+are moved to the new cost automatically when they next log in.
+
+Keep in mind that every login costs one hash per PASSWORD_HASH_WORKERS
+thread; pick the target latency with the expected login rate in mind.
+
+Usage:
+  PYTHONPATH=src python3 tools/calibrate_password_hash.py [--target-ms 250] [--scrypt-max-mb 64]
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+
+from app.utils.password_manager import PasswordManager
+
+
+def measure(pwm: PasswordManager, runs: int) -> float:
+    """Median time of one hash in milliseconds."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        pwm.encode("calibration-password")
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def calibrate_pbkdf2(target_ms: float, runs: int) -> tuple:
+    # PBKDF2 time is linear in the iteration count: scale from one probe
+    probe = 100_000
+    ms = measure(PasswordManager(iterations=probe, max_workers=0), runs)
+    iterations = max(10_000, int(probe * target_ms / ms) // 10_000 * 10_000)
+    ms = measure(PasswordManager(iterations=iterations, max_workers=0), runs)
+    return iterations, ms
+
+
+def calibrate_scrypt(target_ms: float, max_mb: int, runs: int) -> tuple:
+    # n must be a power of two; memory is 128 * r * n bytes (r = 8)
+    best = None
+    n = 2**12
+    while 128 * 8 * n <= max_mb * 1024 * 1024:
+        ms = measure(PasswordManager(scheme="scrypt", scrypt_n=n, max_workers=0), runs)
+        if best is None or ms <= target_ms:
+            best = (n, ms)
+        if ms > target_ms:
+            break
+        n *= 2
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Calibrate password hash costs")
+    parser.add_argument("--target-ms", type=float, default=250.0)
+    parser.add_argument(
+        "--scrypt-max-mb", type=int, default=64, help="memory cap per scrypt hash"
+    )
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    iterations, ms = calibrate_pbkdf2(args.target_ms, args.runs)
+    print(f"pbkdf2_sha256: {iterations} iterations -> {ms:.0f} ms")
+    n, scrypt_ms = calibrate_scrypt(args.target_ms, args.scrypt_max_mb, args.runs)
+    mem_mb = 128 * 8 * n / (1024 * 1024)
+    print(f"scrypt: n={n} (r=8, p=1, {mem_mb:.0f} MB) -> {scrypt_ms:.0f} ms")
+    print()
+    print("# PBKDF2")
+    print("PASSWORD_HASH_SCHEME=pbkdf2_sha256")
+    print(f"PASSWORD_PBKDF2_ITERATIONS={iterations}")
+    print("# or scrypt (memory-hard)")
+    print("PASSWORD_HASH_SCHEME=scrypt")
+    print(f"PASSWORD_SCRYPT_N={n}")
+
+
+if __name__ == "__main__":
+    main()
@@ -47,9 +47,8 @@ def create_user(
     db_path: str, username: str, password: str, roles: list[str] | None = None
 ) -> int:
     """Create a user in the specified users DB. Returns the inserted user id."""
-    pwm = PasswordManager()
-    salt = pwm.generate_salt()
-    password_hash = pwm.hash_password(password, salt)
+    pwm = PasswordManager(max_workers=0)  # hash inline, no thread pool
+    salt, password_hash = pwm.new_hash(password)
     conn = sqlite3.connect(db_path)
     cur = conn.cursor()
     try:
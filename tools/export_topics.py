@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Export topics as NDJSON (one JSON object per line), optionally gzipped.
+
+Streams from the repository in chunks, so memory use stays flat for any
+corpus size. `--since`/`--until` select topics by creation time (since
+inclusive, until exclusive); `until` defaults to now and is printed at the
+end, ready to be the `--since` of the next incremental run. The output can
+be loaded again with `POST /topics/bulk`.
+
+Exports the SQLite DB given by `--db`; with `--db ""` the file backend in
+`--topics-dir` is exported instead.
+
+Usage:
+  PYTHONPATH=src python3 tools/export_topics.py [--db data/data.db] [-o topics.ndjson.gz] [--gzip] [--since 2026-01-01] [--until 2026-02-01]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from app.repositories.topic_repo_file import FileTopicRepository
+from app.repositories.topic_repo_sqlite import SQLiteTopicRepository
+from app.utils.export import export_bound, export_topics
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export topics as NDJSON")
+    parser.add_argument(
+        "--db",
+        default=os.environ.get("TOPICS_DB", "data/data.db"),
+        help="Path to topics DB (empty: use --topics-dir)",
+    )
+    parser.add_argument("--topics-dir", default=os.environ.get("TOPICS_DIR", "topics"))
+    parser.add_argument(
+        "-o", "--output", default="-", help="output file (default: stdout)"
+    )
+    parser.add_argument(
+        "--gzip", action="store_true", help="gzip the output (implied by a .gz name)"
+    )
+    parser.add_argument("--since", help="only topics created at or after this time")
+    parser.add_argument("--until", help="only topics created before this time")
+    args = parser.parse_args()
+
+    try:
+        since = export_bound(args.since)
+        until = export_bound(args.until) or datetime.now(timezone.utc).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+    except ValueError:
+        parser.error("--since/--until must be ISO 8601 dates")
+    gz = args.gzip or args.output.endswith(".gz")
+
+    if args.db:
+        repo = SQLiteTopicRepository(db_path=args.db)
+    else:
+        repo = FileTopicRepository(args.topics_dir)
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    start = time.perf_counter()
+    written = 0
+    try:
+        for chunk in export_topics(repo, since=since, until=until, gzip=gz):
+            out.write(chunk)
+            written += len(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+        repo.close()
+    print(
+        f"wrote {written} bytes in {time.perf_counter() - start:.1f}s; "
+        f"next --since {until!r}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
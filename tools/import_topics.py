@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Import a `topics/` directory (FileTopicRepository format) into the topics DB.
+
+Every `.md` file becomes one topic: the first line is the title, the rest
+the body, the file name (without `.md`) the slug, and the timestamp prefix
+of the name (`20260109_153124_...`) the creation time. Topics are inserted
+oldest first with `create_topics_bulk` in large transactions.
+
+HTML is not rendered during the import unless `--render` is given; run
+tools/backfill_topic_html.py afterwards (the app also renders missing HTML
+on demand). Running the import twice imports the files twice.
+
+Usage:
+  PYTHONPATH=src python3 tools/import_topics.py [--topics-dir topics] [--db data/data.db] [--batch-size 10000] [--render]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from typing import Any, Dict, Iterator
+
+from app.repositories.topic_repo_file import FileTopicRepository
+from app.repositories.topic_repo_sqlite import SQLiteTopicRepository
+from app.utils.markdown import MarkdownRenderer
+
+
+def read_topics(source: FileTopicRepository) -> Iterator[Dict[str, Any]]:
+    # list_topics is newest first; import in creation order
+    for item in reversed(source.list_topics()):
+        t = source.get_topic(item["id"])
+        if not t["title"] or not t["body"]:
+            print(f"skipping {item['id']}: empty title or body")
+            continue
+        yield {
+            "title": t["title"],
+            "body": t["body"],
+            "slug": item["id"],
+            "created_at": item["created_at"],
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk import topic files")
+    parser.add_argument("--topics-dir", default=os.environ.get("TOPICS_DIR", "topics"))
+    parser.add_argument(
+        "--db",
+        default=os.environ.get("TOPICS_DB", "data/data.db"),
+        help="Path to topics DB",
+    )
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument(
+        "--render", action="store_true", help="render and store HTML while importing"
+    )
+    args = parser.parse_args()
+
+    source = FileTopicRepository(args.topics_dir)
+    repo = SQLiteTopicRepository(
+        db_path=args.db, renderer=MarkdownRenderer() if args.render else None
+    )
+    repo.ensure_schema()
+    start = time.perf_counter()
+    ids = repo.create_topics_bulk(
+        read_topics(source), batch_size=args.batch_size, render=args.render
+    )
+    elapsed = time.perf_counter() - start
+    rate = len(ids) / elapsed * 60 if elapsed else 0
+    print(f"imported {len(ids)} topics in {elapsed:.1f}s ({rate:.0f} topics/min)")
+    repo.close()
+    source.close()
+
+
+if __name__ == "__main__":
+    main()
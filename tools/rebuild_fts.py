@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Rebuild the full-text search index (`topics_fts`) of the topics DB.
+
+Runs the schema migration first, which recreates an index built with the
+old tokenizer, then rebuilds the index from the topics table and merges its
+segments. Safe to run at any time, e.g. after restoring a backup or if
+search results look out of date.
+
+Usage:
+  PYTHONPATH=src python3 tools/rebuild_fts.py [--db data/data.db]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+from app.repositories.topic_repo_sqlite import SQLiteTopicRepository
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild the topic search index")
+    parser.add_argument(
+        "--db",
+        default=os.environ.get("TOPICS_DB", "data/data.db"),
+        help="Path to topics DB",
+    )
+    args = parser.parse_args()
+
+    repo = SQLiteTopicRepository(db_path=args.db)
+    start = time.perf_counter()
+    repo.ensure_schema()
+    n = repo.rebuild_search_index()
+    print(f"indexed {n} topics in {time.perf_counter() - start:.1f}s")
+    repo.close()
+
+
+if __name__ == "__main__":
+    main()
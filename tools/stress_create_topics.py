@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Concurrency check: create topics with the same title from many threads.
+
+Every thread shares one SQLiteTopicRepository (and its connection pool) on a
+temporary database, like the app's request threads do. With `--processes`
+several processes hammer the same file as well. Afterwards every create
+must have succeeded, and slugs must be unique and gap-free (`t`, `t-1`,
+`t-2`, ...). Exits non-zero on failure.
+
+Usage:
+  PYTHONPATH=src python3 tools/stress_create_topics.py [--threads 32] [--per-thread 50] [--processes 1]
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from app.repositories.topic_repo_sqlite import SQLiteTopicRepository
+
+
+def hammer(db_path: str, threads: int, per_thread: int, title: str) -> int:
+    repo = SQLiteTopicRepository(db_path=db_path)
+    errors: list = []
+    barrier = threading.Barrier(threads)
+
+    def work() -> None:
+        barrier.wait()
+        for i in range(per_thread):
+            try:
+                repo.create_topic(title, f"body {i}")
+            except Exception as e:  # collected and reported below
+                errors.append(e)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    repo.close()
+    for e in errors[:5]:
+        print(f"create failed: {e!r}", file=sys.stderr)
+    return len(errors)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stress concurrent topic creates")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--per-thread", type=int, default=50)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--title", default="同じタイトル")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "stress.db")
+        repo = SQLiteTopicRepository(db_path=db_path)
+        repo.ensure_schema()
+        start = time.perf_counter()
+        if args.processes > 1:
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Pool(args.processes) as pool:
+                failures = sum(
+                    pool.starmap(
+                        hammer,
+                        [(db_path, args.threads, args.per_thread, args.title)]
+                        * args.processes,
+                    )
+                )
+        else:
+            failures = hammer(db_path, args.threads, args.per_thread, args.title)
+        elapsed = time.perf_counter() - start
+
+        expected = args.processes * args.threads * args.per_thread
+        with repo.pool.connection() as conn:
+            slugs = [row[0] for row in conn.execute("SELECT slug FROM topics")]
+        repo.close()
+
+    base = min(slugs, key=len) if slugs else ""
+    want = {base} | {f"{base}-{i}" for i in range(1, expected)}
+    ok = failures == 0 and len(slugs) == expected and set(slugs) == want
+    print(
+        f"{len(slugs)}/{expected} topics, {len(set(slugs))} distinct slugs, "
+        f"{failures} failed creates in {elapsed:.1f}s "
+        f"({expected / elapsed:.0f} creates/s): {'OK' if ok else 'FAIL'}"
+    )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()